@@ -2,6 +2,7 @@
 # Pipeline ML Airflow - Exercice : modèle historique + prévision à 6h
 
 from datetime import datetime, timedelta
+import json
 import pandas as pd
 import numpy as np
 import os
@@ -13,6 +14,7 @@ from sklearn.metrics import (accuracy_score, precision_score, recall_score, f1_s
 from xgboost import XGBClassifier
 import mlflow
 import mlflow.xgboost
+from mlflow.models import infer_signature
 
 from airflow import DAG
 from airflow.operators.python import PythonOperator
@@ -20,6 +22,15 @@ from airflow.models import Variable
 import boto3
 from airflow.exceptions import AirflowSkipException
 
+# Store partitionné (plugins/weather_store.py)
+from weather_store import DEFAULT_LOCATION, read_history, read_time_range, write_history
+# Features partagées avec le temps réel (plugins/weather_features.py)
+from weather_features import FEATURE_COLUMNS, history_features
+# Features persistées, calculées seulement pour les nouvelles lignes (plugins/feature_store.py)
+import feature_store
+# Tendance, moyennes/écarts-types glissants et lag (plugins/rolling_features.py)
+from rolling_features import MAX_WINDOW, ROLLING_COLUMNS, rolling_features
+
 
 # Configuration
 default_args = {
@@ -45,6 +56,27 @@ dag = DAG(
 DATA_PATH = '/opt/airflow/data'
 MODEL_PATH = '/opt/airflow/models'
 WEATHER_CSV_FILE = 'weather_paris.csv'
+WEATHER_PARQUET_FILE = 'weather_paris.parquet'
+
+# Colonnes lues pour l'entraînement (ni dew_point, ni timestamp : absents de l'API temps réel)
+HISTORY_COLUMNS = [
+    'datetime', 'temp', 'feels_like', 'pressure', 'humidity',
+    'clouds', 'visibility', 'wind_speed', 'wind_deg', 'rain_1h', 'weather_main'
+]
+
+# Ville du modèle (l'ETL peut ingérer plusieurs villes ; surchargeable via conf "location")
+TRAINING_LOCATION = DEFAULT_LOCATION
+
+# Horizons de prévision en heures (Variable FORECAST_HORIZONS, ex. "1,3,6,12,24", ou conf "horizons").
+# Un modèle par horizon, tous entraînés sur la même matrice de features.
+FORECAST_HORIZONS = [6]
+
+# Écart maximal entre t + h et l'observation retenue comme cible (Variable FORECAST_TARGET_TOLERANCE
+# ou conf "target_tolerance") : au-delà, la ligne n'a pas de cible pour cet horizon.
+TARGET_TOLERANCE = "30min"
+
+# Features des modèles de prévision : instantanées + glissantes
+FORECAST_FEATURE_COLUMNS = FEATURE_COLUMNS + ROLLING_COLUMNS
 
 
 def setup_environment():
@@ -71,7 +103,12 @@ def setup_environment():
 
 
 def download_weather_csv_from_s3(**context):
-    """Télécharger le fichier CSV depuis S3 et le placer dans DATA_PATH"""
+    """Télécharger le fichier CSV depuis S3 et le placer dans DATA_PATH.
+
+    Si la conf contient "partition_prefix", lit le store partitionné date/heure
+    sur la plage [start, end] (optionnelle) au lieu d'un CSV unique, et le
+    stocke localement en Parquet typé.
+    """
     print("⬇️ Téléchargement du fichier météo depuis S3...")
 
     setup_environment()
@@ -80,18 +117,30 @@ def download_weather_csv_from_s3(**context):
     # 🔹 Récupère la clé du DAG parent si transmise
     dag_conf = context.get('dag_run').conf if context.get('dag_run') else {}
     csv_key = dag_conf.get("csv_key", WEATHER_CSV_FILE)
+    partition_prefix = dag_conf.get("partition_prefix")
 
     # 🔹 Bucket S3
     bucket_name = Variable.get("BUCKET")
 
     # 🔹 Chemin local de destination
-    local_path = os.path.join(DATA_PATH, WEATHER_CSV_FILE)
+    local_file = WEATHER_PARQUET_FILE if partition_prefix or csv_key.endswith(".parquet") else WEATHER_CSV_FILE
+    local_path = os.path.join(DATA_PATH, local_file)
     os.makedirs(DATA_PATH, exist_ok=True)
 
     # 🔹 Téléchargement
     try:
-        s3.download_file(bucket_name, csv_key, local_path)
-        print(f"✅ Fichier téléchargé depuis s3://{bucket_name}/{csv_key}")
+        if partition_prefix:
+            df = read_time_range(
+                s3, bucket_name, partition_prefix,
+                start=dag_conf.get("start"), end=dag_conf.get("end"),
+                columns=HISTORY_COLUMNS,
+                location=training_location(dag_conf),
+            )
+            write_history(df, local_path)
+            print(f"✅ {len(df)} lignes lues depuis s3://{bucket_name}/{partition_prefix}/")
+        else:
+            s3.download_file(bucket_name, csv_key, local_path)
+            print(f"✅ Fichier téléchargé depuis s3://{bucket_name}/{csv_key}")
         print(f"   → Local: {local_path}")
     except Exception as e:
         raise RuntimeError(f"❌ Erreur lors du téléchargement S3 : {e}")
@@ -131,40 +180,49 @@ task_download_s3_csv = PythonOperator(
 )
 
 
+def training_location(dag_conf):
+    """Ville du run : conf "location", sinon TRAINING_LOCATION (même résolution pour toutes les tâches)"""
+    return dag_conf.get("location") or TRAINING_LOCATION
+
+
+def load_training_features(csv_path, dag_conf):
+    """Met à jour le feature store avec les lignes après son watermark, puis le lit.
+
+    Conf "rebuild_features": true → store de la location reconstruit depuis
+    tout l'historique (ex. après un backfill de lignes anciennes).
+    Renvoie datetime, les 17 features (float32) et weather_main, triés par datetime.
+    """
+    location = training_location(dag_conf)
+    if dag_conf.get("rebuild_features"):
+        feature_store.drop(location)
+    added = feature_store.update(csv_path, location=location)
+    df = feature_store.read_frame(location, start=dag_conf.get("start"), end=dag_conf.get("end"))
+    print(f"🧮 Feature store : {added} nouvelles lignes, {len(df)} lues")
+    return df
+
+
 # =============== TÂCHE 1 : Modèle historique (pas de décalage) ===============
 def prepare_data_historical(**context):
     """Préparer les données pour le modèle historique (classification instantanée)"""
     print("🔄 Préparation données - modèle historique...")
     
     csv_path = context["ti"].xcom_pull(task_ids="download_weather_csv_from_s3", key="local_weather_csv")
-    df = pd.read_csv(csv_path)
+    dag_conf = context.get('dag_run').conf if context.get('dag_run') else {}
+
+    # ✅ Features du store (17 colonnes float32), calculées seulement pour les nouvelles lignes
+    df = load_training_features(csv_path, dag_conf)
     if df.empty:
         raise ValueError("Données vides")
-        
-    # ✅ Supprimer les colonnes non disponibles dans l'API temps réel
-    cols_to_drop = ['dew_point', 'timestamp']
-    for col in cols_to_drop:
-        if col in df.columns:
-            df = df.drop(col, axis=1)
-            print(f"✓ Colonne '{col}' supprimée pour le modèle historique.")
 
+    # Observations sans label : pas de cible
+    df = df.dropna(subset=['weather_main'])
     df['weather_main'] = df['weather_main'].replace({'Drizzle': 'Rain', 'Mist': 'Fog'})
     min_samples = 2
     valid_classes = df['weather_main'].value_counts()
     valid_classes = valid_classes[valid_classes >= min_samples].index
     df = df[df['weather_main'].isin(valid_classes)]
     
-    df['datetime'] = pd.to_datetime(df['datetime'])
-    df['hour'] = df['datetime'].dt.hour
-    df['month'] = df['datetime'].dt.month
-    df['weekday'] = df['datetime'].dt.weekday
-    df['is_weekend'] = (df['weekday'] >= 5).astype(int)
-    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-    df['month_sin'] = np.sin(2 * np.pi * df['month'] / 12)
-    df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12)
-    
-    df = df.drop(['datetime', 'weather_description'], axis=1, errors='ignore')
+    df = df[FEATURE_COLUMNS + ['weather_main']]
     
     le = LabelEncoder()
     df['weather_main_encoded'] = le.fit_transform(df['weather_main'])
@@ -263,106 +321,149 @@ def train_historical_model(**context):
         # ✅ Logger le LabelEncoder comme artifact
         mlflow.log_artifact(f"{MODEL_PATH}/label_encoder_historical.pkl", "label_encoder_historical.pkl")
         
-        mlflow.xgboost.log_model(model, "model")
+        # ✅ Signature : le temps réel sélectionne les features d'après le schéma d'entrée du modèle
+        mlflow.xgboost.log_model(model, "model", signature=infer_signature(X_train, y_train_pred))
     
     print("✅ Modèle historique loggué avec métriques, CM et rapport complet")
 
 
-# =============== TÂCHE 2 : Modèle de prévision à 6h ===============
+# =============== TÂCHE 2 : Modèles de prévision multi-horizons ===============
+def parse_horizons(value=None):
+    """Horizons de prévision (heures) : liste, "1,3,6" ou JSON "[1, 3, 6]" ; défaut FORECAST_HORIZONS"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return list(FORECAST_HORIZONS)
+    if isinstance(value, str):
+        value = json.loads(value) if value.strip().startswith("[") else value.split(",")
+    horizons = sorted({int(h) for h in value})
+    if not horizons or horizons[0] <= 0:
+        raise ValueError(f"Horizons invalides : {value}")
+    return horizons
+
+
+def forecast_horizons(dag_conf):
+    """Horizons du run : conf "horizons", sinon Variable FORECAST_HORIZONS"""
+    return parse_horizons(dag_conf.get("horizons", Variable.get("FORECAST_HORIZONS", default_var="")))
+
+
+def horizon_targets(df, horizons, tolerance=TARGET_TOLERANCE, by=None):
+    """Cibles de tous les horizons par jointure as-of sur le temps : {h: weather_main à t + h}.
+
+    Pour chaque ligne, l'observation la plus proche de datetime + h (à
+    `tolerance` près, par location si `by` est donné) fournit la cible ;
+    None s'il n'y en a pas. Indépendant du pas d'échantillonnage et des trous
+    (contrairement à shift(-h), qui décale de h lignes). df doit être trié par
+    datetime ; O(n log n) et vectorisé (pd.merge_asof).
+    """
+    tolerance = pd.Timedelta(tolerance)
+    if horizons and tolerance >= pd.Timedelta(hours=min(horizons)):
+        raise ValueError(f"Tolérance {tolerance} trop large pour l'horizon {min(horizons)}h")
+    keys = [by] if by else []
+    right = pd.DataFrame({'target_time': df['datetime'].to_numpy(), 'target': df['weather_main'].to_numpy()})
+    for key in keys:
+        right[key] = df[key].to_numpy()
+    
+    targets = {}
+    for h in horizons:
+        left = pd.DataFrame({'target_time': df['datetime'].to_numpy() + np.timedelta64(h, 'h')})
+        for key in keys:
+            left[key] = df[key].to_numpy()
+        merged = pd.merge_asof(
+            left, right, on='target_time', by=by, direction='nearest', tolerance=tolerance,
+        )
+        target = merged['target'].to_numpy(dtype=object)
+        target[pd.isna(target)] = None
+        targets[h] = target
+    return targets
+
+
+def _target_column(horizon):
+    return f'weather_{horizon}h'
+
+
 def prepare_data_6h(**context):
-    """Préparer les données pour la prévision à 6h"""
-    print("🔄 Préparation données - prévision à 6h...")
+    """Préparer les données de prévision pour tous les horizons (une lecture, une matrice de features)"""
+    dag_conf = context.get('dag_run').conf if context.get('dag_run') else {}
+    horizons = forecast_horizons(dag_conf)
+    print(f"🔄 Préparation données - prévision à {', '.join(f'{h}h' for h in horizons)}...")
     csv_path = context["ti"].xcom_pull(task_ids="download_weather_csv_from_s3", key="local_weather_csv")
     if not csv_path or not os.path.exists(csv_path):
         raise FileNotFoundError(f"❌ Fichier CSV introuvable : {csv_path}")
     
-    df = pd.read_csv(csv_path)
+    # Features du store (17 colonnes float32), calculées seulement pour les nouvelles lignes
+    df = load_training_features(csv_path, dag_conf)
     if df.empty:
         raise ValueError("Données vides")
     
-    # Nettoyer les classes météo
+    # Nettoyer les classes météo (filtrage après le calcul des features glissantes ;
+    # les lignes sans label restent pour les fenêtres glissantes, puis sont écartées)
     df['weather_main'] = df['weather_main'].replace({'Drizzle': 'Rain', 'Mist': 'Fog'})
     min_samples = 2
     valid_classes = df['weather_main'].value_counts()
     valid_classes = valid_classes[valid_classes >= min_samples].index
-    df = df[df['weather_main'].isin(valid_classes)]
+    by = 'location' if 'location' in df.columns else None
     
-    # Convertir datetime
-    df['datetime'] = pd.to_datetime(df['datetime'])
+    # Trier par datetime (le store est déjà chronologique)
     df = df.sort_values('datetime').reset_index(drop=True)
     
-    # Créer la cible : weather_main dans 6 pas de temps
-    df['weather_6h'] = df['weather_main'].shift(-6)
-    df = df.dropna(subset=['weather_6h']).reset_index(drop=True)
-    
-    # --- Créer TOUTES les features nécessaires ---
-    
-    # 1. Features temporelles (SANS timestamp car absent de l'API OpenWeather)
-    df['hour'] = df['datetime'].dt.hour
-    df['month'] = df['datetime'].dt.month
-    df['weekday'] = df['datetime'].dt.dayofweek
-    df['weekday'] = df['weekday'].astype('int64')
-    df['is_weekend'] = (df['weekday'] >= 5).astype(int)
-    
-    # 2. Features trigonométriques
-    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-    df['month_sin'] = np.sin(2 * np.pi * df['month'] / 12)
-    df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12)
-    
-    # 3. Vérifier que rain_1h existe
-    if 'rain_1h' not in df.columns:
-        df['rain_1h'] = np.nan
-    
-    # ✅ Liste des features SANS dew_point NI timestamp (17 features)
-    feature_cols = [
-        'temp', 'feels_like', 'pressure', 'humidity',
-        'clouds', 'visibility', 'wind_speed', 'wind_deg', 'rain_1h',
-        'hour', 'month', 'weekday', 'is_weekend',
-        'hour_sin', 'hour_cos', 'month_sin', 'month_cos'
-    ]
-    
-    # Convertir toutes les features en numérique
-    for col in feature_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Vérifier que toutes les features sont présentes
-    missing_features = [col for col in feature_cols if col not in df.columns]
-    if missing_features:
-        raise ValueError(f"Colonnes manquantes dans les données : {missing_features}")
-    
-    # Encoder la cible
-    le = LabelEncoder()
-    df['weather_6h_encoded'] = le.fit_transform(df['weather_6h'])
-    
-    # Sauvegarder uniquement les colonnes nécessaires
-    save_cols = feature_cols + ['weather_6h', 'weather_6h_encoded']
-    df_final = df[save_cols].copy()
+    # ✅ 17 features instantanées (float32, SANS dew_point NI timestamp) + features glissantes,
+    # calculées sur l'historique complet avant filtrage des classes, partagées par tous les horizons
+    feature_cols = FORECAST_FEATURE_COLUMNS
+    df = pd.concat([df, rolling_features(df, by=by)], axis=1)
+    df = df[df['weather_main'].isin(valid_classes)].reset_index(drop=True)
+    df_final = df[feature_cols].copy()
     
+    # Créer les cibles : weather_main observé à t + h (jointure as-of), pour chaque horizon
+    tolerance = dag_conf.get("target_tolerance", Variable.get("FORECAST_TARGET_TOLERANCE", default_var=TARGET_TOLERANCE))
     os.makedirs(MODEL_PATH, exist_ok=True)
-    df_final.to_pickle(f"{MODEL_PATH}/data_6h.pkl")
-    with open(f"{MODEL_PATH}/label_encoder_6h.pkl", 'wb') as f:
-        pickle.dump(le, f)
-    
-    print(f"✓ Données 6h prêtes : {df_final.shape} | Features : {len(feature_cols)}")
+    for h, target in horizon_targets(df, horizons, tolerance=tolerance, by=by).items():
+        column = _target_column(h)
+        known = pd.notna(target)
+        le = LabelEncoder()
+        encoded = np.full(len(target), -1, dtype=np.int64)  # -1 : aucune observation à t + h
+        encoded[known] = le.fit_transform(target[known].astype(str))
+        df_final[column] = target
+        df_final[f'{column}_encoded'] = encoded
+        with open(f"{MODEL_PATH}/label_encoder_{h}h.pkl", 'wb') as f:
+            pickle.dump(le, f)
+        print(f"  → {h}h : {int(known.sum())} lignes | Classes : {list(le.classes_)}")
+    
+    df_final.to_pickle(f"{MODEL_PATH}/data_forecast.pkl")
+    context["ti"].xcom_push(key="forecast_horizons", value=horizons)
+    
+    print(f"✓ Données prévision prêtes : {df_final.shape} | Features : {len(feature_cols)}")
     print(f"  → Features : {feature_cols}")
-    print(f"  → Classes : {list(le.classes_)}")
+
+
+def _run_horizons(context):
+    """Horizons préparés par prepare_data_6h (repli : configuration du run)"""
+    horizons = context["ti"].xcom_pull(task_ids="prepare_data_6h", key="forecast_horizons")
+    if not horizons:
+        dag_conf = context.get('dag_run').conf if context.get('dag_run') else {}
+        horizons = forecast_horizons(dag_conf)
+    return [int(h) for h in horizons]
 
 
 def train_6h_model(**context):
-    """Entraîner le modèle de prévision à 6h"""
-    print("🧠 Entraînement modèle à 6h...")
-    
+    """Entraîner un modèle de prévision par horizon, sur la même matrice de features"""
     setup_environment()
     
-    df = pd.read_pickle(f"{MODEL_PATH}/data_6h.pkl")
-    with open(f"{MODEL_PATH}/label_encoder_6h.pkl", 'rb') as f:
+    df = pd.read_pickle(f"{MODEL_PATH}/data_forecast.pkl")
+    for h in _run_horizons(context):
+        _train_forecast_model(df, h)
+
+
+def _train_forecast_model(df, horizon):
+    """Entraîne et loggue le modèle d'un horizon (lignes sans cible exclues)"""
+    print(f"🧠 Entraînement modèle à {horizon}h...")
+    
+    column = _target_column(horizon)
+    with open(f"{MODEL_PATH}/label_encoder_{horizon}h.pkl", 'rb') as f:
         le = pickle.load(f)
     
-    feature_cols = [col for col in df.columns if col not in ['weather_6h', 'weather_6h_encoded']]
-    X = df[feature_cols]
-    y = df['weather_6h_encoded']
+    feature_cols = FORECAST_FEATURE_COLUMNS
+    rows = df[f'{column}_encoded'].to_numpy() >= 0
+    X = df.loc[rows, feature_cols]
+    y = df.loc[rows, f'{column}_encoded']
     
     print(f"📊 Features utilisées ({len(feature_cols)}) : {feature_cols}")
     
@@ -395,7 +496,7 @@ def train_6h_model(**context):
         'f1_test': f1_score(y_test, y_test_pred, average='weighted', zero_division=0),
     }
     
-    print("=== Modèle 6h ===")
+    print(f"=== Modèle {horizon}h ===")
     for name, value in metrics.items():
         print(f"{name}: {value:.4f}")
     
@@ -414,15 +515,15 @@ def train_6h_model(**context):
     print("\n=== Classification Report (test) ===")
     print(cr)
     
-    with open(f"{MODEL_PATH}/xgboost_model_6h.pkl", 'wb') as f:
+    with open(f"{MODEL_PATH}/xgboost_model_{horizon}h.pkl", 'wb') as f:
         pickle.dump(model, f)
     
     experiment = mlflow.get_experiment_by_name("Meteo")
-    with mlflow.start_run(experiment_id=experiment.experiment_id, run_name=f"Forecast_6h_{datetime.now().strftime('%Y%m%d')}"):
+    with mlflow.start_run(experiment_id=experiment.experiment_id, run_name=f"Forecast_{horizon}h_{datetime.now().strftime('%Y%m%d')}"):
         mlflow.log_params({
-            'model_type': 'forecast_6h',
-            'horizon': '6h',
-            'n_samples': len(df),
+            'model_type': f'forecast_{horizon}h',
+            'horizon': f'{horizon}h',
+            'n_samples': len(X),
             'n_features': len(feature_cols),
             'n_classes': len(le.classes_),
             'n_estimators': model.n_estimators,
@@ -436,79 +537,61 @@ def train_6h_model(**context):
         mlflow.log_text(cr, "classification_report_test.txt")
         
         # ✅ Logger le LabelEncoder comme artifact
-        mlflow.log_artifact(f"{MODEL_PATH}/label_encoder_6h.pkl", "label_encoder_6h.pkl")
+        mlflow.log_artifact(f"{MODEL_PATH}/label_encoder_{horizon}h.pkl", f"label_encoder_{horizon}h.pkl")
         
-        mlflow.xgboost.log_model(model, "model")
+        # ✅ Signature : le temps réel sélectionne les features d'après le schéma d'entrée du modèle
+        mlflow.xgboost.log_model(model, "model", signature=infer_signature(X_train, y_train_pred))
     
-    print("✅ Modèle 6h loggué avec métriques, CM et rapport complet")
+    print(f"✅ Modèle {horizon}h loggué avec métriques, CM et rapport complet")
 
 
 def generate_6h_forecast(**context):
-    """Générer une prévision à 6h basée sur les dernières données"""
-    print("🔮 Prévision à 6h...")
+    """Générer une prévision par horizon basée sur les dernières données"""
+    horizons = _run_horizons(context)
+    print(f"🔮 Prévision à {', '.join(f'{h}h' for h in horizons)}...")
     
-    df_raw = pd.read_csv(os.path.join(DATA_PATH, WEATHER_CSV_FILE))
-    df_raw['datetime'] = pd.to_datetime(df_raw['datetime'])
+    history_path = context["ti"].xcom_pull(task_ids="download_weather_csv_from_s3", key="local_weather_csv")
+    dag_conf = context.get('dag_run').conf if context.get('dag_run') else {}
+    # Même ville que l'entraînement du run
+    df_raw = read_history(
+        history_path or os.path.join(DATA_PATH, WEATHER_CSV_FILE), columns=HISTORY_COLUMNS,
+        location=training_location(dag_conf),
+    )
     latest = df_raw.iloc[-1]
     dt = pd.to_datetime(latest['datetime'])
     
-    # ✅ Liste des features SANS dew_point NI timestamp (17 features)
-    expected_features = [
-        'temp', 'feels_like', 'pressure', 'humidity',
-        'clouds', 'visibility', 'wind_speed', 'wind_deg', 'rain_1h',
-        'hour', 'month', 'weekday', 'is_weekend',
-        'hour_sin', 'hour_cos', 'month_sin', 'month_cos'
-    ]
-    
-    features = {}
-    
-    # Features météo (sans dew_point ni timestamp)
-    for col in ['temp', 'feels_like', 'pressure', 'humidity',
-                'clouds', 'visibility', 'wind_speed', 'wind_deg', 'rain_1h']:
-        features[col] = latest.get(col, np.nan)
-    
-    # Features temporelles
-    features['hour'] = dt.hour
-    features['month'] = dt.month
-    features['weekday'] = dt.dayofweek
-    features['is_weekend'] = 1 if dt.dayofweek >= 5 else 0
-    
-    # Features trigonométriques
-    features['hour_sin'] = np.sin(2 * np.pi * features['hour'] / 24)
-    features['hour_cos'] = np.cos(2 * np.pi * features['hour'] / 24)
-    features['month_sin'] = np.sin(2 * np.pi * features['month'] / 12)
-    features['month_cos'] = np.cos(2 * np.pi * features['month'] / 12)
-    
-    # Créer DataFrame
-    X_input = pd.DataFrame([{col: features[col] for col in expected_features}])
-    
-    # Forcer les types numériques
-    for col in expected_features:
-        if col in X_input.columns:
-            X_input[col] = pd.to_numeric(X_input[col], errors='coerce')
-    
-    # Charger modèle et prédire
-    with open(f"{MODEL_PATH}/xgboost_model_6h.pkl", 'rb') as f:
-        model = pickle.load(f)
-    with open(f"{MODEL_PATH}/label_encoder_6h.pkl", 'rb') as f:
-        le = pickle.load(f)
-    
-    pred_enc = model.predict(X_input)[0]
-    proba = model.predict_proba(X_input)[0]
-    weather_pred = le.inverse_transform([pred_enc])[0]
-    confidence = float(np.max(proba))
-    
-    # Sauvegarder
-    output = {
-        'prediction_time': datetime.utcnow().isoformat(),
-        'based_on_time': dt.isoformat(),
-        'predicted_weather': weather_pred,
-        'confidence': confidence,
-        'horizon': '6h'
-    }
+    # ✅ Mêmes features que l'entraînement, une fois pour tous les horizons :
+    # instantanées sur la dernière ligne, glissantes sur les 6 dernières heures seulement
+    recent = df_raw[df_raw['datetime'] > dt - pd.Timedelta(seconds=MAX_WINDOW)].reset_index(drop=True)
+    X_input = pd.concat(
+        [history_features(recent.tail(1)).reset_index(drop=True), rolling_features(recent).tail(1).reset_index(drop=True)],
+        axis=1,
+    )[FORECAST_FEATURE_COLUMNS]
+    
+    outputs = []
+    for h in horizons:
+        # Charger modèle et prédire
+        with open(f"{MODEL_PATH}/xgboost_model_{h}h.pkl", 'rb') as f:
+            model = pickle.load(f)
+        with open(f"{MODEL_PATH}/label_encoder_{h}h.pkl", 'rb') as f:
+            le = pickle.load(f)
+        
+        pred_enc = model.predict(X_input)[0]
+        proba = model.predict_proba(X_input)[0]
+        weather_pred = le.inverse_transform([pred_enc])[0]
+        confidence = float(np.max(proba))
+        
+        outputs.append({
+            'prediction_time': datetime.utcnow().isoformat(),
+            'based_on_time': dt.isoformat(),
+            'predicted_weather': weather_pred,
+            'confidence': confidence,
+            'horizon': f'{h}h'
+        })
+        print(f"✅ Prévision {h}h : {weather_pred} ({confidence:.1%})")
     
-    pd.DataFrame([output]).to_csv(os.path.join(DATA_PATH, 'weather_forecast_output.csv'), index=False)
-    print(f"✅ Prévision : {weather_pred} ({confidence:.1%})")
+    # Sauvegarder (une ligne par horizon)
+    pd.DataFrame(outputs).to_csv(os.path.join(DATA_PATH, 'weather_forecast_output.csv'), index=False)
 
 
 # =============== DÉFINITION DES TÂCHES ===============
@@ -4,7 +4,6 @@ import pandas as pd
 import numpy as np
 import os
 import json
-import requests
 
 from airflow import DAG
 from airflow.operators.python import PythonOperator
@@ -13,6 +12,15 @@ from airflow.models import Variable
 import mlflow
 import boto3
 
+# Client OpenWeather partagé (plugins/openweather_client.py)
+from openweather_client import LATENCY, get_current_weather
+from observation_cache import STATS as CACHE_STATS
+from api_quota import headroom
+# Features partagées avec l'entraînement (plugins/weather_features.py, plugins/rolling_features.py)
+from weather_features import FEATURE_COLUMNS, payload_features
+from rolling_features import ROLLING_COLUMNS, load_state, save_state
+from weather_store import DEFAULT_LOCATION
+
 # ----------------------------
 # Configuration DAG
 # ----------------------------
@@ -75,66 +83,49 @@ def setup_mlflow():
 
 def fetch_weather(lat, lon):
     api_key = Variable.get("OPEN_WEATHER_API_KEY")
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-    resp = requests.get(url)
-    if resp.status_code != 200:
-        raise ValueError(f"Erreur API : {resp.status_code} - {resp.text}")
-    return resp.json()
+    # Priorité haute sur le quota partagé de la clé (devant l'ingestion et les backfills)
+    return get_current_weather(lat, lon, api_key, priority="realtime")
 
-def preprocess_weather_json(raw_data, model_type='historical'):
+def preprocess_weather_json(raw_data, model_type='historical', rolling_state=None, locations=None):
     """
     Prétraite les données météo de l'API OpenWeather
     
     Args:
-        raw_data: JSON retourné par l'API OpenWeather
-        model_type: 'historical' ou 'forecast_6h' (même features pour les deux maintenant)
-    """
-    timestamp_dt = pd.to_datetime(raw_data["dt"], unit="s")
-    
-    # Features météo de base
-    features = {
-        "temp": raw_data["main"]["temp"],
-        "feels_like": raw_data["main"]["feels_like"],
-        "pressure": raw_data["main"]["pressure"],
-        "humidity": raw_data["main"]["humidity"],
-        "clouds": raw_data["clouds"]["all"],
-        "visibility": raw_data.get("visibility", None),
-        "wind_speed": raw_data["wind"]["speed"],
-        "wind_deg": raw_data["wind"]["deg"],
-        "rain_1h": raw_data.get("rain", {}).get("1h", 0.0)
-    }
-    
-    # Features temporelles
-    hour = timestamp_dt.hour
-    month = timestamp_dt.month
-    weekday = timestamp_dt.weekday()
-    
-    features["hour"] = hour
-    features["month"] = month
-    features["weekday"] = weekday
-    features["is_weekend"] = int(weekday in [5, 6])
+        raw_data: JSON retourné par l'API OpenWeather, ou liste de JSON (une ligne par réponse)
+        model_type: 'historical' ou 'forecast_6h' (même features pour les deux)
+        rolling_state: état glissant (rolling_features.RollingState) ; s'il est fourni,
+            il est mis à jour et les features glissantes sont ajoutées
+        locations: location de chaque réponse (clé de l'état glissant)
     
-    # Features cycliques
-    features["hour_sin"] = np.sin(2 * np.pi * hour / 24)
-    features["hour_cos"] = np.cos(2 * np.pi * hour / 24)
-    features["month_sin"] = np.sin(2 * np.pi * month / 12)
-    features["month_cos"] = np.cos(2 * np.pi * month / 12)
-    
-    # ✅ MÊME ordre de colonnes pour les deux modèles (17 features, SANS timestamp ni dew_point)
-    column_order = [
-        "temp", "feels_like", "pressure", "humidity", "clouds",
-        "visibility", "wind_speed", "wind_deg", "rain_1h",
-        "hour", "month", "weekday", "is_weekend",
-        "hour_sin", "hour_cos", "month_sin", "month_cos"
-    ]
-    
-    df = pd.DataFrame([features])[column_order]
+    ✅ Mêmes 17 features (float32, SANS timestamp ni dew_point) et même ordre
+    qu'à l'entraînement : construites par weather_features en une passe.
+    """
+    payloads = raw_data if isinstance(raw_data, list) else [raw_data]
+    df = payload_features(payloads)
+    if rolling_state is None:
+        return df
     
-    # Forcer les types numériques pour éviter les problèmes avec XGBoost
-    for col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+    # Features glissantes : O(1) par observation, sans relire l'historique
+    locations = locations or [p.get("location", DEFAULT_LOCATION) for p in payloads]
+    rolling = np.vstack([rolling_state.update_payload(loc, p) for loc, p in zip(locations, payloads)])
+    return pd.concat([df, pd.DataFrame(rolling, columns=ROLLING_COLUMNS)], axis=1)
+
+
+def select_model_inputs(model, df):
+    """Colonnes attendues par le modèle (schéma d'entrée MLflow), dans son ordre.
     
-    return df
+    Sans signature (modèles plus anciens), les 17 features instantanées.
+    """
+    try:
+        schema = model.metadata.get_input_schema()
+        names = schema.input_names() if schema is not None else None
+    except Exception:
+        names = None
+    names = list(names) if names else FEATURE_COLUMNS
+    missing = [c for c in names if c not in df.columns]
+    if missing:
+        raise ValueError(f"Features manquantes pour le modèle : {missing}")
+    return df[names]
 
 def upload_to_s3(local_file, s3_key):
     s3 = boto3.client('s3')
@@ -200,14 +191,21 @@ def predict_weather(model_uri, output_filename, model_type='historical'):
             
             label_encoder = FakeLabelEncoder()
 
-    results = []
+    # Un seul appel au modèle pour toutes les villes
+    raw_batch = []
     for city, info in CITIES.items():
         print(f"📍 Prédiction pour {info['name']}...")
-        raw_data = fetch_weather(info['lat'], info['lon'])
-        df = preprocess_weather_json(raw_data, model_type=model_type)
-        
-        pred_encoded = model.predict(df)[0]
-        
+        raw_batch.append(fetch_weather(info['lat'], info['lon']))
+    
+    # État glissant par ville, persisté entre deux runs
+    rolling_state = load_state()
+    df = preprocess_weather_json(raw_batch, model_type=model_type, rolling_state=rolling_state, locations=list(CITIES))
+    save_state(rolling_state)
+    
+    predictions = model.predict(select_model_inputs(model, df))
+    
+    results = []
+    for (city, info), pred_encoded in zip(CITIES.items(), predictions):
         # ✅ Décoder la prédiction
         if label_encoder is not None:
             try:
@@ -231,6 +229,9 @@ def predict_weather(model_uri, output_filename, model_type='historical'):
         
         print(f"  → {pred_weather} (code: {int(pred_encoded)})")
 
+    print(f"⏱️ OpenWeather : {LATENCY.summary()} | cache {CACHE_STATS['hits']} hits / {CACHE_STATS['misses']} misses")
+    print(f"📊 Quota OpenWeather : {headroom()}")
+
     df_out = pd.DataFrame(results)
     local_file = f"/tmp/{output_filename}"
     df_out.to_csv(local_file, index=False)
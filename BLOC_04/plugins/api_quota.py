@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Quota partagé de la clé OpenWeatherMap : token bucket inter-process.
+
+L'état du bucket (jetons restants, dernière recharge) vit dans un fichier
+SQLite local ; chaque prise de jeton est une transaction BEGIN IMMEDIATE,
+donc atomique entre toutes les tâches Airflow du worker. Le bucket se
+recharge au débit du plan (OPENWEATHER_QUOTA_PER_MINUTE) et contient au plus
+une minute de quota.
+
+Priorités : une priorité basse ne prend un jeton que s'il en reste au-delà
+de sa réserve ; le temps réel passe donc avant l'ingestion, elle-même avant
+les backfills.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+
+# Chemin de l'état (surchargeable : OPENWEATHER_QUOTA_PATH, "off" pour désactiver)
+DEFAULT_QUOTA_PATH = "/tmp/openweather_quota.sqlite"
+
+# Appels par minute autorisés par le plan OpenWeather (gratuit : 60)
+DEFAULT_PER_MINUTE = 60
+
+# Part du bucket laissée aux priorités supérieures
+PRIORITY_RESERVE = {
+    "realtime": 0.0,
+    "ingestion": 0.2,
+    "backfill": 0.5,
+}
+
+# Attente maximale d'un jeton avant d'abandonner (secondes)
+ACQUIRE_TIMEOUT = 120
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS bucket (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS usage (
+        priority TEXT PRIMARY KEY,
+        granted INTEGER NOT NULL,
+        waited_s REAL NOT NULL
+    )
+    """,
+)
+
+
+class QuotaTimeout(RuntimeError):
+    """Aucun jeton disponible dans le délai imparti"""
+
+
+def quota_path():
+    """Chemin de l'état du bucket, ou None si le limiteur est désactivé"""
+    path = os.environ.get("OPENWEATHER_QUOTA_PATH", DEFAULT_QUOTA_PATH)
+    return None if path.lower() in ("", "off", "none") else path
+
+
+def per_minute():
+    return float(os.environ.get("OPENWEATHER_QUOTA_PER_MINUTE", DEFAULT_PER_MINUTE))
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)  # Transactions explicites
+    conn.execute("PRAGMA journal_mode=WAL")
+    for ddl in _SCHEMA:
+        conn.execute(ddl)
+    return conn
+
+
+def _level(row, capacity, rate, now):
+    """Jetons disponibles après recharge depuis la dernière mise à jour"""
+    if row is None:
+        return capacity
+    tokens, updated_at = row
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def _try_take(conn, priority, tokens, capacity, rate, now):
+    """Prend les jetons si la réserve de la priorité est respectée.
+
+    Renvoie 0 si accordé, sinon le temps (s) avant que ce soit possible.
+    """
+    floor = PRIORITY_RESERVE[priority] * capacity
+    conn.execute("BEGIN IMMEDIATE")  # Verrou d'écriture : lecture + mise à jour atomiques
+    try:
+        level = _level(conn.execute("SELECT tokens, updated_at FROM bucket").fetchone(), capacity, rate, now)
+        granted = level - tokens >= floor
+        if granted:
+            level -= tokens
+        conn.execute("INSERT OR REPLACE INTO bucket (id, tokens, updated_at) VALUES (1, ?, ?)", (level, now))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return 0.0 if granted else (floor + tokens - level) / rate
+
+
+def _record(conn, priority, tokens, waited):
+    conn.execute(
+        "INSERT INTO usage VALUES (?, ?, ?) ON CONFLICT(priority) DO UPDATE"
+        " SET granted = granted + excluded.granted, waited_s = waited_s + excluded.waited_s",
+        (priority, tokens, waited),
+    )
+
+
+def acquire(priority="ingestion", tokens=1, timeout=ACQUIRE_TIMEOUT):
+    """Attend puis consomme `tokens` jetons ; renvoie le temps d'attente (s)"""
+    if priority not in PRIORITY_RESERVE:
+        raise ValueError(f"Priorité inconnue : {priority}")
+    path = quota_path()
+    if path is None:
+        return 0.0
+
+    capacity = per_minute()
+    rate = capacity / 60.0
+    start = time.time()
+    conn = _connect(path)
+    try:
+        while True:
+            now = time.time()
+            wait = _try_take(conn, priority, tokens, capacity, rate, now)
+            waited = now - start
+            if wait == 0.0:
+                _record(conn, priority, tokens, waited)
+                if waited >= 1:
+                    logging.info(f"⏳ Quota OpenWeather : {waited:.1f}s d'attente ({priority})")
+                return waited
+            if waited + wait > timeout:
+                raise QuotaTimeout(
+                    f"Quota OpenWeather épuisé : pas de jeton {priority} avant {timeout}s"
+                )
+            time.sleep(wait)
+    finally:
+        conn.close()
+
+
+def headroom():
+    """État du quota : jetons disponibles, capacité et consommation par priorité"""
+    path = quota_path()
+    capacity = per_minute()
+    if path is None:
+        return {"tokens": capacity, "capacity": capacity, "headroom_pct": 100.0, "granted": {}}
+
+    conn = _connect(path)
+    try:
+        row = conn.execute("SELECT tokens, updated_at FROM bucket").fetchone()
+        usage = conn.execute("SELECT priority, granted FROM usage").fetchall()
+    finally:
+        conn.close()
+    tokens = _level(row, capacity, capacity / 60.0, time.time())
+    return {
+        "tokens": round(tokens, 2),
+        "capacity": capacity,
+        "headroom_pct": round(100.0 * tokens / capacity, 1),
+        "granted": dict(usage),
+    }
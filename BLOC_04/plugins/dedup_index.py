@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Index de déduplication des observations déjà ingérées.
+
+Tableau trié de clés int64 (location, dt OpenWeatherMap), persisté en .npy
+à côté du dataset sur S3 : vérifier qu'une observation existe est une
+recherche dichotomique O(log n), sans télécharger ni parser l'historique.
+
+Clé = identifiant 31 bits de la location << 32 | epoch. La location par
+défaut a l'identifiant 0 : les index mono-ville (epochs seuls) restent valides.
+"""
+
+import io
+import logging
+import zlib
+
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from weather_store import DEFAULT_LOCATION
+
+# Codes S3 d'un objet absent (GetObject : NoSuchKey, HEAD / certains S3 compatibles : 404)
+MISSING_CODES = ("NoSuchKey", "404", "NotFound")
+
+
+def dedup_index_key(dataset_key):
+    """Clé S3 de l'index associé à un dataset (fichier ou préfixe)"""
+    return f"{dataset_key.rstrip('/')}.dedup.npy"
+
+
+def location_id(location):
+    """Identifiant stable 31 bits d'une location (0 pour la location par défaut)"""
+    if location is None or location == DEFAULT_LOCATION:
+        return 0
+    return zlib.crc32(str(location).encode("utf-8")) & 0x7FFFFFFF or 1
+
+
+def observation_keys(datetimes, locations=None):
+    """Clés int64 (location, epoch) d'une série d'observations"""
+    datetimes = pd.to_datetime(pd.Series(datetimes).reset_index(drop=True), format="ISO8601")
+    epochs = ((datetimes - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+    if locations is None:
+        return epochs
+    locations = pd.Series(locations).reset_index(drop=True).fillna(DEFAULT_LOCATION)
+    ids = locations.map({loc: location_id(loc) for loc in locations.unique()}).to_numpy(dtype=np.int64)
+    return (ids << 32) | epochs
+
+
+class DedupIndex:
+    """Ensemble trié de clés (location, epoch) déjà présentes dans le dataset"""
+
+    def __init__(self, epochs=()):
+        self.epochs = np.unique(np.asarray(epochs, dtype=np.int64))
+
+    @classmethod
+    def from_observations(cls, df):
+        """Construit l'index à partir d'un historique (bootstrap unique)"""
+        df = df.dropna(subset=["datetime"])
+        return cls(observation_keys(df["datetime"], df.get("location")))
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def __contains__(self, epoch):
+        i = np.searchsorted(self.epochs, epoch)
+        return bool(i < len(self.epochs) and self.epochs[i] == epoch)
+
+    def contains(self, epochs):
+        """Version vectorisée de `in` : masque booléen pour un tableau de clés"""
+        epochs = np.asarray(epochs, dtype=np.int64)
+        positions = np.searchsorted(self.epochs, epochs)
+        found = positions < len(self.epochs)
+        found[found] = self.epochs[positions[found]] == epochs[found]
+        return found
+
+    def add(self, epochs):
+        """Ajoute une ou plusieurs clés (l'index reste trié et unique)"""
+        self.epochs = np.union1d(self.epochs, np.atleast_1d(np.asarray(epochs, dtype=np.int64)))
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.save(buffer, self.epochs, allow_pickle=False)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(np.load(io.BytesIO(data), allow_pickle=False))
+
+    @classmethod
+    def load(cls, s3_client, bucket, key):
+        """Charge l'index depuis S3, ou None s'il n'existe pas encore.
+
+        Toute autre erreur (timeout, droits, index illisible) est remontée :
+        l'appelant repartirait d'un index vide et l'écraserait sur S3.
+        """
+        try:
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in MISSING_CODES:
+                raise
+            logging.info(f"Index de dédup absent (s3://{bucket}/{key}) : premier run")
+            return None
+        index = cls.from_bytes(body)
+        logging.info(f"Index de dédup chargé : {len(index)} observations connues")
+        return index
+
+    def save(self, s3_client, bucket, key):
+        """Persiste l'index sur S3 (un seul PUT, 8 octets par observation connue)"""
+        s3_client.put_object(Bucket=bucket, Key=key, Body=self.to_bytes())
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Store local des features d'entraînement, clé (location, datetime).
+
+Chaque location a son répertoire de fichiers Arrow IPC non compressés
+(part-<début>-<fin>.arrow) : un run ne calcule les features que pour les
+lignes postérieures au watermark (la fin du dernier fichier), les écrit
+dans un nouveau fichier, et l'entraînement lit l'ensemble par memory-map —
+le coût de préparation suit le delta du jour, pas la taille de l'historique.
+
+Au-delà de MAX_PARTS fichiers, ils sont fusionnés en un seul. Les lignes
+arrivées en retard (antérieures au watermark, ex. backfill) ne sont prises
+en compte qu'après reconstruction (drop) du store de la location.
+"""
+
+import fcntl
+import glob
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from weather_features import FEATURE_COLUMNS, RAW_FEATURES, history_features
+from weather_store import DEFAULT_LOCATION, read_history
+
+# Répertoire du store (volume persistant du worker, comme les modèles)
+FEATURE_STORE_PATH = "/opt/airflow/data/feature_store"
+
+# Colonnes lues dans l'historique
+SOURCE_COLUMNS = ["datetime"] + RAW_FEATURES + ["weather_main"]
+
+# Nombre de fichiers au-delà duquel une location est compactée
+MAX_PARTS = 30
+
+SCHEMA = pa.schema(
+    [("location", pa.string()), ("datetime", pa.timestamp("us"))]
+    + [(name, pa.float32()) for name in FEATURE_COLUMNS]
+    + [("weather_main", pa.string())]
+)
+
+_TS_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def location_path(location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH):
+    return os.path.join(root, location)
+
+
+def list_parts(location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH):
+    """Fichiers de la location, dans l'ordre chronologique"""
+    return sorted(glob.glob(os.path.join(location_path(location, root), "part-*.arrow")))
+
+
+def _part_end(path):
+    return pd.to_datetime(os.path.basename(path)[:-len(".arrow")].split("-")[2], format=_TS_FORMAT)
+
+
+@contextmanager
+def _locked(location, root, exclusive=True):
+    """Verrou fichier par location : les tâches de préparation parallèles se sérialisent"""
+    directory = location_path(location, root)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def watermark(location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH):
+    """Dernier datetime présent dans le store (None si vide)"""
+    parts = list_parts(location, root)
+    return max(_part_end(p) for p in parts) if parts else None
+
+
+def _write_table(table, path):
+    """Écriture atomique d'un fichier IPC (fichier temporaire puis rename)"""
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _part_path(location, root, table):
+    start = pd.Timestamp(pc.min(table["datetime"]).as_py())
+    end = pd.Timestamp(pc.max(table["datetime"]).as_py())
+    return os.path.join(location_path(location, root), f"part-{start:{_TS_FORMAT}}-{end:{_TS_FORMAT}}.arrow")
+
+
+def features_table(df, location=DEFAULT_LOCATION):
+    """Historique typé → table Arrow au schéma du store (features float32 + label brut, null si absent)"""
+    features = history_features(df)
+    columns = {
+        "location": pa.array([location] * len(df), pa.string()),
+        "datetime": pa.array(df["datetime"].to_numpy(dtype="datetime64[us]"), pa.timestamp("us")),
+    }
+    for name in FEATURE_COLUMNS:
+        columns[name] = pa.array(features[name].to_numpy(), pa.float32())
+    # Label absent → null (et non la chaîne "nan", que l'encodeur prendrait pour une classe)
+    columns["weather_main"] = pa.array(df["weather_main"], pa.string(), from_pandas=True)
+    return pa.table(columns, schema=SCHEMA)
+
+
+def append(df, location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH):
+    """Ajoute les lignes postérieures au watermark ; renvoie le nombre de lignes écrites"""
+    with _locked(location, root):
+        return _append(df, location, root)
+
+
+def _append(df, location, root):
+    last = watermark(location, root)
+    df = df.dropna(subset=["datetime"])
+    if last is not None:
+        df = df[df["datetime"] > last]
+    df = df.sort_values("datetime").drop_duplicates("datetime", keep="last").reset_index(drop=True)
+    if df.empty:
+        return 0
+    table = features_table(df, location)
+    _write_table(table, _part_path(location, root, table))
+    compact(location, root, lock=False)
+    return len(df)
+
+
+def update(source, location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH):
+    """Lit dans l'historique local les seules lignes après le watermark et les ajoute"""
+    with _locked(location, root):
+        last = watermark(location, root)
+        df = read_history(source, columns=SOURCE_COLUMNS, start=last, location=location)
+        added = _append(df, location, root)
+    logging.info(f"🧮 Feature store {location} : {added} lignes ajoutées (watermark précédent : {last})")
+    return added
+
+
+def compact(location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH, max_parts=MAX_PARTS, lock=True):
+    """Fusionne les fichiers d'une location en un seul au-delà de max_parts"""
+    if lock:
+        with _locked(location, root):
+            return compact(location, root, max_parts, lock=False)
+    parts = list_parts(location, root)
+    if len(parts) <= max_parts:
+        return False
+    table = _read_parts(parts).combine_chunks()
+    merged = _part_path(location, root, table)
+    _write_table(table, merged)
+    for path in parts:
+        if path != merged:
+            os.remove(path)
+    logging.info(f"🗜️ Feature store {location} : {len(parts)} fichiers fusionnés")
+    return True
+
+
+def drop(location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH):
+    """Supprime le store d'une location (reconstruction complète au prochain update)"""
+    shutil.rmtree(location_path(location, root), ignore_errors=True)
+
+
+def _read_parts(parts):
+    """Fichiers IPC lus par memory-map (sans copie des buffers)"""
+    tables = [pa.ipc.open_file(pa.memory_map(path, "r")).read_all() for path in parts]
+    return pa.concat_tables(tables) if tables else SCHEMA.empty_table()
+
+
+def read_table(location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH, start=None, end=None, columns=None):
+    """Vue Arrow (memory-mappée) du store, restreinte à la plage et aux colonnes demandées"""
+    with _locked(location, root, exclusive=False):
+        table = _read_parts(list_parts(location, root))
+    if start is not None:
+        table = table.filter(pc.greater_equal(table["datetime"], pa.scalar(pd.Timestamp(start), pa.timestamp("us"))))
+    if end is not None:
+        table = table.filter(pc.less_equal(table["datetime"], pa.scalar(pd.Timestamp(end), pa.timestamp("us"))))
+    return table.select(columns) if columns is not None else table
+
+
+def read_frame(location=DEFAULT_LOCATION, root=FEATURE_STORE_PATH, start=None, end=None, columns=None):
+    """Store en DataFrame pour l'entraînement (datetime, 17 features float32, weather_main)"""
+    columns = columns or ["datetime"] + FEATURE_COLUMNS + ["weather_main"]
+    return read_table(location, root, start, end, columns).to_pandas(split_blocks=True)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Dernier dt ingéré par location, pour court-circuiter les runs sans nouveauté.
+
+L'observation courante OpenWeather n'avance qu'environ toutes les 10 minutes
+alors que l'ETL tourne chaque minute : comparer le dt reçu au dernier dt
+ingéré (fichier SQLite local, une ligne par location) suffit à sauter tout
+le travail S3/Postgres en aval. État perdu = simple retour au contrôle par
+l'index de dédup.
+"""
+
+import os
+import sqlite3
+
+from weather_store import DEFAULT_LOCATION
+
+# Chemin de l'état (surchargeable : WEATHER_INGESTION_STATE_PATH, "off" pour désactiver)
+DEFAULT_STATE_PATH = "/tmp/weather_ingestion_state.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS last_ingested (
+    location TEXT PRIMARY KEY,
+    dt INTEGER NOT NULL
+)
+"""
+
+
+def state_path():
+    path = os.environ.get("WEATHER_INGESTION_STATE_PATH", DEFAULT_STATE_PATH)
+    return None if path.lower() in ("", "off", "none") else path
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(_SCHEMA)
+    return conn
+
+
+def last_ingested():
+    """{location: dernier dt ingéré}"""
+    path = state_path()
+    if path is None or not os.path.exists(path):
+        return {}
+    conn = _connect(path)
+    try:
+        return dict(conn.execute("SELECT location, dt FROM last_ingested").fetchall())
+    finally:
+        conn.close()
+
+
+def filter_new(payloads):
+    """Payloads OpenWeather dont le dt est postérieur au dernier dt ingéré"""
+    known = last_ingested()
+    return [
+        p for p in payloads
+        if int(p["dt"]) > known.get(p.get("location", DEFAULT_LOCATION), -1)
+    ]
+
+
+def mark_ingested(payloads):
+    """Avance le dernier dt des locations ingérées (jamais de retour en arrière)"""
+    path = state_path()
+    if path is None or not payloads:
+        return
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO last_ingested VALUES (?, ?) ON CONFLICT(location)"
+                " DO UPDATE SET dt = MAX(dt, excluded.dt)",
+                [(p.get("location", DEFAULT_LOCATION), int(p["dt"])) for p in payloads],
+            )
+    finally:
+        conn.close()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Mesures d'un chargement S3 → Postgres : durée par phase, lignes, octets.
+
+Les phases (download, parse, load, merge) sont cumulées : en mode
+multi-objets, elles additionnent le temps de tous les workers et peuvent
+dépasser la durée totale (mesurée à part). Le résumé part en XCom, dans une
+ligne de log JSON et, si STATSD_HOST est défini, vers un agent StatsD (UDP,
+sans attente de réponse : une métrique perdue ne bloque jamais le chargement).
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PHASES = ("download", "parse", "load", "merge")
+
+
+class LoadMetrics:
+    """Compteurs thread-safe d'un chargement"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.rows = 0
+        self.bytes = 0
+        self.objects = 0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] += elapsed
+
+    def add(self, rows=0, nbytes=0, objects=0):
+        with self._lock:
+            self.rows += rows
+            self.bytes += nbytes
+            self.objects += objects
+
+    def summary(self, **fields):
+        """Résumé sérialisable (XCom / log), champs additionnels inclus"""
+        seconds = max(time.perf_counter() - self._start, 1e-9)
+        with self._lock:
+            summary = {
+                "rows": self.rows,
+                "bytes": self.bytes,
+                "objects": self.objects,
+                "seconds": round(seconds, 3),
+                "rows_per_s": round(self.rows / seconds, 1),
+                "mb_per_s": round(self.bytes / seconds / 1e6, 3),
+                "phases": {name: round(self.phases.get(name, 0.0), 3) for name in PHASES},
+            }
+        summary.update(fields)
+        return summary
+
+
+class CountingReader:
+    """Flux en lecture qui compte les octets lus (corps S3 en streaming)"""
+
+    def __init__(self, raw, metrics):
+        self._raw = raw
+        self._metrics = metrics
+        self.closed = False
+
+    def read(self, size=-1):
+        data = self._raw.read(size) if size is not None and size >= 0 else self._raw.read()
+        self._metrics.add(nbytes=len(data))
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.closed = True
+        self._raw.close()
+
+    def __iter__(self):
+        return iter(self._raw)
+
+
+def log_summary(summary, logger=None):
+    """Ligne de log structurée (JSON, une clé par champ)"""
+    (logger or logging).info("load_metrics %s", json.dumps(summary, sort_keys=True))
+
+
+def statsd_lines(summary, prefix):
+    """Métriques au format StatsD : compteurs, jauges, timings (ms)"""
+    tags = f"{prefix}.{summary.get('table', 'unknown')}"
+    lines = [
+        f"{tags}.rows:{summary['rows']}|c",
+        f"{tags}.bytes:{summary['bytes']}|c",
+        f"{tags}.objects:{summary['objects']}|c",
+        f"{tags}.rows_per_s:{summary['rows_per_s']}|g",
+        f"{tags}.duration:{summary['seconds'] * 1000:.0f}|ms",
+    ]
+    lines += [
+        f"{tags}.phase.{name}:{seconds * 1000:.0f}|ms"
+        for name, seconds in summary["phases"].items()
+    ]
+    return lines
+
+
+def send_statsd(summary, prefix="weather.s3_to_postgres", host=None, port=None):
+    """Envoie le résumé à l'agent StatsD (STATSD_HOST / STATSD_PORT) ; False si désactivé ou en échec"""
+    host = host or os.environ.get("STATSD_HOST")
+    if not host:
+        return False
+    port = int(port or os.environ.get("STATSD_PORT", 8125))
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto("\n".join(statsd_lines(summary, prefix)).encode("utf-8"), (host, port))
+        return True
+    except Exception as e:
+        logging.warning(f"⚠️ StatsD indisponible ({host}:{port}) : {e}")
+        return False
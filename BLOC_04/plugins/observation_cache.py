@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Cache partagé des observations OpenWeatherMap, clé (lat, lon, units).
+
+OpenWeather ne rafraîchit l'observation courante qu'environ toutes les
+10 minutes : une réponse reste valable jusqu'à dt + UPDATE_INTERVAL (au moins
+MIN_TTL après sa récupération). Le cache est un fichier SQLite local, partagé
+par toutes les tâches (process) du worker ; un verrou fichier par location
+garantit un seul appel API par fenêtre, même si plusieurs tâches la
+demandent en même temps.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import ExitStack, contextmanager
+
+# Chemin du cache (surchargeable : OPENWEATHER_CACHE_PATH, "off" pour désactiver)
+DEFAULT_CACHE_PATH = "/tmp/openweather_cache.sqlite"
+
+# Intervalle de mise à jour des observations OpenWeather (secondes)
+UPDATE_INTERVAL = 600
+
+# Durée de vie minimale d'une entrée (observation déjà ancienne à la récupération)
+MIN_TTL = 60
+
+# Compteurs du process (journalisés avec les latences)
+STATS = {"hits": 0, "misses": 0}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    units TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (lat, lon, units)
+)
+"""
+
+
+def cache_path():
+    """Chemin du fichier cache, ou None si le cache est désactivé"""
+    path = os.environ.get("OPENWEATHER_CACHE_PATH", DEFAULT_CACHE_PATH)
+    return None if path.lower() in ("", "off", "none") else path
+
+
+def _key(lat, lon, units):
+    return round(float(lat), 4), round(float(lon), 4), units
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")  # Lecteurs non bloqués par l'écrivain
+    conn.execute(_SCHEMA)
+    return conn
+
+
+@contextmanager
+def _location_lock(path, key):
+    """Verrou exclusif inter-process sur une location (single-flight)"""
+    lock_dir = f"{path}.locks"
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_file = os.path.join(lock_dir, "{}_{}_{}.lock".format(*key))
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Libère aussi le verrou
+
+
+def expires_at(payload, fetched_at):
+    """Fin de validité : prochaine mise à jour OpenWeather, au moins MIN_TTL"""
+    dt = payload.get("dt", fetched_at)
+    return max(dt + UPDATE_INTERVAL, fetched_at + MIN_TTL)
+
+
+def lookup(lat, lon, units="metric", now=None):
+    """Observation en cache encore valide, ou None"""
+    path = cache_path()
+    if path is None or not os.path.exists(path):
+        return None
+    now = time.time() if now is None else now
+    conn = _connect(path)
+    try:
+        row = conn.execute(
+            "SELECT payload FROM observations"
+            " WHERE lat = ? AND lon = ? AND units = ? AND expires_at > ?",
+            (*_key(lat, lon, units), now),
+        ).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def store(lat, lon, units, payload, now=None):
+    """Enregistre une observation fraîchement récupérée"""
+    path = cache_path()
+    if path is None:
+        return
+    now = time.time() if now is None else now
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?)",
+                (*_key(lat, lon, units), json.dumps(payload), now, expires_at(payload, now)),
+            )
+    finally:
+        conn.close()
+
+
+def _quietly(operation, *args):
+    """Opération de cache ; None si le cache est inutilisable (disque, fichier corrompu)"""
+    try:
+        return operation(*args)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"⚠️ Cache OpenWeather indisponible : {e}")
+        return None
+
+
+def get_or_fetch(lat, lon, units, fetch):
+    """Renvoie l'observation en cache, sinon appelle fetch() une seule fois pour tous.
+
+    Les erreurs de fetch ne sont pas mises en cache. Un cache inutilisable
+    ne bloque jamais l'appel API.
+    """
+    path = cache_path()
+    if path is None:
+        return fetch()
+
+    cached = _quietly(lookup, lat, lon, units)
+    if cached is None:
+        with ExitStack() as stack:
+            try:
+                stack.enter_context(_location_lock(path, _key(lat, lon, units)))
+            except OSError as e:  # Sans verrou : au pire un appel en double
+                logging.warning(f"⚠️ Verrou cache OpenWeather indisponible : {e}")
+            # Un autre process a pu remplir le cache pendant l'attente du verrou
+            cached = _quietly(lookup, lat, lon, units)
+            if cached is None:
+                STATS["misses"] += 1
+                payload = fetch()
+                _quietly(store, lat, lon, units, payload)
+                return payload
+    STATS["hits"] += 1
+    return cached
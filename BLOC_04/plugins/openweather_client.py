@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Client HTTP partagé pour l'API OpenWeatherMap.
+
+Une session requests par process (pool de connexions keep-alive : une seule
+poignée de main TLS pour toutes les villes d'une tâche), des timeouts de
+connexion et de lecture, des retries à backoff exponentiel borné sur les
+429/5xx, et un histogramme des latences par appel.
+
+Les retries sur statut sont faits ici et non par l'adaptateur urllib3 :
+chaque tentative reprend un jeton du quota, et un 429 respecte l'en-tête
+Retry-After. L'adaptateur ne rejoue que les échecs de connexion, qui
+n'atteignent pas l'API.
+
+Les observations passent par le cache partagé (observation_cache) : une
+location n'est appelée qu'une fois par fenêtre de mise à jour OpenWeather,
+quel que soit le nombre de tâches qui la lisent. Chaque appel réseau prend
+d'abord un jeton du quota partagé de la clé API (api_quota), selon la
+priorité de l'appelant : "realtime", "ingestion" ou "backfill".
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import api_quota
+import observation_cache
+
+
+BASE_URL = "https://api.openweathermap.org/data/2.5"
+
+# Timeouts (secondes) : (connexion, lecture)
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+# Retries : 0.5s, 1s, 2s... plafonné à BACKOFF_MAX
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+BACKOFF_MAX = 8
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Retry-After plus long : abandon (l'appelant retentera au prochain run)
+RETRY_AFTER_MAX = 60
+
+# Connexions gardées ouvertes (≥ nombre de threads de fetch)
+POOL_SIZE = 16
+
+# Bornes supérieures des buckets de l'histogramme (millisecondes)
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Histogramme thread-safe des latences d'appel (buckets fixes en ms)"""
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets_ms) + 1)  # Dernier bucket : au-delà
+            self.total_ms = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            self.counts[bisect_left(self.buckets_ms, ms)] += 1
+            self.total_ms += ms
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Borne supérieure du bucket contenant le quantile q (inf au-delà du dernier)"""
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets_ms + (float("inf"),), self.counts):
+            seen += n
+            if n and seen >= target:
+                return bound
+        return 0.0
+
+    def snapshot(self):
+        """Comptes par bucket, ex. {"<=50ms": 3, ..., ">10000ms": 0}"""
+        labels = [f"<={b}ms" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return dict(zip(labels, self.counts))
+
+    def summary(self):
+        if not self.count:
+            return "aucun appel"
+        return (
+            f"{self.count} appels | moy {self.total_ms / self.count:.0f}ms"
+            f" | p50 ≤{self.quantile(0.5)}ms | p95 ≤{self.quantile(0.95)}ms"
+        )
+
+
+# Latences de tous les appels du process
+LATENCY = LatencyHistogram()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _retry_policy():
+    """Échecs de connexion seulement (requête jamais reçue) ; statuts rejoués par get_current_weather"""
+    kwargs = dict(
+        total=MAX_RETRIES,
+        read=0,
+        status=0,
+        backoff_factor=BACKOFF_FACTOR,
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,  # Réponse renvoyée telle quelle
+    )
+    try:
+        return Retry(backoff_max=BACKOFF_MAX, **kwargs)
+    except TypeError:  # urllib3 < 2 : plafond fixe (Retry.DEFAULT_BACKOFF_MAX)
+        return Retry(**kwargs)
+
+
+def build_session():
+    """Session requests avec pool keep-alive et politique de retry"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=_retry_policy()
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """Session partagée du process (créée au premier appel)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def retry_delay(resp, attempt):
+    """Attente avant la tentative suivante : Retry-After s'il est donné, sinon backoff exponentiel"""
+    header = resp.headers.get("Retry-After")
+    if header:
+        try:
+            return max(float(header), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(header).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    return min(BACKOFF_FACTOR * (2 ** attempt), BACKOFF_MAX)
+
+
+def get_current_weather(lat, lon, api_key, units="metric", timeout=TIMEOUT, use_cache=True,
+                        priority="ingestion"):
+    """Observation courante OpenWeatherMap (JSON) pour une coordonnée"""
+    if use_cache:
+        return observation_cache.get_or_fetch(
+            lat, lon, units,
+            lambda: get_current_weather(lat, lon, api_key, units, timeout, use_cache=False, priority=priority),
+        )
+    for attempt in range(MAX_RETRIES + 1):
+        # Un jeton du quota par requête envoyée, retries compris
+        api_quota.acquire(priority)
+        start = time.perf_counter()
+        try:
+            resp = get_session().get(
+                f"{BASE_URL}/weather",
+                params={"lat": lat, "lon": lon, "appid": api_key, "units": units},
+                timeout=timeout,
+            )
+        finally:
+            LATENCY.observe(time.perf_counter() - start)
+        if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            break
+        delay = retry_delay(resp, attempt)
+        if delay > RETRY_AFTER_MAX:
+            logging.warning(f"⚠️ OpenWeather {resp.status_code} : Retry-After {delay:.0f}s, abandon")
+            break
+        logging.warning(f"🔁 OpenWeather {resp.status_code} : nouvel essai dans {delay:.1f}s")
+        time.sleep(delay)
+    if resp.status_code != 200:
+        raise ValueError(f"Erreur API : {resp.status_code} - {resp.text}")
+    return resp.json()
+
+
+def log_latency():
+    """Journalise l'histogramme des latences du process"""
+    stats = observation_cache.STATS
+    logging.info(
+        f"⏱️ OpenWeather : {LATENCY.summary()} | {LATENCY.snapshot()}"
+        f" | cache {stats['hits']} hits / {stats['misses']} misses"
+        f" | quota {api_quota.headroom()}"
+    )
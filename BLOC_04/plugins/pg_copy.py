@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Chargement en masse Postgres par COPY ... FROM STDIN.
+
+COPY envoie tout le fichier dans un seul flux au lieu d'un INSERT par ligne
+(ou par lot) : c'est le chemin le plus rapide pour charger un CSV. Le format
+binaire (PGCOPY) évite en plus le parsing texte côté serveur, mais chaque
+valeur doit être encodée dans le type exact de la colonne cible : les types
+sont lus dans information_schema avant l'envoi.
+
+Upsert : COPY dans une table temporaire, puis un seul INSERT ... SELECT
+... ON CONFLICT vers la cible — la déduplication reste dans la base.
+"""
+
+import io
+import struct
+from decimal import Decimal
+
+import pandas as pd
+
+# En-tête d'un flux COPY binaire : signature, flags, longueur d'extension
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+# Origine des dates/timestamps Postgres
+_PG_EPOCH = pd.Timestamp("2000-01-01")
+
+_NUMERIC_NEG = 0x4000
+_NUMERIC_NAN = 0xC000
+
+
+def copy_sql(table, columns, copy_format="csv", header=False):
+    """Commande COPY ... FROM STDIN pour les colonnes données"""
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    if copy_format == "binary":
+        options = "FORMAT binary"
+    else:
+        options = f"FORMAT csv, HEADER {'true' if header else 'false'}"
+    return f"COPY {table} ({column_list}) FROM STDIN WITH ({options})"
+
+
+def staging_sql(table, staging):
+    """Table temporaire de même structure que la cible, supprimée au commit"""
+    return f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+
+
+def upsert_sql(table, staging, columns, conflict_columns, action="nothing"):
+    """INSERT ... SELECT ensembliste de la table de staging vers la cible.
+
+    action="nothing" ignore les lignes déjà présentes ; "update" réécrit les
+    colonnes hors clé (une seule ligne par clé est gardée dans le lot, un
+    DO UPDATE ne pouvant toucher deux fois la même ligne).
+    """
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    conflict_list = ", ".join(f'"{c}"' for c in conflict_columns)
+    updates = [c for c in columns if c not in conflict_columns]
+    if action == "update" and updates:
+        select = f"SELECT DISTINCT ON ({conflict_list}) {column_list} FROM {staging}"
+        conflict = "DO UPDATE SET " + ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in updates)
+    else:
+        select = f"SELECT {column_list} FROM {staging}"
+        conflict = "DO NOTHING"
+    return f"INSERT INTO {table} ({column_list}) {select} ON CONFLICT ({conflict_list}) {conflict}"
+
+
+def column_types(cursor, table):
+    """{colonne: data_type} de la table cible (information_schema)"""
+    schema, _, name = table.rpartition(".")
+    query = "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s"
+    params = [name]
+    if schema:
+        query += " AND table_schema = %s"
+        params.append(schema)
+    cursor.execute(query, params)
+    return dict(cursor.fetchall())
+
+
+def encode_numeric(value):
+    """Valeur → représentation binaire du type numeric (chiffres en base 10000)"""
+    d = Decimal(str(value))
+    if d.is_nan():
+        return struct.pack(">hhHH", 0, 0, _NUMERIC_NAN, 0)
+    dscale = max(0, -d.as_tuple().exponent)
+    int_part, _, frac_part = format(abs(d), "f").partition(".")
+    int_part = int_part.lstrip("0")
+    int_part = int_part.zfill(-(-len(int_part) // 4) * 4)
+    frac_part = frac_part.ljust(-(-len(frac_part) // 4) * 4, "0")
+
+    digits = [int(int_part[i:i + 4]) for i in range(0, len(int_part), 4)]
+    weight = len(digits) - 1
+    digits += [int(frac_part[i:i + 4]) for i in range(0, len(frac_part), 4)]
+    while digits and digits[0] == 0:
+        digits.pop(0)
+        weight -= 1
+    while digits and digits[-1] == 0:
+        digits.pop()
+    if not digits:
+        weight = 0
+
+    sign = _NUMERIC_NEG if d < 0 else 0
+    return struct.pack(f">hhHH{len(digits)}H", len(digits), weight, sign, dscale, *digits)
+
+
+def _encode_timestamp(value):
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return struct.pack(">q", (ts - _PG_EPOCH) // pd.Timedelta(microseconds=1))
+
+
+def _encode_date(value):
+    return struct.pack(">i", (pd.Timestamp(value).normalize() - _PG_EPOCH).days)
+
+
+def _encode_text(value):
+    return str(value).encode("utf-8")
+
+
+_ENCODERS = {
+    "numeric": encode_numeric,
+    "double precision": lambda v: struct.pack(">d", float(v)),
+    "real": lambda v: struct.pack(">f", float(v)),
+    "smallint": lambda v: struct.pack(">h", int(v)),
+    "integer": lambda v: struct.pack(">i", int(v)),
+    "bigint": lambda v: struct.pack(">q", int(v)),
+    "boolean": lambda v: struct.pack(">?", bool(v)),
+    "timestamp without time zone": _encode_timestamp,
+    "timestamp with time zone": _encode_timestamp,
+    "date": _encode_date,
+    "text": _encode_text,
+    "character varying": _encode_text,
+    "character": _encode_text,
+}
+
+
+def binary_copy_buffer(df, types):
+    """DataFrame → flux COPY binaire (types : {colonne: data_type Postgres})"""
+    encoders = []
+    for column in df.columns:
+        data_type = types.get(column)
+        if data_type not in _ENCODERS:
+            raise ValueError(f"COPY binaire : type non supporté pour {column} ({data_type}), utiliser le format csv")
+        encoders.append(_ENCODERS[data_type])
+
+    buf = io.BytesIO()
+    buf.write(PGCOPY_HEADER)
+    field_count = struct.pack(">h", len(encoders))
+    null = struct.pack(">i", -1)
+    for row in df.itertuples(index=False, name=None):
+        buf.write(field_count)
+        for encode, value in zip(encoders, row):
+            if pd.isna(value):
+                buf.write(null)
+                continue
+            data = encode(value)
+            buf.write(struct.pack(">i", len(data)))
+            buf.write(data)
+    buf.write(PGCOPY_TRAILER)
+    buf.seek(0)
+    return buf
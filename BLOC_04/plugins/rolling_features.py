@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Features glissantes des modèles de prévision : tendance de pression, moyennes
+et écarts-types glissants d'humidité et de vent (1h, 3h, 6h), weather_main
+observé une heure plus tôt.
+
+Deux implémentations, mêmes définitions (fenêtres temporelles ]t - w, t],
+observation courante incluse, par location) :
+
+- rolling_features : reconstruction vectorisée d'un historique trié, pour
+  l'entraînement (rolling pandas en temps, searchsorted pour tendance et lag) ;
+- RollingState : état par location mis à jour en O(1) amorti par nouvelle
+  observation (une deque et des sommes courantes par fenêtre), persisté entre
+  deux runs du temps réel au lieu de relire l'historique.
+"""
+
+import logging
+import math
+import os
+import pickle
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Fenêtres glissantes (secondes)
+WINDOWS = {"1h": 3600, "3h": 3 * 3600, "6h": 6 * 3600}
+
+# Mesures moyennées / dispersées sur chaque fenêtre
+ROLLING_MEASURES = ["humidity", "wind_speed"]
+
+# Tendance de pression : pression courante - plus ancienne de la fenêtre
+TENDENCY_WINDOW = "3h"
+
+# weather_main retardé : dernière observation d'au moins LAG secondes (dans la plus grande fenêtre)
+LAG = 3600
+MAX_WINDOW = max(WINDOWS.values())
+
+# Codes fixes des classes météo (mêmes regroupements que l'entraînement)
+WEATHER_CODES = {"Clear": 0, "Clouds": 1, "Fog": 2, "Rain": 3, "Snow": 4}
+_WEATHER_ALIASES = {"Drizzle": "Rain", "Mist": "Fog", "Haze": "Fog"}
+
+ROLLING_COLUMNS = (
+    [f"pressure_tendency_{TENDENCY_WINDOW}"]
+    + [f"{m}_{stat}_{w}" for m in ROLLING_MEASURES for w in WINDOWS for stat in ("mean", "std")]
+    + ["weather_main_lag_1h"]
+)
+
+# État persisté du temps réel (surchargeable : WEATHER_ROLLING_STATE_PATH) — volume du worker
+DEFAULT_ROLLING_STATE_PATH = "/opt/airflow/data/rolling_state.pkl"
+
+
+def weather_code(label):
+    """Classe météo → code (NaN si inconnue ou absente)"""
+    if label is None or (isinstance(label, float) and math.isnan(label)):
+        return np.nan
+    label = str(label)
+    return float(WEATHER_CODES.get(_WEATHER_ALIASES.get(label, label), np.nan))
+
+
+def _group_features(times, pressure, measures, codes):
+    """Features glissantes d'une location (tableaux triés par temps)"""
+    n = len(times)
+    out = np.full((n, len(ROLLING_COLUMNS)), np.nan, dtype=np.float64)
+    index = pd.DatetimeIndex(times)
+
+    start = np.searchsorted(times, times - np.timedelta64(WINDOWS[TENDENCY_WINDOW], "s"), side="right")
+    out[:, 0] = pressure - pressure[start]
+
+    col = 1
+    for name in ROLLING_MEASURES:
+        series = pd.Series(measures[name], index=index)
+        for seconds in WINDOWS.values():
+            window = series.rolling(pd.Timedelta(seconds=seconds), closed="right")
+            out[:, col] = window.mean().to_numpy()
+            out[:, col + 1] = window.std().to_numpy()
+            col += 2
+
+    lag = np.searchsorted(times, times - np.timedelta64(LAG, "s"), side="right") - 1
+    valid = lag >= 0
+    valid[valid] &= times[lag[valid]] > times[valid] - np.timedelta64(MAX_WINDOW, "s")
+    out[valid, col] = codes[lag[valid]]
+    return out
+
+
+def rolling_features(df, by=None):
+    """Reconstruction vectorisée pour l'entraînement : DataFrame float32 (ROLLING_COLUMNS), même index.
+
+    df : datetime, pressure, humidity, wind_speed, weather_main, trié par
+    datetime (par location si `by`).
+    """
+    out = np.full((len(df), len(ROLLING_COLUMNS)), np.nan, dtype=np.float64)
+    groups = [np.arange(len(df))] if by is None else df.groupby(by, sort=False).indices.values()
+    times_all = df["datetime"].to_numpy(dtype="datetime64[ns]")
+    pressure_all = df["pressure"].to_numpy(dtype=np.float64)
+    measures_all = {m: df[m].to_numpy(dtype=np.float64) for m in ROLLING_MEASURES}
+    codes_all = np.array([weather_code(v) for v in df["weather_main"].astype(object)], dtype=np.float64)
+    for rows in groups:
+        out[rows] = _group_features(
+            times_all[rows], pressure_all[rows], {m: v[rows] for m, v in measures_all.items()}, codes_all[rows],
+        )
+    return pd.DataFrame(out.astype(np.float32), columns=ROLLING_COLUMNS, index=df.index)
+
+
+class _Window:
+    """Fenêtre temporelle avec somme / somme des carrés courantes (valeurs NaN ignorées)"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.values = deque()
+        self.total = 0.0
+        self.squares = 0.0
+
+    def push(self, ts, value):
+        if not math.isnan(value):
+            self.values.append((ts, value))
+            self.total += value
+            self.squares += value * value
+        while self.values and self.values[0][0] <= ts - self.seconds:
+            _, old = self.values.popleft()
+            self.total -= old
+            self.squares -= old * old
+        if not self.values:
+            self.total = self.squares = 0.0
+
+    def mean(self):
+        return self.total / len(self.values) if self.values else np.nan
+
+    def std(self):
+        n = len(self.values)
+        if n < 2:
+            return np.nan
+        return math.sqrt(max(self.squares - self.total * self.total / n, 0.0) / (n - 1))
+
+
+class _LocationState:
+    def __init__(self):
+        self.last_ts = None
+        self.last_features = None
+        self.pressure = deque()
+        self.windows = {m: [_Window(s) for s in WINDOWS.values()] for m in ROLLING_MEASURES}
+        self.recent = deque()  # (ts, code) de moins de LAG secondes
+        self.lagged = None  # Dernière observation d'au moins LAG secondes
+
+    def update(self, ts, pressure, measures, code):
+        horizon = WINDOWS[TENDENCY_WINDOW]
+        self.pressure.append((ts, pressure))
+        while self.pressure[0][0] <= ts - horizon:
+            self.pressure.popleft()
+        features = [pressure - self.pressure[0][1]]
+
+        for name in ROLLING_MEASURES:
+            for window in self.windows[name]:
+                window.push(ts, measures[name])
+                features += [window.mean(), window.std()]
+
+        while self.recent and self.recent[0][0] <= ts - LAG:
+            self.lagged = self.recent.popleft()
+        lag_ok = self.lagged is not None and self.lagged[0] > ts - MAX_WINDOW
+        features.append(self.lagged[1] if lag_ok else np.nan)
+        self.recent.append((ts, code))
+
+        self.last_ts = ts
+        self.last_features = np.array(features, dtype=np.float32)
+        return self.last_features
+
+
+class RollingState:
+    """État glissant par location, mis à jour observation par observation"""
+
+    def __init__(self):
+        self.locations = {}
+
+    def update(self, location, dt, pressure, humidity, wind_speed, weather_main):
+        """Ajoute une observation (dt en secondes epoch) ; renvoie ses features (ROLLING_COLUMNS, float32).
+
+        Une observation déjà vue (dt <= dernier dt de la location) ne modifie
+        pas l'état : les features de la dernière observation sont renvoyées.
+        """
+        state = self.locations.setdefault(location, _LocationState())
+        ts = int(dt)
+        if state.last_ts is not None and ts <= state.last_ts:
+            return state.last_features
+        return state.update(
+            ts,
+            np.nan if pressure is None else float(pressure),
+            {
+                "humidity": np.nan if humidity is None else float(humidity),
+                "wind_speed": np.nan if wind_speed is None else float(wind_speed),
+            },
+            weather_code(weather_main),
+        )
+
+    def update_payload(self, location, payload):
+        """Met à jour depuis une réponse OpenWeatherMap"""
+        return self.update(
+            location,
+            payload["dt"],
+            payload["main"].get("pressure"),
+            payload["main"].get("humidity"),
+            payload.get("wind", {}).get("speed"),
+            (payload.get("weather") or [{}])[0].get("main"),
+        )
+
+
+def state_path():
+    return os.environ.get("WEATHER_ROLLING_STATE_PATH", DEFAULT_ROLLING_STATE_PATH)
+
+
+def load_state(path=None):
+    """État persisté (vide s'il n'existe pas ou est illisible)"""
+    path = path or state_path()
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        return state if isinstance(state, RollingState) else RollingState()
+    except FileNotFoundError:
+        return RollingState()
+    except Exception as e:
+        logging.warning(f"⚠️ État glissant illisible ({path}), réinitialisé : {e}")
+        return RollingState()
+
+
+def save_state(state, path=None):
+    """Écriture atomique de l'état (fichier temporaire puis rename)"""
+    path = path or state_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, path)
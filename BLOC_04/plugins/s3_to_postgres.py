@@ -1,16 +1,168 @@
-from typing import Sequence
+import fnmatch
+import io
+import itertools
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Optional, Sequence
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 from airflow.models import BaseOperator
 from airflow.providers.postgres.hooks.postgres import PostgresHook
 from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+from sqlalchemy import inspect, text
+
+from load_metrics import CountingReader, LoadMetrics, log_summary, send_statsd
+from pg_copy import binary_copy_buffer, column_types, copy_sql, staging_sql, upsert_sql
+
+# Journal des objets déjà chargés (mode multi-objets)
+LOAD_LOG_DDL = """
+CREATE TABLE IF NOT EXISTS {log_table} (
+    table_name VARCHAR NOT NULL,
+    s3_key VARCHAR NOT NULL,
+    etag VARCHAR NOT NULL,
+    row_count INTEGER NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, s3_key, etag)
+)
+"""
+
+# Extensions chargées quand `key` est un préfixe
+LOADABLE_SUFFIXES = (".csv", ".parquet")
+
+# Types SQL (DDL) → types Arrow utilisés au parsing
+ARROW_TYPES = {
+    "numeric": pa.float64(),
+    "decimal": pa.float64(),
+    "double precision": pa.float64(),
+    "float": pa.float64(),
+    "real": pa.float32(),
+    "smallint": pa.int64(),
+    "integer": pa.int64(),
+    "int": pa.int64(),
+    "bigint": pa.int64(),
+    "boolean": pa.bool_(),
+    "timestamp": pa.timestamp("us"),
+    "timestamp without time zone": pa.timestamp("us"),
+    "date": pa.date32(),
+    "varchar": pa.string(),
+    "character varying": pa.string(),
+    "text": pa.string(),
+}
+
+# Taille moyenne d'une ligne CSV, pour traduire chunksize (lignes) en blocs Arrow (octets)
+AVG_ROW_BYTES = 128
+
+
+def arrow_type(sql_type):
+    """'DECIMAL(5, 2)' → pa.float64(), 'VARCHAR' → pa.string(), ..."""
+    base = re.sub(r"\(.*\)", "", str(sql_type)).strip().lower()
+    if base not in ARROW_TYPES:
+        raise ValueError(f"Type de colonne non supporté : {sql_type}")
+    return ARROW_TYPES[base]
+
+
+class Watermarks:
+    """High-water marks d'une table, lus à la demande et gardés en cache pour le run.
+
+    Une requête indexée par partition rencontrée (WHERE partition = ...
+    ORDER BY watermark DESC LIMIT 1, servie par l'index de la contrainte
+    unique (location, datetime)) au lieu d'un GROUP BY sur tout l'historique.
+    Le watermark d'une partition est lu avant le chargement de ses premières
+    lignes : les objets suivants du même run sont filtrés par rapport à
+    l'état de la table en début de run.
+    """
+
+    def __init__(self, engine, table, watermark_column, partition_column=None):
+        self.engine = engine
+        self.table = table
+        self.watermark_column = watermark_column
+        self.partition_column = partition_column
+        self._cache = {}
+
+    def get(self, partition=None):
+        """Watermark d'une partition (global si partition=None), None si aucune ligne"""
+        if partition not in self._cache:
+            self._cache[partition] = self._query(partition)
+        return self._cache[partition]
+
+    def bounds(self, partitions):
+        """Watermark de chaque ligne d'après sa partition (NaT si partition inconnue)"""
+        # astype(object) : colonne catégorielle (Parquet dictionary-encoded) → valeurs brutes
+        partitions = partitions.astype(object)
+        lookup = {p: self.get(p) for p in partitions.dropna().unique()}
+        return pd.to_datetime(partitions.map(lookup))
+
+    def _query(self, partition):
+        column = self.watermark_column
+        where, params = f"{column} IS NOT NULL", {}
+        if partition is not None and self.partition_column:
+            where += f" AND {self.partition_column} = :partition"
+            params["partition"] = partition
+        query = text(f"SELECT {column} FROM {self.table} WHERE {where} ORDER BY {column} DESC LIMIT 1")
+        with self.engine.connect() as conn:
+            value = conn.execute(query, params).scalar()
+        return None if value is None else pd.Timestamp(value)
 
 
 class S3ToPostgresOperator(BaseOperator):
 
     """
     Custom operator to transfer a file from S3 to a Postgres table.
-    Assumes the file is CSV (no header) and loads it using pandas.
+    Assumes the file is CSV (no header by default) and loads it using pandas.
+
+    load_mode="incremental" : lit le high-water mark de la table
+    (dernier watermark_column, par partition_column si fourni) et n'insère que
+    les lignes plus récentes, en append : le coût d'un run suit le volume
+    de données nouvelles, plus la taille de l'historique. Nécessite un
+    fichier avec en-tête (header=0).
+
+    loader="copy" : chargement par COPY ... FROM STDIN sur la connexion brute
+    du PostgresHook au lieu de DataFrame.to_sql (INSERT paramétrés). En mode
+    full, un CSV est envoyé tel quel depuis le fichier ; copy_format="binary"
+    encode les lignes au format PGCOPY. Le débit (lignes/s) est loggé pour
+    comparer les deux chemins.
+
+    chunksize=N : mode streaming. Le corps de l'objet S3 est lu en flux et
+    parsé par blocs de N lignes, chaque bloc étant chargé avant de lire le
+    suivant : la mémoire reste bornée quelle que soit la taille de l'objet,
+    sans copie dans /tmp (sauf Parquet, lu par batches depuis un fichier
+    local supprimé après le chargement).
+
+    on_conflict="nothing" | "update" : upsert. Les lignes sont copiées (COPY,
+    quel que soit `loader`) dans une table temporaire de même structure, puis
+    fusionnées dans la cible par un seul INSERT ... SELECT ... ON CONFLICT
+    (conflict_columns) DO NOTHING / DO UPDATE. La table cible doit exister
+    avec une contrainte unique sur conflict_columns ; if_exists est ignoré.
+    post_merge_sql : requête exécutée après chaque fusion, dans la même
+    transaction, tant que la table de staging existe (ex. inscrire les
+    tranches touchées dans une file de ré-agrégation).
+
+    key="prefixe/" ou glob ("observations/date=2024-01-*/*.csv") : mode
+    multi-objets. Les objets sont listés, téléchargés et parsés en parallèle
+    (max_workers threads), puis chargés sur un petit pool de connexions
+    (db_connections), un objet par transaction. Chaque objet chargé est
+    inscrit dans load_log_table (clé + ETag) dans la même transaction : un
+    retry ne recharge que les objets manquants ou modifiés. Les objets
+    s'ajoutent toujours à la table (if_exists et chunksize ignorés).
+    key=[clé, ...] (liste rendue depuis un XCom, ex. les partitions horaires
+    d'un lot) : mêmes chargements sur ces seuls objets ; une liste d'une
+    clé est chargée comme une clé simple.
+
+    column_types={"datetime": "TIMESTAMP", "temp": "DECIMAL(5, 2)", ...} :
+    les CSV sont parsés par le lecteur CSV Arrow multithreadé avec ce schéma
+    (types du DDL, sans inférence). Avec header=None, les noms de colonnes
+    sont ceux du mapping, dans l'ordre ; avec header=0, ceux de l'en-tête.
+
+    Chaque chargement mesure la durée des phases (download, parse, load,
+    merge), les lignes et les octets lus : résumé poussé en XCom
+    (load_metrics), loggé en JSON et envoyé à StatsD si STATSD_HOST est défini.
     """
 
     template_fields: Sequence[str] = ("bucket", "key", "table")
@@ -23,29 +175,454 @@ class S3ToPostgresOperator(BaseOperator):
         postgres_conn_id: str = "neon_db_conn",
         aws_conn_id: str = "aws_default",
         if_exists: str = "replace",  # <-- ajout param pour contrôler le mode
+        load_mode: str = "full",  # "full" (if_exists) ou "incremental" (watermark)
+        header: Optional[int] = None,
+        watermark_column: str = "datetime",
+        partition_column: Optional[str] = None,
+        loader: str = "insert",  # "insert" (to_sql) ou "copy" (COPY FROM STDIN)
+        copy_format: str = "csv",  # "csv" ou "binary" (loader="copy")
+        chunksize: Optional[int] = None,  # Lignes par bloc en mode streaming
+        on_conflict: Optional[str] = None,  # None, "nothing" ou "update" (upsert via staging)
+        conflict_columns: Sequence[str] = ("datetime",),
+        max_workers: int = 8,  # Téléchargements / parsings parallèles (multi-objets)
+        db_connections: int = 4,  # Connexions Postgres parallèles (multi-objets)
+        load_log_table: str = "s3_load_log",
+        column_types: Optional[dict] = None,  # {colonne: type SQL}, parsing typé via Arrow
+        statsd_prefix: str = "weather.s3_to_postgres",
+        post_merge_sql: Optional[str] = None,  # Après la fusion, même transaction (upsert seulement)
         **kwargs,
     ) -> None:
         super().__init__(**kwargs)
+        if load_mode not in ("full", "incremental"):
+            raise ValueError(f"load_mode inconnu : {load_mode}")
+        if load_mode == "incremental" and header is None:
+            raise ValueError("load_mode='incremental' nécessite un fichier avec en-tête (header=0)")
+        if loader not in ("insert", "copy"):
+            raise ValueError(f"loader inconnu : {loader}")
+        if copy_format not in ("csv", "binary"):
+            raise ValueError(f"copy_format inconnu : {copy_format}")
+        if on_conflict not in (None, "nothing", "update"):
+            raise ValueError(f"on_conflict inconnu : {on_conflict}")
+        if post_merge_sql and not on_conflict:
+            raise ValueError("post_merge_sql nécessite on_conflict (table de staging)")
         self.bucket = bucket
         self.key = key
         self.table = table
         self.postgres_conn_id = postgres_conn_id
         self.aws_conn_id = aws_conn_id
         self.if_exists = if_exists
+        self.load_mode = load_mode
+        self.header = header
+        self.watermark_column = watermark_column
+        self.partition_column = partition_column
+        self.loader = loader
+        self.copy_format = copy_format
+        self.chunksize = int(chunksize) if chunksize else None
+        self.on_conflict = on_conflict
+        self.conflict_columns = list(conflict_columns)
+        self.max_workers = int(max_workers)
+        self.db_connections = int(db_connections)
+        self.load_log_table = load_log_table
+        self.column_types = dict(column_types) if column_types else None
+        if self.column_types:
+            self._arrow_types = {column: arrow_type(t) for column, t in self.column_types.items()}
+        self.statsd_prefix = statsd_prefix
+        self.post_merge_sql = post_merge_sql
+        self._metrics = LoadMetrics()
 
     def execute(self, context):
-        # Télécharger le fichier depuis S3
         s3_hook = S3Hook(aws_conn_id=self.aws_conn_id)
-        returned_filename = s3_hook.download_file(
-            key=self.key, bucket_name=self.bucket, local_path="/tmp"
-        )
-
-        # Charger en DataFrame
-        df_file = pd.read_csv(returned_filename, header=None)
 
         # Connexion Postgres
         postgres_hook = PostgresHook(postgres_conn_id=self.postgres_conn_id)
         engine = postgres_hook.get_sqlalchemy_engine()
 
-        # Charger les données en base
-        df_file.to_sql(self.table, engine, if_exists=self.if_exists, index=False)
+        self._metrics = LoadMetrics()
+        if isinstance(self.key, (list, tuple)) and len(self.key) == 1:
+            self.key = self.key[0]
+        if self._is_multi_key():
+            rows = self._load_objects(s3_hook, postgres_hook, engine)
+        else:
+            if self.chunksize:
+                rows = self._load_stream(s3_hook, postgres_hook, engine)
+            else:
+                # Télécharger le fichier depuis S3
+                returned_filename = self._download(s3_hook, self.key)
+                try:
+                    rows = self._load_file(returned_filename, postgres_hook, engine)
+                finally:
+                    os.remove(returned_filename)
+            self._metrics.add(objects=1)
+        self._metrics.add(rows=rows)
+
+        metrics = self._metrics.summary(
+            table=self.table, key=str(self.key), loader=self.loader, load_mode=self.load_mode,
+            streaming=bool(self.chunksize),
+        )
+        self.log.info(
+            f"📊 {rows} lignes chargées dans {self.table} en {metrics['seconds']:.2f}s "
+            f"({metrics['rows_per_s']:.0f} lignes/s, loader={self.loader})"
+        )
+        log_summary(metrics, self.log)
+        send_statsd(metrics, prefix=self.statsd_prefix)
+        if context.get("ti"):
+            context["ti"].xcom_push(key="load_metrics", value=metrics)
+        return rows
+
+    def _download(self, s3_hook, key):
+        """Télécharge un objet dans /tmp (phase download, octets comptés)"""
+        with self._metrics.phase("download"):
+            filename = s3_hook.download_file(key=key, bucket_name=self.bucket, local_path="/tmp")
+        self._metrics.add(nbytes=os.path.getsize(filename))
+        return filename
+
+    def _load_file(self, filename, postgres_hook, engine):
+        """Chargement du fichier téléchargé en un bloc ; renvoie le nombre de lignes"""
+        if self.load_mode != "incremental" and self.loader == "copy" and self.copy_format == "csv" \
+                and self._is_csv_file():
+            return self._copy_file(filename, postgres_hook, engine)
+
+        with self._metrics.phase("parse"):
+            df_file = self._read(filename)
+        if_exists = self.if_exists
+        if self.load_mode == "incremental":
+            df_new = self._rows_after_watermark(df_file, self._watermarks(engine))
+            self.log.info(f"Incrémental : {len(df_new)} nouvelles lignes sur {len(df_file)} dans le fichier")
+            df_file, if_exists = df_new, "append"
+        with self._raw_cursor(postgres_hook) as cursor:
+            rows = self._load_dataframe(df_file, engine, if_exists, cursor)
+            return self._merge(cursor, df_file.columns, rows)
+
+    def _load_stream(self, s3_hook, postgres_hook, engine):
+        """Chargement bloc par bloc depuis le flux S3 (une transaction pour les COPY)"""
+        incremental = self.load_mode == "incremental"
+        watermarks = self._watermarks(engine) if incremental else None
+        if_exists = "append" if incremental else self.if_exists
+        rows = total = 0
+        columns = None
+        chunks = self._iter_chunks(s3_hook)
+        with self._raw_cursor(postgres_hook) as cursor:
+            for i in itertools.count():
+                # Lecture du flux + parsing du bloc suivant
+                with self._metrics.phase("parse"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                total += len(chunk)
+                columns = chunk.columns
+                if incremental:
+                    chunk = self._rows_after_watermark(chunk, watermarks)
+                # Le premier bloc crée / remplace la table, les suivants s'ajoutent
+                rows += self._load_dataframe(chunk, engine, if_exists if i == 0 else "append", cursor)
+            if columns is not None:
+                rows = self._merge(cursor, columns, rows)
+        self.log.info(f"Streaming : {rows} lignes chargées sur {total} lues (blocs de {self.chunksize})")
+        return rows
+
+    def _iter_chunks(self, s3_hook):
+        """Blocs de `chunksize` lignes de l'objet S3"""
+        if str(self.key).endswith(".parquet"):
+            # Parquet : métadonnées en fin de fichier, lecture par batches depuis une copie locale
+            filename = self._download(s3_hook, self.key)
+            try:
+                for batch in pq.ParquetFile(filename).iter_batches(batch_size=self.chunksize):
+                    yield batch.to_pandas()
+            finally:
+                os.remove(filename)
+            return
+
+        body = CountingReader(s3_hook.get_key(self.key, bucket_name=self.bucket).get()["Body"], self._metrics)
+        try:
+            if self.column_types:
+                reader = pa_csv.open_csv(
+                    pa.PythonFile(body, mode="r"),
+                    **self._arrow_csv_options(block_size=max(1 << 20, self.chunksize * AVG_ROW_BYTES)),
+                )
+                for batch in reader:
+                    yield batch.to_pandas()
+            else:
+                yield from pd.read_csv(body, header=self.header, chunksize=self.chunksize)
+        finally:
+            body.close()
+
+    def _is_multi_key(self):
+        if isinstance(self.key, (list, tuple)):
+            return True
+        return str(self.key).endswith("/") or any(c in str(self.key) for c in "*?[")
+
+    def _list_objects(self, s3_hook):
+        """[(clé, ETag)] des objets désignés par la liste, le préfixe ou le glob `key`"""
+        if isinstance(self.key, (list, tuple)):
+            s3_client = s3_hook.get_conn()
+            return sorted(
+                (name, s3_client.head_object(Bucket=self.bucket, Key=name)["ETag"].strip('"'))
+                for name in set(self.key)
+            )
+        key = str(self.key)
+        is_glob = any(c in key for c in "*?[")
+        prefix = key[:min(key.index(c) for c in "*?[" if c in key)] if is_glob else key
+        paginator = s3_hook.get_conn().get_paginator("list_objects_v2")
+        objects = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                name = obj["Key"]
+                if is_glob and not fnmatch.fnmatchcase(name, key):
+                    continue
+                if not is_glob and not name.endswith(LOADABLE_SUFFIXES):
+                    continue
+                objects.append((name, obj["ETag"].strip('"')))
+        return sorted(objects)
+
+    def _loaded_objects(self, engine):
+        """{(clé, ETag)} déjà chargés dans la table cible"""
+        with engine.begin() as connection:
+            connection.execute(text(LOAD_LOG_DDL.format(log_table=self.load_log_table)))
+            result = connection.execute(
+                text(f"SELECT s3_key, etag FROM {self.load_log_table} WHERE table_name = :table"),
+                {"table": self.table},
+            )
+            return {tuple(row) for row in result}
+
+    def _download_and_parse(self, s3_hook, key):
+        filename = self._download(s3_hook, key)
+        try:
+            with self._metrics.phase("parse"):
+                return self._read(filename, key)
+        finally:
+            os.remove(filename)
+
+    def _load_objects(self, s3_hook, postgres_hook, engine):
+        """Mode multi-objets : parsing parallèle, chargement sur un pool de connexions"""
+        objects = self._list_objects(s3_hook)
+        done = self._loaded_objects(engine)
+        todo = [obj for obj in objects if obj not in done]
+        self.log.info(
+            f"📦 {len(objects)} objets sous s3://{self.bucket}/{self.key} : "
+            f"{len(objects) - len(todo)} déjà chargés, {len(todo)} à charger"
+        )
+        if not todo:
+            return 0
+
+        watermarks = self._watermarks(engine) if self.load_mode == "incremental" else None
+        raw = self.loader == "copy" or self.on_conflict
+        connections = queue.Queue()
+        for _ in range(min(self.db_connections, len(todo)) if raw else 0):
+            connections.put(postgres_hook.get_conn())
+        # Objets parsés en attente de chargement : mémoire bornée
+        in_flight = threading.BoundedSemaphore(self.max_workers + self.db_connections)
+        table_ready = self.on_conflict is not None
+        rows, failed = 0, []
+
+        def parse(key):
+            in_flight.acquire()
+            try:
+                return self._download_and_parse(s3_hook, key)
+            except Exception:
+                in_flight.release()
+                raise
+
+        def load(key, etag, df):
+            try:
+                loaded = self._load_object(key, etag, df, engine, connections)
+                self._metrics.add(objects=1)
+                return loaded
+            finally:
+                in_flight.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as parse_pool, \
+                    ThreadPoolExecutor(max_workers=self.db_connections) as load_pool:
+                parsed = {parse_pool.submit(parse, key): (key, etag) for key, etag in todo}
+                loads = {}
+                for future in as_completed(parsed):
+                    key, etag = parsed[future]
+                    try:
+                        df = future.result()
+                    except Exception as e:
+                        self.log.error(f"❌ {key} : {e}")
+                        failed.append(key)
+                        continue
+                    if watermarks is not None:
+                        df = self._rows_after_watermark(df, watermarks)
+                    if not table_ready:
+                        # Création éventuelle de la table avant les chargements concurrents
+                        df.head(0).to_sql(self.table, engine, if_exists="append", index=False)
+                        table_ready = True
+                    loads[load_pool.submit(load, key, etag, df)] = key
+                for future in as_completed(loads):
+                    try:
+                        rows += future.result()
+                    except Exception as e:
+                        self.log.error(f"❌ {loads[future]} : {e}")
+                        failed.append(loads[future])
+        finally:
+            while not connections.empty():
+                connections.get().close()
+
+        self.log.info(f"✅ {len(todo) - len(failed)}/{len(todo)} objets chargés ({rows} lignes)")
+        if failed:
+            raise RuntimeError(f"{len(failed)} objets non chargés (rejoués au prochain essai) : {sorted(failed)[:5]}")
+        return rows
+
+    def _load_object(self, key, etag, df, engine, connections):
+        """Charge un objet et l'inscrit au journal dans la même transaction"""
+        log_values = {"table": self.table, "key": key, "etag": etag, "rows": len(df)}
+        if self.loader == "insert" and not self.on_conflict:
+            with self._metrics.phase("load"), engine.begin() as connection:
+                if not df.empty:
+                    df.to_sql(self.table, connection, if_exists="append", index=False, method="multi", chunksize=1000)
+                connection.execute(text(
+                    f"INSERT INTO {self.load_log_table} (table_name, s3_key, etag, row_count)"
+                    " VALUES (:table, :key, :etag, :rows)"
+                ), log_values)
+            return len(df)
+
+        conn = connections.get()
+        try:
+            with conn.cursor() as cursor:
+                if self.on_conflict:
+                    cursor.execute(staging_sql(self.table, self._staging_table))
+                with self._metrics.phase("load"):
+                    copied = self._copy_frame(cursor, df)
+                rows = self._merge(cursor, df.columns, copied)
+                cursor.execute(
+                    f"INSERT INTO {self.load_log_table} (table_name, s3_key, etag, row_count)"
+                    " VALUES (%(table)s, %(key)s, %(etag)s, %(rows)s)",
+                    log_values,
+                )
+            conn.commit()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            connections.put(conn)
+
+    def _is_csv_file(self):
+        return not str(self.key).endswith(".parquet") and self.header in (0, None)
+
+    def _read(self, filename, key=None):
+        """Fichier téléchargé → DataFrame"""
+        if str(key or self.key).endswith(".parquet"):
+            return pd.read_parquet(filename)
+        if self.column_types:
+            return pa_csv.read_csv(filename, **self._arrow_csv_options()).to_pandas()
+        return pd.read_csv(filename, header=self.header)
+
+    def _arrow_csv_options(self, block_size=None):
+        """Options du lecteur CSV Arrow : schéma imposé par column_types, parsing multithreadé"""
+        read_options = pa_csv.ReadOptions(use_threads=True)
+        if self.header is None:
+            read_options.column_names = list(self.column_types)
+        else:
+            read_options.skip_rows = self.header
+        if block_size:
+            read_options.block_size = block_size
+        convert_options = pa_csv.ConvertOptions(column_types=self._arrow_types, strings_can_be_null=True)
+        return {"read_options": read_options, "convert_options": convert_options}
+
+    def _load_dataframe(self, df, engine, if_exists, cursor=None):
+        """Charge un DataFrame (to_sql, ou COPY sur `cursor`) ; renvoie le nombre de lignes"""
+        with self._metrics.phase("load"):
+            if self.loader == "insert" and not self.on_conflict:
+                if self.load_mode == "incremental" or self.chunksize:
+                    if not df.empty:
+                        df.to_sql(self.table, engine, if_exists=if_exists, index=False, method="multi", chunksize=1000)
+                else:
+                    # Charger les données en base
+                    df.to_sql(self.table, engine, if_exists=if_exists, index=False)
+                return len(df)
+
+            if not self.on_conflict:
+                # Crée (ou remplace) la table selon if_exists, sans données
+                df.head(0).to_sql(self.table, engine, if_exists=if_exists, index=False)
+            return self._copy_frame(cursor, df)
+
+    def _copy_frame(self, cursor, df):
+        """COPY d'un DataFrame (CSV en mémoire ou PGCOPY binaire)"""
+        if df.empty:
+            return 0
+        if self.copy_format == "binary":
+            source = binary_copy_buffer(df, column_types(cursor, self.table))
+        else:
+            source = io.StringIO()
+            df.to_csv(source, index=False, header=False)
+            source.seek(0)
+        self._copy(cursor, df.columns, source)
+        return len(df)
+
+    def _copy_file(self, filename, postgres_hook, engine):
+        """CSV téléchargé → COPY en flux, sans passer par un DataFrame"""
+        with self._metrics.phase("parse"):
+            if self.column_types:
+                sample = pa_csv.open_csv(filename, **self._arrow_csv_options()).read_next_batch().to_pandas()
+            else:
+                sample = pd.read_csv(filename, header=self.header, nrows=1000)
+        with self._metrics.phase("load"):
+            if not self.on_conflict:
+                sample.head(0).to_sql(self.table, engine, if_exists=self.if_exists, index=False)
+        with open(filename, "r", encoding="utf-8") as f, self._raw_cursor(postgres_hook) as cursor:
+            with self._metrics.phase("load"):
+                rows = self._copy(cursor, sample.columns, f, header=self.header == 0)
+            return self._merge(cursor, sample.columns, rows)
+
+    @property
+    def _staging_table(self):
+        return f"{self.table.rpartition('.')[2]}_staging"
+
+    @contextmanager
+    def _raw_cursor(self, postgres_hook):
+        """Curseur sur la connexion brute pour les COPY, commit en sortie (None si loader=insert)"""
+        if self.loader != "copy" and not self.on_conflict:
+            yield None
+            return
+        conn = postgres_hook.get_conn()
+        try:
+            with conn.cursor() as cursor:
+                if self.on_conflict:
+                    cursor.execute(staging_sql(self.table, self._staging_table))
+                yield cursor
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _copy(self, cursor, columns, source, header=False):
+        """COPY ... FROM STDIN de `source` (vers la staging en upsert) ; renvoie le nombre de lignes copiées"""
+        target = self._staging_table if self.on_conflict else self.table
+        cursor.copy_expert(copy_sql(target, columns, self.copy_format, header=header), source)
+        return max(cursor.rowcount, 0)
+
+    def _merge(self, cursor, columns, staged):
+        """Upsert staging → cible ; renvoie les lignes écrites (staged si pas d'upsert)"""
+        if not self.on_conflict:
+            return staged
+        with self._metrics.phase("merge"):
+            cursor.execute(upsert_sql(
+                self.table, self._staging_table, list(columns), self.conflict_columns, self.on_conflict
+            ))
+            written = max(cursor.rowcount, 0)
+            if self.post_merge_sql and written:
+                cursor.execute(self.post_merge_sql)
+        self.log.info(
+            f"Upsert ON CONFLICT ({', '.join(self.conflict_columns)}) DO {self.on_conflict.upper()} : "
+            f"{written} lignes écrites sur {staged} en staging"
+        )
+        return written
+
+    def _watermarks(self, engine):
+        """High-water marks déjà en base, lus à la demande (None si table absente)"""
+        if not inspect(engine).has_table(self.table):
+            return None
+        return Watermarks(engine, self.table, self.watermark_column, self.partition_column)
+
+    def _rows_after_watermark(self, df, watermarks):
+        """Lignes strictement postérieures au watermark (de leur partition)"""
+        if watermarks is None or df.empty:
+            return df
+        values = pd.to_datetime(df[self.watermark_column], format="ISO8601")
+        if self.partition_column and self.partition_column in df.columns:
+            bounds = watermarks.bounds(df[self.partition_column])
+            return df[bounds.isna() | (values > bounds)]
+        # Fichier sans colonne de partition : watermark global
+        bound = watermarks.get()
+        return df if bound is None else df[values > bound]
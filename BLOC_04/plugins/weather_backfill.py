@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Backfill de l'historique depuis les exports « History Bulk » d'OpenWeatherMap.
+
+Un export est un CSV horaire trié (dt, dt_iso, city_name, lat, lon, temp,
+visibility, dew_point, feels_like, pressure, humidity, wind_speed, wind_deg,
+rain_1h, clouds_all, weather_main, weather_description, ...). Chaque fichier
+est découpé en tranches d'octets alignées sur les fins de ligne — des plages
+de dates contiguës, puisque l'export est chronologique — parsées et
+normalisées en parallèle dans un pool de process, puis écrites directement
+dans le store partitionné avec déduplication.
+"""
+
+import glob
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dedup_index import DedupIndex, dedup_index_key, observation_keys
+from weather_store import OBSERVATION_COLUMNS, OBSERVATIONS_PREFIX, write_partitioned
+
+# Taille d'une tranche de parsing (≈ 80 000 lignes horaires)
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# Colonnes de l'export bulk utiles → colonnes d'observation
+BULK_RENAME = {"clouds_all": "clouds"}
+BULK_COLUMNS = [
+    "dt", "temp", "feels_like", "pressure", "humidity", "dew_point", "clouds_all",
+    "visibility", "wind_speed", "wind_deg", "rain_1h", "weather_main", "weather_description",
+]
+
+
+def expand_sources(paths):
+    """Fichiers CSV à ingérer : chemins explicites ou répertoires (*.csv)"""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.csv"))))
+        else:
+            files.append(path)
+    return files
+
+
+def byte_chunks(path, chunk_bytes=CHUNK_BYTES):
+    """En-tête et tranches [début, fin) d'octets alignées sur les fins de ligne"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline().decode("utf-8").strip().split(",")
+        bounds = [f.tell()]
+        while bounds[-1] < size:
+            f.seek(min(bounds[-1] + chunk_bytes, size))
+            f.readline()  # Termine la ligne en cours
+            bounds.append(min(f.tell(), size))
+    return header, list(zip(bounds[:-1], bounds[1:]))
+
+
+def normalize_bulk(df, location):
+    """Lignes d'un export bulk → observations (mêmes colonnes que l'ETL)"""
+    df = df.rename(columns=BULK_RENAME)
+    df["datetime"] = pd.to_datetime(df.pop("dt"), unit="s")
+    df["rain_1h"] = df["rain_1h"].fillna(0.0) if "rain_1h" in df.columns else 0.0
+    df["location"] = location
+    df = df.reindex(columns=OBSERVATION_COLUMNS)
+    measurements = df.columns.intersection(
+        ["temp", "feels_like", "pressure", "humidity", "dew_point", "clouds",
+         "visibility", "wind_speed", "wind_deg", "rain_1h"]
+    )
+    df[measurements] = df[measurements].astype(np.float32)
+    return df
+
+
+def parse_chunk(path, start, end, header, location, range_start=None, range_end=None):
+    """Parse et normalise une tranche d'octets (exécuté dans un process du pool)"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    usecols = [c for c in BULK_COLUMNS if c in header]
+    df = pd.read_csv(io.BytesIO(data), header=None, names=header, usecols=usecols)
+    df = normalize_bulk(df, location)
+    if range_start is not None:
+        df = df[df["datetime"] >= pd.Timestamp(range_start)]
+    if range_end is not None:
+        df = df[df["datetime"] <= pd.Timestamp(range_end)]
+    return df
+
+
+def load_bulk(sources, start=None, end=None, workers=None, chunk_bytes=CHUNK_BYTES):
+    """Parse en parallèle les exports de plusieurs locations.
+
+    sources : {location: chemin | [chemins] | répertoire}. Renvoie un
+    DataFrame d'observations trié, sans doublon (location, datetime).
+    """
+    tasks = []
+    for location, paths in sources.items():
+        for path in expand_sources(paths):
+            header, chunks = byte_chunks(path, chunk_bytes)
+            tasks.extend((path, s, e, header, location, start, end) for s, e in chunks)
+    logging.info(f"📦 Backfill : {len(tasks)} tranches à parser ({len(sources)} locations)")
+
+    if not tasks:
+        return pd.DataFrame(columns=OBSERVATION_COLUMNS)
+    if workers == 1 or len(tasks) == 1:
+        frames = [parse_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(parse_chunk, *zip(*tasks)))
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(subset=["location", "datetime"])
+    return df.sort_values(["datetime", "location"]).reset_index(drop=True)
+
+
+def backfill(s3_client, bucket, sources, start=None, end=None, prefix=OBSERVATIONS_PREFIX,
+             file_format="csv", workers=None, chunk_bytes=CHUNK_BYTES):
+    """Écrit les exports bulk dans le store partitionné ; renvoie des statistiques"""
+    df = load_bulk(sources, start=start, end=end, workers=workers, chunk_bytes=chunk_bytes)
+    parsed = len(df)
+
+    index_key = dedup_index_key(prefix)
+    dedup_index = DedupIndex.load(s3_client, bucket, index_key)
+    if dedup_index is None:
+        dedup_index = DedupIndex()
+    keys = observation_keys(df["datetime"], df["location"])
+    known = dedup_index.contains(keys)
+    df, keys = df[~known], keys[~known]
+
+    written = []
+    if not df.empty:
+        written = write_partitioned(df, s3_client, bucket, prefix=prefix, file_format=file_format)
+        dedup_index.add(keys)
+        dedup_index.save(s3_client, bucket, index_key)
+
+    stats = {"parsed": parsed, "duplicates": int(known.sum()), "written": len(df), "objects": len(written)}
+    logging.info(f"✅ Backfill terminé : {stats}")
+    return stats
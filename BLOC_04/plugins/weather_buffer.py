@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Journal local (write-ahead) des observations en attente d'écriture sur S3.
+
+Chaque run ajoute ses observations dans un fichier SQLite du volume du
+worker (synchronous=FULL : fsync à chaque commit) ; une tâche de flush les
+expédie vers S3 et Postgres en un seul lot toutes les N minutes ou M lignes.
+Les lignes ne sont retirées du journal qu'après l'écriture S3 : après un
+crash, le flush suivant les renvoie (les écritures sont idempotentes).
+Un verrou de fichier (flush_lock) sérialise les expéditions : le flush de
+l'ETL et l'export du sink direct ne relisent jamais le même lot ensemble.
+"""
+
+import fcntl
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from weather_store import DEFAULT_LOCATION
+
+# Chemin du journal (surchargeable : WEATHER_BUFFER_PATH) — volume persistant, pas /tmp
+DEFAULT_BUFFER_PATH = "/opt/airflow/data/weather_buffer.sqlite"
+
+# Seuils de flush par défaut
+FLUSH_MINUTES = 15
+FLUSH_ROWS = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    location TEXT NOT NULL,
+    dt INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    UNIQUE (location, dt)
+)
+"""
+
+
+def buffer_path():
+    return os.environ.get("WEATHER_BUFFER_PATH", DEFAULT_BUFFER_PATH)
+
+
+def _connect():
+    path = buffer_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")  # Commit durable (fsync)
+    conn.execute(_SCHEMA)
+    return conn
+
+
+def append(payloads, now=None):
+    """Ajoute des payloads OpenWeather au journal ; renvoie le nombre de lignes nouvelles"""
+    now = time.time() if now is None else now
+    conn = _connect()
+    try:
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO pending (location, dt, payload, received_at) VALUES (?, ?, ?, ?)",
+                [
+                    (p.get("location", DEFAULT_LOCATION), int(p["dt"]), json.dumps(p), now)
+                    for p in payloads
+                ],
+            )
+            return conn.total_changes - before
+    finally:
+        conn.close()
+
+
+def status(now=None):
+    """(lignes en attente, âge en secondes de la plus ancienne)"""
+    now = time.time() if now is None else now
+    conn = _connect()
+    try:
+        count, oldest = conn.execute("SELECT COUNT(*), MIN(received_at) FROM pending").fetchone()
+    finally:
+        conn.close()
+    return count, (now - oldest) if oldest is not None else 0.0
+
+
+def is_due(max_minutes=FLUSH_MINUTES, max_rows=FLUSH_ROWS, now=None):
+    """Flush dû : assez de lignes, ou la plus ancienne attend depuis assez longtemps"""
+    count, age = status(now)
+    return count > 0 and (count >= int(max_rows) or age >= float(max_minutes) * 60)
+
+
+def pending():
+    """(dernier id, payloads) des lignes en attente, dans l'ordre d'arrivée"""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT id, payload FROM pending ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return None, []
+    return rows[-1][0], [json.loads(payload) for _, payload in rows]
+
+
+def ack(last_id):
+    """Retire du journal les lignes expédiées (id ≤ last_id)"""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM pending WHERE id <= ?", (last_id,))
+    finally:
+        conn.close()
+
+
+@contextmanager
+def flush_lock():
+    """Verrou exclusif (bloquant) des expéditions du journal vers S3"""
+    path = f"{buffer_path()}.lock"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
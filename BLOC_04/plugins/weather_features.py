@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Features des modèles météo, communes à l'entraînement et au temps réel.
+
+Un lot de N observations (colonnes NumPy, pandas ou Arrow) devient en une
+passe vectorisée une matrice float32 contiguë de N x 17, dans l'ordre de
+FEATURE_COLUMNS : le même code sert l'entraînement et la prédiction, les
+features ne peuvent plus diverger entre les deux.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Mesures brutes (ni dew_point ni timestamp : absents de l'API temps réel)
+RAW_FEATURES = [
+    "temp", "feels_like", "pressure", "humidity",
+    "clouds", "visibility", "wind_speed", "wind_deg", "rain_1h",
+]
+
+# Features calendaires dérivées de datetime
+TIME_FEATURES = [
+    "hour", "month", "weekday", "is_weekend",
+    "hour_sin", "hour_cos", "month_sin", "month_cos",
+]
+
+# Ordre des colonnes attendu par les modèles (17 features)
+FEATURE_COLUMNS = RAW_FEATURES + TIME_FEATURES
+
+FEATURE_DTYPE = np.float32
+
+
+def _as_array(values, dtype=None):
+    """Colonne NumPy depuis une liste, Series ou tableau Arrow"""
+    if hasattr(values, "to_numpy") and not isinstance(values, (pd.Series, pd.Index, np.ndarray)):
+        values = values.to_numpy(zero_copy_only=False)  # pyarrow.Array / ChunkedArray
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.to_numpy(dtype=dtype, na_value=np.nan) if dtype is not None else values.to_numpy()
+    return np.asarray(values, dtype=dtype)
+
+
+def _datetimes(values):
+    """datetime64[ns] ou secondes epoch → datetime64[s] (UTC naïf)"""
+    values = _as_array(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[s]")
+    if values.dtype == object:
+        return pd.to_datetime(values).to_numpy().astype("datetime64[s]")
+    return values.astype("int64").astype("datetime64[s]")
+
+
+def build_features(datetimes, columns):
+    """Matrice float32 (N x 17, C-contiguë) dans l'ordre de FEATURE_COLUMNS.
+
+    datetimes : instants des observations (datetime64 ou secondes epoch).
+    columns : mapping colonne → valeurs (dict, DataFrame, pyarrow.Table) ;
+    une mesure absente donne une colonne de NaN.
+    """
+    seconds = _datetimes(datetimes)
+    n = len(seconds)
+    matrix = np.empty((n, len(FEATURE_COLUMNS)), dtype=FEATURE_DTYPE)
+
+    names = set(columns.column_names) if hasattr(columns, "column_names") else set(columns.keys())
+    for i, name in enumerate(RAW_FEATURES):
+        matrix[:, i] = _as_array(columns[name], np.float64) if name in names else np.nan
+
+    days = seconds.astype("datetime64[D]")
+    hour = (seconds - days).astype("int64") // 3600
+    months = seconds.astype("datetime64[M]")
+    month = months.astype("int64") % 12 + 1
+    weekday = (days.astype("int64") + 3) % 7  # 1970-01-01 était un jeudi (lundi = 0)
+
+    base = len(RAW_FEATURES)
+    matrix[:, base] = hour
+    matrix[:, base + 1] = month
+    matrix[:, base + 2] = weekday
+    matrix[:, base + 3] = weekday >= 5
+    matrix[:, base + 4] = np.sin(2 * np.pi * hour / 24)
+    matrix[:, base + 5] = np.cos(2 * np.pi * hour / 24)
+    matrix[:, base + 6] = np.sin(2 * np.pi * month / 12)
+    matrix[:, base + 7] = np.cos(2 * np.pi * month / 12)
+    return matrix
+
+
+def payload_columns(payloads):
+    """Réponses OpenWeatherMap → (secondes epoch, {colonne: tableau}) du lot"""
+    return (
+        np.array([p["dt"] for p in payloads], dtype="int64"),
+        {
+            "temp": [p["main"]["temp"] for p in payloads],
+            "feels_like": [p["main"]["feels_like"] for p in payloads],
+            "pressure": [p["main"]["pressure"] for p in payloads],
+            "humidity": [p["main"]["humidity"] for p in payloads],
+            "clouds": [p["clouds"]["all"] for p in payloads],
+            "visibility": [p.get("visibility", np.nan) for p in payloads],
+            "wind_speed": [p["wind"]["speed"] for p in payloads],
+            "wind_deg": [p["wind"]["deg"] for p in payloads],
+            "rain_1h": [p.get("rain", {}).get("1h", 0.0) for p in payloads],
+        },
+    )
+
+
+def features_frame(matrix, index=None):
+    """Matrice de features → DataFrame nommé (entrée attendue par les modèles MLflow)"""
+    return pd.DataFrame(matrix, columns=FEATURE_COLUMNS, index=index, copy=False)
+
+
+def history_features(df, datetime_column="datetime"):
+    """Features d'un historique (DataFrame typé) en DataFrame float32, même index"""
+    return features_frame(build_features(df[datetime_column], df), index=df.index)
+
+
+def payload_features(payloads):
+    """Features d'un lot de réponses API en DataFrame float32 (une ligne par réponse)"""
+    datetimes, columns = payload_columns(payloads)
+    return features_frame(build_features(datetimes, columns))
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestion des observations OpenWeatherMap : callables de l'ETL météo.
+
+Partagé par les DAGs (dags/meteo_paris.py, dags/weather_utils.py) : appel
+de l'API pour plusieurs locations en parallèle, transformation en lignes,
+écriture sur S3 (CSV unique ou store partitionné, dédup par index), journal
+local (mode buffered) et sink direct vers Postgres, flush/export du journal,
+backfill depuis les exports « History Bulk ».
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+from airflow.exceptions import AirflowSkipException
+from airflow.models import Variable
+from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+
+import weather_buffer
+import weather_pg_sink
+from dedup_index import DedupIndex, dedup_index_key, observation_keys
+from ingestion_state import filter_new, mark_ingested
+from openweather_client import get_current_weather, log_latency
+from weather_backfill import backfill
+from weather_store import (
+    DEFAULT_LOCATION,
+    FILE_FORMATS,
+    OBSERVATIONS_PREFIX,
+    observation_from_json,
+    read_history,
+    write_history,
+    write_partitioned,
+)
+
+# Coordonnées de Paris
+LAT = 48.8566
+LON = 2.3522
+
+# Locations ingérées par défaut (surchargées par la Variable WEATHER_LOCATIONS, même format)
+LOCATIONS = {DEFAULT_LOCATION: {"lat": LAT, "lon": LON, "name": "Paris"}}
+
+# Nombre maximal d'appels API simultanés
+FETCH_CONCURRENCY = 8
+
+
+def setup_aws_environment():
+    """Configure les credentials AWS via Variables Airflow"""
+    try:
+        os.environ["AWS_ACCESS_KEY_ID"] = Variable.get("AWS_ACCESS_KEY_ID")
+        os.environ["AWS_SECRET_ACCESS_KEY"] = Variable.get("AWS_SECRET_ACCESS_KEY")
+        os.environ["AWS_DEFAULT_REGION"] = Variable.get("AWS_DEFAULT_REGION")
+        logging.info("✓ AWS environment configured from Airflow Variables")
+    except Exception as e:
+        logging.error(f"❌ AWS setup failed: {str(e)}")
+        raise
+
+
+def parse_locations(locations=None):
+    """Locations à ingérer : dict, JSON (Variable templatée via op_kwargs) ou défaut Paris"""
+    if not locations:
+        return LOCATIONS
+    if isinstance(locations, str):
+        locations = json.loads(locations)
+    if not locations:
+        raise ValueError("Aucune location à ingérer (WEATHER_LOCATIONS vide)")
+    return locations
+
+
+def _fetch_location(api_key, location, coords):
+    """Observation courante d'une location, annotée avec son identifiant"""
+    raw_data = get_current_weather(coords["lat"], coords["lon"], api_key)
+    return {**raw_data, "location": location}
+
+
+def fetch_weather_data(locations=None, max_workers=FETCH_CONCURRENCY, **context):
+    """Appelle l'API OpenWeatherMap pour chaque location et sauvegarde un JSON batch local.
+
+    Les appels partent en parallèle (au plus max_workers simultanés) : la durée
+    de la tâche suit la latence d'un appel, pas le nombre de villes. Une
+    location en échec est journalisée ; la tâche échoue si toutes échouent.
+
+    Seules les observations dont le dt a avancé depuis la dernière ingestion
+    sont gardées ; sans aucune nouveauté le run est marqué skipped, et tout
+    le travail S3/Postgres en aval est sauté.
+    """
+    locations = parse_locations(locations)
+    logging.info(f"Fetching weather data from OpenWeatherMap ({len(locations)} locations)")
+    api_key = Variable.get("OPEN_WEATHER_API_KEY")
+
+    observations, errors = [], {}
+    workers = max(1, min(int(max_workers), len(locations)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_fetch_location, api_key, location, coords): location
+            for location, coords in locations.items()
+        }
+        for future in as_completed(futures):
+            location = futures[future]
+            try:
+                observations.append(future.result())
+            except Exception as e:
+                logging.error(f"❌ {location} : {e}")
+                errors[location] = e
+
+    if not observations:
+        raise next(iter(errors.values()))
+    log_latency()
+    if errors:
+        logging.warning(f"⚠️ {len(errors)}/{len(locations)} locations en échec : {sorted(errors)}")
+
+    # Court-circuit : dt inchangé depuis la dernière ingestion (≈ 9 runs sur 10)
+    fresh = filter_new(observations)
+    if not fresh:
+        raise AirflowSkipException(f"Aucune observation nouvelle ({len(observations)} locations, dt inchangés)")
+    logging.info(f"{len(fresh)}/{len(observations)} observations nouvelles")
+
+    filename = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}_weather.json"
+    local_path = f"/tmp/{filename}"
+   
+    with open(local_path, "w") as f:
+        json.dump(sorted(fresh, key=lambda o: o["location"]), f)
+    
+    context["ti"].xcom_push(key="local_json_path", value=local_path)
+    logging.info(f"JSON saved locally: {local_path} ({len(fresh)} observations)")
+
+
+def _is_enabled(value):
+    """Booléen depuis op_kwargs (Variables templatées → chaînes)"""
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def transform_and_append_weather_data(storage_mode="csv", file_format="csv", buffered=False,
+                                      sink="s3", **context):
+    """Transforme le JSON batch en lignes, append au CSV S3, et upload le CSV final.
+
+    storage_mode="partitioned" : écrit l'observation comme un objet S3 isolé sous
+    des clés date/heure (append-only, sans relire ni ré-uploader l'historique).
+    file_format="parquet" : historique au schéma typé (weather_store.OBSERVATION_SCHEMA).
+    buffered=True : ajoute seulement les observations au journal local
+    (weather_buffer) ; flush_weather_buffer les expédie par lots.
+    sink="direct" : écrit le lot directement dans weather_data (weather_pg_sink) et
+    le laisse dans le journal pour l'export S3 asynchrone (weather_s3_export_dag).
+    """
+    # Pull le chemin JSON local via XCom
+    local_json = context["ti"].xcom_pull(task_ids="fetch_weather_data", key="local_json_path")
+    
+    if not local_json or not os.path.exists(local_json):
+        raise ValueError("Impossible de récupérer le JSON local")
+    
+    logging.info(f"DEBUG: Processing {local_json}")
+    
+    # Téléchargement du JSON local
+    with open(local_json, "r") as f:
+        raw_data = json.load(f)
+
+    # Batch multi-locations (ou ancien format : une seule observation)
+    payloads = raw_data if isinstance(raw_data, list) else [raw_data]
+
+    if sink == "direct":
+        inserted = weather_pg_sink.write_observations(payloads)
+        weather_buffer.append(payloads)  # En attente de l'export S3
+        mark_ingested(payloads)
+        context["ti"].xcom_push(key="rows_inserted", value=inserted)
+        return
+
+    if _is_enabled(buffered):
+        added = weather_buffer.append(payloads)
+        mark_ingested(payloads)  # Durable dans le journal (fsync)
+        logging.info(f"📝 {added} observations ajoutées au journal {weather_buffer.buffer_path()}")
+        return
+
+    _persist_observations(payloads, storage_mode, file_format, **context)
+
+
+def _persist_observations(payloads, storage_mode="csv", file_format="csv", **context):
+    """Écrit un lot d'observations sur S3 (dédup, csv ou partitionné) et pousse la/les clé(s) pour Postgres"""
+    # Setup AWS en premier (pour S3Hook)
+    setup_aws_environment()
+    
+    bucket = Variable.get("BUCKET")
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"file_format inconnu : {file_format}")
+    csv_key = f"weather_paris_fect.{file_format}"  # Key fixe pour accumulation
+    logging.info(f"Bucket: {bucket} | CSV Key: {csv_key} | {len(payloads)} observations")
+
+    # Mapping direct vers colonnes compatibles ML (OpenWeatherMap natif)
+    new_df = pd.DataFrame([observation_from_json(p) for p in payloads])
+
+    if storage_mode not in ("csv", "partitioned"):
+        raise ValueError(f"storage_mode inconnu : {storage_mode}")
+
+    s3_hook = S3Hook(aws_conn_id="aws_default")
+    s3_client = s3_hook.get_conn()
+
+    # Check doublon via l'index stocké à côté du dataset (aucun parse de l'historique)
+    dataset_key = OBSERVATIONS_PREFIX if storage_mode == "partitioned" else csv_key
+    index_key = dedup_index_key(dataset_key)
+    dedup_index = DedupIndex.load(s3_client, bucket, index_key)
+    if dedup_index is not None:
+        new_df = _drop_known(new_df, dedup_index)
+        if new_df.empty:
+            mark_ingested(payloads)
+            raise AirflowSkipException("Lignes déjà présentes (doublons évités via l'index)")
+
+    # Mode append-only : un objet par observation, l'historique n'est jamais relu
+    if storage_mode == "partitioned":
+        keys = write_partitioned(
+            new_df, s3_client, bucket, prefix=OBSERVATIONS_PREFIX, file_format=file_format
+        )
+        if dedup_index is None:
+            dedup_index = DedupIndex()
+        dedup_index.add(observation_keys(new_df["datetime"], new_df["location"]))
+        dedup_index.save(s3_client, bucket, index_key)
+        mark_ingested(payloads)
+        # Toutes les partitions du lot (un lot peut couvrir plusieurs heures)
+        context["ti"].xcom_push(key="weather_csv_key", value=keys)
+        return
+
+    # Download CSV existant de S3 (ou gérer premier run)
+    local_csv = f"/tmp/{csv_key}"
+    try:
+        s3_hook.download_file(key=csv_key, bucket_name=bucket, local_path="/tmp")
+        existing_df = read_history(local_csv)
+        logging.info(f"CSV existant chargé : {len(existing_df)} lignes")
+        
+        # Index absent : reconstruit une seule fois depuis l'historique
+        if dedup_index is None:
+            dedup_index = DedupIndex.from_observations(existing_df)
+            new_df = _drop_known(new_df, dedup_index)
+        if not new_df.empty:
+            # Append (l'historique mono-ville est attribué à la location par défaut)
+            if "location" not in existing_df.columns:
+                existing_df["location"] = DEFAULT_LOCATION
+            updated_df = pd.concat([existing_df, new_df], ignore_index=True)
+            write_history(updated_df, local_csv)
+            logging.info(f"{len(new_df)} nouvelles lignes appendées : total {len(updated_df)} lignes")
+    except Exception as e:  # Premier run ou fichier absent
+        logging.info(f"Premier run ou CSV absent : création avec {len(new_df)} lignes | Erreur: {e}")
+        write_history(new_df, local_csv)
+        updated_df = new_df
+        dedup_index = DedupIndex()
+
+    # Rien de nouveau : ni ré-upload inchangé, ni transfert Postgres
+    if new_df.empty:
+        mark_ingested(payloads)
+        raise AirflowSkipException("Lignes déjà présentes (doublons évités)")
+
+    # Upload du CSV mis à jour sur S3, puis de l'index
+    s3_hook.load_file(
+        filename=local_csv, key=csv_key, bucket_name=bucket, replace=True
+    )
+    dedup_index.add(observation_keys(new_df["datetime"], new_df["location"]))
+    dedup_index.save(s3_client, bucket, index_key)
+    mark_ingested(payloads)
+
+    # Push la key CSV fixe via XCom (pour DB)
+    context["ti"].xcom_push(key="weather_csv_key", value=csv_key)
+    logging.info(f"CSV mis à jour uploadé sur S3: s3://{bucket}/{csv_key}")
+    logging.info(f"Colonnes: {list(updated_df.columns)}")
+
+
+def flush_weather_buffer(storage_mode="csv", file_format="csv", buffered=False, sink="s3",
+                         flush_minutes=weather_buffer.FLUSH_MINUTES, flush_rows=weather_buffer.FLUSH_ROWS,
+                         **context):
+    """Expédie le journal local vers S3 en un lot (toutes les N minutes ou M lignes).
+
+    Hors mode buffered, relaie simplement la clé écrite par la transformation.
+    Les lignes ne quittent le journal qu'une fois écrites sur S3 : un flush
+    interrompu est rejoué au suivant (doublons écartés par l'index de dédup).
+    """
+    if sink == "direct":
+        raise AirflowSkipException("Déjà en base (sink direct) : export S3 par weather_s3_export_dag")
+
+    if not _is_enabled(buffered):
+        key = context["ti"].xcom_pull(task_ids="transform_and_append_weather_data", key="weather_csv_key")
+        if key is None:
+            raise AirflowSkipException("Aucune donnée écrite par la transformation")
+        context["ti"].xcom_push(key="weather_csv_key", value=key)
+        return
+
+    # Un seul expéditeur à la fois (flush de l'ETL / export du sink direct) :
+    # l'historique S3 et l'index de dédup sont relus puis réécrits
+    with weather_buffer.flush_lock():
+        if not weather_buffer.is_due(flush_minutes, flush_rows):
+            count, age = weather_buffer.status()
+            raise AirflowSkipException(f"Flush non dû : {count} lignes en attente depuis {age / 60:.1f} min")
+
+        last_id, payloads = weather_buffer.pending()
+        logging.info(f"🚚 Flush du journal : {len(payloads)} observations")
+        try:
+            _persist_observations(payloads, storage_mode, file_format, **context)
+        except AirflowSkipException:
+            weather_buffer.ack(last_id)  # Déjà sur S3 (rejeu après crash)
+            raise
+        weather_buffer.ack(last_id)
+
+
+def export_weather_buffer(storage_mode="csv", file_format="csv", sink="s3", **context):
+    """Export S3 asynchrone du sink direct : tout le journal en attente, en un lot.
+
+    Hors sink direct, le journal appartient à flush_weather_buffer (mode buffered).
+    """
+    if sink != "direct":
+        raise AirflowSkipException(f"Sink {sink} : journal expédié par flush_weather_buffer")
+    flush_weather_buffer(storage_mode, file_format, buffered=True, flush_minutes=0, flush_rows=1, **context)
+
+
+def _local_bulk_files(s3_client, paths, local_dir="/tmp/weather_backfill"):
+    """Chemins locaux des exports : s3://bucket/clé (ou préfixe/) téléchargés, le reste tel quel"""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    local_paths = []
+    for path in paths:
+        if not path.startswith("s3://"):
+            local_paths.append(path)
+            continue
+        bucket, _, key = path[len("s3://"):].partition("/")
+        if key.endswith("/") or not key:
+            listed = s3_client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=key)
+            keys = [o["Key"] for page in listed for o in page.get("Contents", []) if o["Key"].endswith(".csv")]
+        else:
+            keys = [key]
+        os.makedirs(local_dir, exist_ok=True)
+        for k in keys:
+            local_path = os.path.join(local_dir, k.replace("/", "_"))
+            s3_client.download_file(bucket, k, local_path)
+            local_paths.append(local_path)
+    return local_paths
+
+
+def backfill_weather_history(file_format="csv", **context):
+    """Ingère des exports OpenWeather « History Bulk » dans le store partitionné.
+
+    Conf du DAG : {"sources": {"lyon": "s3://bucket/bulk/lyon.csv", "nice": "/opt/airflow/data/bulk/nice/"},
+    "start": "2015-01-01", "end": "2020-12-31"} (plage optionnelle). Les
+    exports sont parsés en parallèle (weather_backfill) puis dédupliqués
+    contre l'index du store.
+    """
+    dag_conf = context.get("dag_run").conf if context.get("dag_run") else {}
+    sources = dag_conf.get("sources") or {}
+    if not sources:
+        raise ValueError("Aucune source de backfill (conf 'sources')")
+
+    setup_aws_environment()
+    bucket = Variable.get("BUCKET")
+    s3_client = S3Hook(aws_conn_id="aws_default").get_conn()
+
+    local_sources = {location: _local_bulk_files(s3_client, paths) for location, paths in sources.items()}
+    stats = backfill(
+        s3_client, bucket, local_sources,
+        start=dag_conf.get("start"), end=dag_conf.get("end"), file_format=file_format,
+    )
+    context["ti"].xcom_push(key="backfill_stats", value=stats)
+
+
+def _drop_known(new_df, dedup_index):
+    """Retire du batch les observations (location, dt) déjà présentes dans l'index"""
+    known = dedup_index.contains(observation_keys(new_df["datetime"], new_df["location"]))
+    return new_df[~known].reset_index(drop=True)
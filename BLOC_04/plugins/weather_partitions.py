@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Table weather_data partitionnée par mois (PARTITION BY RANGE (datetime)).
+
+Une partition par mois civil (weather_data_2024_01, ...) plus une partition
+DEFAULT qui reçoit les lignes d'un mois pas encore créé (backfill, premier
+run du mois). Un index BRIN sur datetime sert les scans par plage ; l'index
+UNIQUE (location, datetime) reste nécessaire à l'ON CONFLICT du chargement.
+
+Une table classique encore en place (avant migration) est migrée par
+ensure_table, appelé avant chaque chargement de l'ETL : l'ON CONFLICT
+(location, datetime) n'attend pas la maintenance quotidienne. ensure_table
+crée aussi la file des heures à ré-agréger (weather_rollups), alimentée
+par les chargements dans leur transaction.
+
+La maintenance (quotidienne) crée les partitions des prochains mois, extrait
+de DEFAULT les mois qui y sont tombés, et détache les partitions plus
+anciennes que la rétention vers un schéma d'archive.
+"""
+
+import logging
+import re
+
+import pandas as pd
+
+from weather_rollups import enqueue_sql, queue_statements
+from weather_store import DEFAULT_LOCATION
+
+TABLE = "weather_data"
+
+# Colonnes de weather_data et leurs types SQL (source unique du DDL et du parsing typé)
+WEATHER_DATA_COLUMN_TYPES = {
+    "datetime": "TIMESTAMP",
+    "temp": "DECIMAL(5, 2)",
+    "feels_like": "DECIMAL(5, 2)",
+    "pressure": "DECIMAL(6, 2)",
+    "humidity": "DECIMAL(5, 2)",
+    "dew_point": "DECIMAL(5, 2)",
+    "clouds": "DECIMAL(5, 2)",
+    "visibility": "DECIMAL(7, 1)",
+    "wind_speed": "DECIMAL(5, 2)",
+    "wind_deg": "DECIMAL(5, 2)",
+    "rain_1h": "DECIMAL(5, 2)",
+    "weather_main": "VARCHAR",
+    "weather_description": "VARCHAR",
+    "location": "VARCHAR",
+}
+
+_COLUMN_CONSTRAINTS = {
+    "datetime": "NOT NULL",
+    "location": f"NOT NULL DEFAULT '{DEFAULT_LOCATION}'",
+}
+
+# Partitions créées à l'avance (mois à venir)
+MONTHS_AHEAD = 3
+
+# Schéma des partitions détachées
+ARCHIVE_SCHEMA = "weather_archive"
+
+_PARTITION_RE = re.compile(r"_(\d{4})_(\d{2})$")
+
+
+def month_start(value):
+    """Premier instant du mois de `value`"""
+    return pd.Timestamp(value).to_period("M").to_timestamp()
+
+
+def partition_name(month, table=TABLE):
+    return f"{table}_{month_start(month):%Y_%m}"
+
+
+def partition_month(name):
+    """weather_data_2024_01 → Timestamp('2024-01-01'), None pour DEFAULT / autre"""
+    match = _PARTITION_RE.search(name)
+    return pd.Timestamp(f"{match.group(1)}-{match.group(2)}-01") if match else None
+
+
+def _bounds(month):
+    start = month_start(month)
+    return f"FROM ('{start:%Y-%m-%d}') TO ('{start + pd.DateOffset(months=1):%Y-%m-%d}')"
+
+
+def _range_filter(month):
+    start = month_start(month)
+    end = start + pd.DateOffset(months=1)
+    return f"datetime >= '{start:%Y-%m-%d}' AND datetime < '{end:%Y-%m-%d}'"
+
+
+def create_table_statements(table=TABLE):
+    """Table partitionnée, partition DEFAULT et index BRIN (idempotent)"""
+    columns = ",\n    ".join(
+        f"{column} {sql_type} {_COLUMN_CONSTRAINTS.get(column, '')}".rstrip()
+        for column, sql_type in WEATHER_DATA_COLUMN_TYPES.items()
+    )
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {table} (
+    id BIGSERIAL,
+    {columns},
+    PRIMARY KEY (id, datetime),
+    UNIQUE (location, datetime)  -- UNIQUE pour dedup (ON CONFLICT)
+) PARTITION BY RANGE (datetime)""",
+        f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT",
+        f"CREATE INDEX IF NOT EXISTS {table}_datetime_brin ON {table} USING BRIN (datetime)",
+    ]
+
+
+def create_partition_sql(month, table=TABLE):
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month, table)} "
+        f"PARTITION OF {table} FOR VALUES {_bounds(month)}"
+    )
+
+
+def split_default_statements(month, table=TABLE):
+    """Déplace un mois de la partition DEFAULT vers sa propre partition.
+
+    Une partition ne peut pas être créée tant que DEFAULT contient des
+    lignes de sa plage : elles sont copiées dans une table autonome, retirées
+    de DEFAULT, puis la table est attachée.
+    """
+    name = partition_name(month, table)
+    return [
+        f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)",
+        f"INSERT INTO {name} SELECT * FROM {table}_default WHERE {_range_filter(month)}",
+        f"DELETE FROM {table}_default WHERE {_range_filter(month)}",
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {_bounds(month)}",
+    ]
+
+
+def archive_statements(name, table=TABLE, archive_schema=ARCHIVE_SCHEMA):
+    """Détache une partition et la range dans le schéma d'archive"""
+    return [
+        f"CREATE SCHEMA IF NOT EXISTS {archive_schema}",
+        f"ALTER TABLE {table} DETACH PARTITION {name}",
+        f"ALTER TABLE {name} SET SCHEMA {archive_schema}",
+    ]
+
+
+def _relkind(cursor, table):
+    """'p' (partitionnée), 'r' (table classique) ou None (absente)"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def list_partitions(cursor, table=TABLE):
+    """Noms des partitions attachées à la table"""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i"
+        " JOIN pg_class c ON c.oid = i.inhrelid"
+        " JOIN pg_class p ON p.oid = i.inhparent"
+        " WHERE p.relname = %s",
+        (table,),
+    )
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def _months_in(cursor, relation, datetime_sql="datetime"):
+    cursor.execute(f"SELECT DISTINCT date_trunc('month', {datetime_sql}) FROM {relation}")
+    return sorted(pd.Timestamp(row[0]) for row in cursor.fetchall() if row[0] is not None)
+
+
+def _rename_legacy_objects(cursor, table, legacy):
+    """Contraintes et index de l'ancienne table : weather_data_* → weather_data_legacy_*.
+
+    RENAME TO garde leurs noms : le CREATE INDEX IF NOT EXISTS
+    weather_data_datetime_brin de la table partitionnée serait ignoré.
+    """
+    prefix = f"{table}_"
+
+    def legacy_names(query):
+        cursor.execute(query, (legacy,))
+        return [
+            name for (name,) in cursor.fetchall()
+            if name.startswith(prefix) and not name.startswith(f"{legacy}_")
+        ]
+
+    # Contraintes d'abord (leur index est renommé avec elles), puis les index restants
+    for name in legacy_names("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s)"):
+        cursor.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {name} TO {legacy}{name[len(table):]}")
+    for name in legacy_names("SELECT indexname FROM pg_indexes WHERE tablename = %s"):
+        cursor.execute(f"ALTER INDEX {name} RENAME TO {legacy}{name[len(table):]}")
+
+
+def _legacy_select(legacy_columns):
+    """Colonnes cibles → expressions SQL lues dans l'ancienne table.
+
+    L'ancien chargement (read_csv(header=None) + to_sql) créait des colonnes
+    positionnelles "0", "1", ... en TEXT, ligne d'en-tête comprise : elles
+    suivent l'ordre de WEATHER_DATA_COLUMN_TYPES et sont converties (en-tête
+    et chaînes vides → NULL). Aucune colonne reconnue → {}.
+    """
+    named = {c: c for c in WEATHER_DATA_COLUMN_TYPES if c in legacy_columns}
+    if named or "0" not in legacy_columns:
+        return named
+    return {
+        column: f'CAST(NULLIF(NULLIF("{position}"::TEXT, \'{column}\'), \'\') AS {sql_type})'
+        for position, (column, sql_type) in enumerate(WEATHER_DATA_COLUMN_TYPES.items())
+        if str(position) in legacy_columns
+    }
+
+
+def _migrate_legacy(cursor, table):
+    """Table non partitionnée existante → table partitionnée (l'ancienne est gardée en _legacy)"""
+    legacy = f"{table}_legacy"
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    _rename_legacy_objects(cursor, table, legacy)
+    for statement in create_table_statements(table):
+        cursor.execute(statement)
+
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = %s", (legacy,)
+    )
+    select = _legacy_select({row[0] for row in cursor.fetchall()})
+    if "datetime" not in select:
+        # Rien à recopier sans datetime (clé de partition, NOT NULL) : l'ETL continue sur la table vide
+        logging.warning(f"⚠️ {legacy} : aucune colonne datetime reconnue, lignes non recopiées")
+        return
+
+    for month in _months_in(cursor, legacy, select["datetime"]):
+        cursor.execute(create_partition_sql(month, table))
+    cursor.execute(
+        f"INSERT INTO {table} ({', '.join(select)}) SELECT {', '.join(select.values())} FROM {legacy}"
+        f" WHERE {select['datetime']} IS NOT NULL ON CONFLICT DO NOTHING"
+    )
+    copied = cursor.rowcount
+    cursor.execute(enqueue_sql(table))  # Agrégats des lignes recopiées
+    logging.info(f"🔀 {table} migrée en table partitionnée ({copied} lignes), ancienne table : {legacy}")
+
+
+def _ensure_table(cursor, table):
+    # Verrou transactionnel : l'ETL et la maintenance ne migrent pas en même temps
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (table,))
+    for statement in queue_statements():
+        cursor.execute(statement)
+    if _relkind(cursor, table) == "r":
+        _migrate_legacy(cursor, table)
+        return True
+    if _relkind(cursor, f"{table}_legacy") is not None:
+        # Migration faite avant le renommage des index : libère le nom de l'index BRIN
+        _rename_legacy_objects(cursor, table, f"{table}_legacy")
+    for statement in create_table_statements(table):
+        cursor.execute(statement)
+    return False
+
+
+def ensure_table(conn, table=TABLE):
+    """Table partitionnée prête pour le chargement (créée ou migrée) ; True si migrée"""
+    with conn.cursor() as cursor:
+        migrated = _ensure_table(cursor, table)
+    conn.commit()
+    return migrated
+
+
+def maintain_partitions(conn, now=None, months_ahead=MONTHS_AHEAD, retention_months=0,
+                        archive_schema=ARCHIVE_SCHEMA, table=TABLE):
+    """Maintenance des partitions ; renvoie un résumé des opérations.
+
+    retention_months=0 : aucune partition n'est archivée.
+    """
+    current = month_start(pd.Timestamp.now() if now is None else now)
+    months_ahead, retention_months = int(months_ahead), int(retention_months)
+    summary = {"migrated": False, "split": [], "created": [], "archived": []}
+
+    with conn.cursor() as cursor:
+        summary["migrated"] = _ensure_table(cursor, table)
+
+        # Mois tombés dans DEFAULT → partitions dédiées
+        existing = set(list_partitions(cursor, table))
+        for month in _months_in(cursor, f"{table}_default"):
+            if partition_name(month, table) not in existing:
+                for statement in split_default_statements(month, table):
+                    cursor.execute(statement)
+                summary["split"].append(partition_name(month, table))
+
+        # Partitions des prochains mois
+        existing = set(list_partitions(cursor, table))
+        for offset in range(months_ahead + 1):
+            month = current + pd.DateOffset(months=offset)
+            if partition_name(month, table) not in existing:
+                cursor.execute(create_partition_sql(month, table))
+                summary["created"].append(partition_name(month, table))
+
+        # Rétention : partitions trop anciennes détachées vers l'archive
+        if retention_months > 0:
+            cutoff = current - pd.DateOffset(months=retention_months)
+            for name in list_partitions(cursor, table):
+                month = partition_month(name)
+                if month is not None and month < cutoff:
+                    for statement in archive_statements(name, table, archive_schema):
+                        cursor.execute(statement)
+                    summary["archived"].append(name)
+    conn.commit()
+
+    logging.info(f"🗓️ Partitions {table} : {summary}")
+    return summary
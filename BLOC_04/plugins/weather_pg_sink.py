@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Écriture directe des observations dans weather_data (sans aller-retour S3).
+
+Le lot entier part en une seule requête ensembliste : chaque colonne est
+envoyée comme un tableau Postgres et dépliée par unnest(), puis insérée avec
+ON CONFLICT (location, datetime) DO NOTHING — un rejeu ne crée aucun doublon.
+Les heures du lot sont inscrites dans la file des agrégats (weather_rollups)
+dans la même transaction.
+Les connexions viennent d'un pool propre au processus (ThreadedConnectionPool,
+créé à la première écriture depuis la connexion Airflow) : les écritures
+suivantes du même processus évitent la poignée de main TLS. Pour mutualiser
+entre processus, faire pointer la connexion vers un pooler (PgBouncer, endpoint
+« -pooler » de Neon).
+
+L'export S3 (historique ML) devient un lot asynchrone : les observations
+écrites ici restent dans le journal local (weather_buffer) jusqu'à l'export.
+"""
+
+import logging
+import re
+import threading
+import time
+
+import pandas as pd
+
+from weather_partitions import TABLE, WEATHER_DATA_COLUMN_TYPES, ensure_table
+from weather_rollups import enqueue_sql
+from weather_store import observation_from_json
+
+# Connexions maximum par processus
+POOL_SIZE = 4
+
+CONFLICT_COLUMNS = ("location", "datetime")
+
+# Extras propres à Airflow (hook, IAM, SQLAlchemy) : inconnus de libpq, écartés comme dans PostgresHook.get_conn
+HOOK_ONLY_EXTRAS = ("iam", "redshift", "cursor", "cluster-identifier", "aws_conn_id", "sqlalchemy_scheme")
+
+_pools = {}
+_ready_tables = set()
+_lock = threading.Lock()
+
+
+def array_type(sql_type):
+    """Type SQL d'une colonne → type de tableau pour unnest (DECIMAL(5, 2) → numeric[])"""
+    base = re.sub(r"\s*\(.*\)$", "", sql_type).strip().lower()
+    return f"{'numeric' if base == 'decimal' else base}[]"
+
+
+def insert_sql(table=TABLE, columns=None, conflict_columns=CONFLICT_COLUMNS):
+    """INSERT ... SELECT FROM unnest(...) : une ligne par indice des tableaux"""
+    columns = list(columns or WEATHER_DATA_COLUMN_TYPES)
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    arrays = ", ".join(f"%s::{array_type(WEATHER_DATA_COLUMN_TYPES[c])}" for c in columns)
+    conflict_list = ", ".join(f'"{c}"' for c in conflict_columns)
+    return (
+        f"INSERT INTO {table} ({column_list}) SELECT * FROM unnest({arrays})"
+        f" ON CONFLICT ({conflict_list}) DO NOTHING"
+    )
+
+
+def column_arrays(df, columns=None):
+    """DataFrame → une liste Python par colonne (NaN/NaT → None, timestamps → datetime)"""
+    arrays = []
+    for column in columns or WEATHER_DATA_COLUMN_TYPES:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = [None if pd.isna(v) else v.to_pydatetime() for v in series]
+        else:
+            values = [None if pd.isna(v) else v for v in series.astype(object)]
+        arrays.append(values)
+    return arrays
+
+
+def connection_kwargs(conn):
+    """Connexion Airflow → paramètres psycopg2 (extras libpq seulement : sslmode, options, ...)"""
+    kwargs = {
+        "host": conn.host,
+        "port": conn.port or 5432,
+        "user": conn.login,
+        "password": conn.password,
+        "dbname": conn.schema,
+    }
+    kwargs.update({k: v for k, v in conn.extra_dejson.items() if k not in HOOK_ONLY_EXTRAS})
+    return kwargs
+
+
+def get_pool(conn_id="neon_db_conn", size=POOL_SIZE):
+    """Pool de connexions du processus pour une connexion Airflow (créé une fois)"""
+    with _lock:
+        if conn_id not in _pools:
+            from airflow.providers.postgres.hooks.postgres import PostgresHook
+            from psycopg2.pool import ThreadedConnectionPool
+
+            conn = PostgresHook.get_connection(conn_id)
+            _pools[conn_id] = ThreadedConnectionPool(1, int(size), **connection_kwargs(conn))
+            logging.info(f"🔌 Pool Postgres créé pour {conn_id} ({size} connexions max)")
+        return _pools[conn_id]
+
+
+def close_pools():
+    with _lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+        _ready_tables.clear()
+
+
+def write_observations(payloads, conn_id="neon_db_conn", table=TABLE, pool=None):
+    """Insère les réponses API dans la table ; renvoie le nombre de lignes nouvelles"""
+    if not payloads:
+        return 0
+    df = pd.DataFrame([observation_from_json(p) for p in payloads])
+    params = column_arrays(df)
+
+    pool = pool or get_pool(conn_id)
+    start = time.perf_counter()
+    conn = pool.getconn()
+    try:
+        if (conn_id, table) not in _ready_tables:
+            # Sink direct : create_weather_table est sautée, la table est créée / migrée ici
+            ensure_table(conn, table)
+        with conn.cursor() as cursor:
+            cursor.execute(insert_sql(table), params)
+            inserted = max(cursor.rowcount, 0)
+            if inserted:
+                columns = list(WEATHER_DATA_COLUMN_TYPES)
+                cursor.execute(
+                    enqueue_sql("unnest(%s::varchar[], %s::timestamp[]) AS t(location, datetime)"),
+                    (params[columns.index("location")], params[columns.index("datetime")]),
+                )
+        conn.commit()
+        _ready_tables.add((conn_id, table))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logging.info(f"⚡ {inserted}/{len(df)} observations écrites dans {table} en {elapsed_ms:.0f} ms")
+    return inserted
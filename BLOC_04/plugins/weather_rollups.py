@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Agrégats horaires et journaliers de weather_data, maintenus incrémentalement.
+
+weather_hourly / weather_daily contiennent, par location et par tranche :
+nombre d'observations, moyenne/min/max de temp, pressure, humidity et
+wind_speed, cumul de pluie et weather_main dominant.
+
+Les chargements (sink direct, COPY S3 → Postgres, migration) inscrivent les
+heures touchées (location, bucket) dans la file weather_rollup_queue, dans
+la transaction même de leur INSERT : une heure n'y devient visible qu'avec
+ses lignes, quel que soit l'ordre des commits ou la durée d'un COPY. Chaque
+refresh vide la file (DELETE ... RETURNING) et ne recalcule que ces tranches,
+depuis les lignes brutes, par un INSERT ... ON CONFLICT DO UPDATE. Le tout
+tient dans une transaction : un échec laisse la file en place. File vide :
+aucun recalcul.
+"""
+
+import logging
+
+SOURCE_TABLE = "weather_data"
+
+# File des heures touchées depuis le dernier refresh
+QUEUE_TABLE = "weather_rollup_queue"
+
+# Granularité → (table d'agrégats, unité de date_trunc, durée d'une tranche)
+ROLLUPS = {
+    "hourly": ("weather_hourly", "hour", "1 hour"),
+    "daily": ("weather_daily", "day", "1 day"),
+}
+
+# Mesures agrégées en moyenne / min / max
+MEASURES = ["temp", "pressure", "humidity", "wind_speed"]
+
+# Tranches touchées par le lot (table temporaire de la transaction)
+TOUCHED_TABLE = "weather_rollup_touched"
+
+
+def queue_statements():
+    """File des heures touchées (idempotent) ; créée avec weather_data, avant tout chargement"""
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {QUEUE_TABLE} (
+    location VARCHAR NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    PRIMARY KEY (location, bucket)
+)"""
+    ]
+
+
+def enqueue_sql(source):
+    """Inscrit les heures des lignes de `source` (table, ou unnest(...) AS t(location, datetime))"""
+    return (
+        f"INSERT INTO {QUEUE_TABLE} (location, bucket)"
+        f" SELECT DISTINCT location, date_trunc('hour', datetime) FROM {source}"
+        f" WHERE datetime IS NOT NULL ON CONFLICT DO NOTHING"
+    )
+
+
+def create_statements():
+    """Tables d'agrégats (idempotent)"""
+    measure_columns = "".join(
+        f"    {m}_{agg} DOUBLE PRECISION,\n" for m in MEASURES for agg in ("mean", "min", "max")
+    )
+    statements = [
+        f"""CREATE TABLE IF NOT EXISTS {table} (
+    location VARCHAR NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    n_obs INTEGER NOT NULL,
+{measure_columns}    rain_total DOUBLE PRECISION,
+    weather_main VARCHAR,
+    PRIMARY KEY (location, bucket)
+)"""
+        for table, _, _ in ROLLUPS.values()
+    ]
+    return statements
+
+
+def consume_queue_statements():
+    """File → tranches touchées de la transaction (les lignes consommées quittent la file)"""
+    return [
+        f"CREATE TEMP TABLE {TOUCHED_TABLE} (location VARCHAR, bucket TIMESTAMP) ON COMMIT DROP",
+        f"WITH consumed AS (DELETE FROM {QUEUE_TABLE} RETURNING location, bucket)"
+        f" INSERT INTO {TOUCHED_TABLE} SELECT location, bucket FROM consumed",
+    ]
+
+
+def rollup_sql(granularity):
+    """Recalcul des tranches touchées d'une granularité depuis les lignes brutes"""
+    table, unit, width = ROLLUPS[granularity]
+    measures = ",\n    ".join(
+        f"{agg}(w.{m}) AS {m}_{name}"
+        for m in MEASURES
+        for agg, name in (("avg", "mean"), ("min", "min"), ("max", "max"))
+    )
+    updated = ["n_obs"] + [f"{m}_{name}" for m in MEASURES for name in ("mean", "min", "max")] + [
+        "rain_total", "weather_main",
+    ]
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in updated)
+    return f"""INSERT INTO {table} ({", ".join(["location", "bucket"] + updated)})
+WITH buckets AS (
+    SELECT DISTINCT location, date_trunc('{unit}', bucket) AS bucket FROM {TOUCHED_TABLE}
+)
+SELECT
+    b.location,
+    b.bucket,
+    count(*) AS n_obs,
+    {measures},
+    sum(coalesce(w.rain_1h, 0)) AS rain_total,
+    mode() WITHIN GROUP (ORDER BY w.weather_main) AS weather_main
+FROM buckets b
+JOIN {SOURCE_TABLE} w
+    ON w.location = b.location
+    AND w.datetime >= b.bucket
+    AND w.datetime < b.bucket + interval '{width}'
+GROUP BY b.location, b.bucket
+ON CONFLICT (location, bucket) DO UPDATE SET {updates}"""
+
+
+def refresh_rollups(conn):
+    """Met à jour les agrégats des heures inscrites dans la file depuis le dernier refresh.
+
+    Renvoie {"buckets": heures consommées, "hourly": tranches recalculées, "daily": ...}.
+    """
+    summary = {"buckets": 0, "hourly": 0, "daily": 0}
+    with conn.cursor() as cursor:
+        for statement in queue_statements():
+            cursor.execute(statement)
+        cursor.execute(f"SELECT 1 FROM {QUEUE_TABLE} LIMIT 1")
+        if cursor.fetchone() is None:
+            conn.commit()
+            logging.info("📈 Agrégats météo : rien de nouveau")
+            return summary
+
+        for statement in create_statements():
+            cursor.execute(statement)
+        # Deux refresh concurrents : le second attend les lignes verrouillées par le premier, puis les ignore
+        for statement in consume_queue_statements():
+            cursor.execute(statement)
+        summary["buckets"] = max(cursor.rowcount, 0)
+        for granularity in ROLLUPS:
+            cursor.execute(rollup_sql(granularity))
+            summary[granularity] = max(cursor.rowcount, 0)
+    conn.commit()
+
+    logging.info(f"📈 Agrégats météo : {summary}")
+    return summary
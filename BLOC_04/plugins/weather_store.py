@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage append-only des observations météo sur S3, partitionné par date/heure.
+
+Chaque observation (ou micro-batch) devient un objet indépendant :
+    {prefix}/date=YYYY-MM-DD/hour=HH/{premier_dt}-{dernier_dt}.{csv|parquet}
+L'ingestion n'a jamais besoin de relire l'historique (coût constant), et les
+lecteurs ne listent que les partitions de la plage de temps demandée.
+
+Le format Parquet applique un schéma fixe (mesures float32, datetime en
+timestamp, weather_main dictionnaire) : les lecteurs ne chargent que les
+colonnes et la plage de temps utiles, sans ré-inférer les types.
+"""
+
+import hashlib
+import io
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow optionnel : seul le format CSV reste disponible
+    pa = None
+    pq = None
+
+
+# Colonnes d'une observation, dans l'ordre du CSV historique (+ location en fin)
+OBSERVATION_COLUMNS = [
+    "datetime", "temp", "feels_like", "pressure", "humidity", "dew_point",
+    "clouds", "visibility", "wind_speed", "wind_deg", "rain_1h",
+    "weather_main", "weather_description", "location",
+]
+
+# Location des lignes historiques écrites avant l'ingestion multi-villes
+DEFAULT_LOCATION = "paris"
+
+# Mesures numériques (float32 dans le schéma typé)
+MEASUREMENT_COLUMNS = [
+    "temp", "feels_like", "pressure", "humidity", "dew_point",
+    "clouds", "visibility", "wind_speed", "wind_deg", "rain_1h",
+]
+
+# Schéma Arrow/Parquet fixe des observations
+OBSERVATION_SCHEMA = pa.schema(
+    [("datetime", pa.timestamp("s"))]
+    + [(col, pa.float32()) for col in MEASUREMENT_COLUMNS]
+    + [
+        ("weather_main", pa.dictionary(pa.int32(), pa.string())),
+        ("weather_description", pa.string()),
+        ("location", pa.dictionary(pa.int32(), pa.string())),
+    ]
+) if pa is not None else None
+
+FILE_FORMATS = ("csv", "parquet")
+
+# Préfixe par défaut du store partitionné
+OBSERVATIONS_PREFIX = "observations"
+
+# Nombre de GET S3 en parallèle à la lecture
+READ_WORKERS = 16
+
+# Nombre de PUT S3 en parallèle à l'écriture (backfills : une partition par heure)
+WRITE_WORKERS = 16
+
+_PARTITION_RE = re.compile(r"date=(\d{4}-\d{2}-\d{2})/hour=(\d{2})/")
+
+
+def observation_from_json(raw_data):
+    """Mappe une réponse OpenWeatherMap vers une ligne compatible ML"""
+    return {
+        "datetime": pd.to_datetime(raw_data["dt"], unit="s"),  # dt est timestamp UTC
+        "temp": raw_data["main"]["temp"],
+        "feels_like": raw_data["main"]["feels_like"],
+        "pressure": raw_data["main"]["pressure"],
+        "humidity": raw_data["main"]["humidity"],
+        "dew_point": None,  # Non direct → NaN (calculable mais simplifié)
+        "clouds": raw_data["clouds"]["all"],
+        "visibility": raw_data.get("visibility", None),  # En mètres
+        "wind_speed": raw_data["wind"]["speed"],
+        "wind_deg": raw_data["wind"]["deg"],
+        "rain_1h": raw_data.get("rain", {}).get("1h", 0.0),  # 0 si absent
+        "weather_main": raw_data["weather"][0]["main"],
+        "weather_description": raw_data["weather"][0]["description"],
+        "location": raw_data.get("location", DEFAULT_LOCATION),
+    }
+
+
+def _epoch_seconds(series):
+    """Timestamps → secondes epoch (indépendant de la résolution datetime64)"""
+    return (series - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("pyarrow est requis pour le format parquet")
+
+
+def _file_format(path):
+    """Format déduit de l'extension (.parquet, sinon CSV)"""
+    return "parquet" if str(path).endswith(".parquet") else "csv"
+
+
+def to_observation_table(df):
+    """DataFrame d'observations → table Arrow au schéma fixe"""
+    _require_pyarrow()
+    df = df.reindex(columns=OBSERVATION_COLUMNS)
+    df = df.assign(
+        datetime=pd.to_datetime(df["datetime"]).astype("datetime64[s]"),
+        location=df["location"].fillna(DEFAULT_LOCATION),
+    )
+    for col in MEASUREMENT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return pa.Table.from_pandas(df, schema=OBSERVATION_SCHEMA, preserve_index=False)
+
+
+def serialize_observations(df, file_format="csv"):
+    """Sérialise un DataFrame d'observations en bytes (csv ou parquet)"""
+    if file_format == "parquet":
+        buffer = io.BytesIO()
+        pq.write_table(to_observation_table(df), buffer)
+        return buffer.getvalue()
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def read_history(source, columns=None, start=None, end=None, location=None):
+    """Lit un historique local (csv ou parquet) typé, restreint aux colonnes et à la plage demandées.
+
+    location filtre une seule ville (les lignes antérieures au multi-villes
+    sont attribuées à DEFAULT_LOCATION).
+
+    En Parquet, la projection et le filtre temporel sont poussés au lecteur
+    (row groups hors plage non décodés). En CSV, les types sont imposés à la
+    lecture au lieu d'être inférés puis convertis colonne par colonne.
+    """
+    read_columns = list(columns) if columns is not None else None
+    if read_columns is not None and (start is not None or end is not None) and "datetime" not in read_columns:
+        read_columns.append("datetime")
+
+    if _file_format(source) == "parquet":
+        _require_pyarrow()
+        has_location = "location" in pq.read_schema(source).names
+        filters = []
+        if location is not None and has_location:
+            filters.append(("location", "=", location))
+            if read_columns is not None and "location" not in read_columns:
+                read_columns.append("location")
+        if start is not None:
+            filters.append(("datetime", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("datetime", "<=", pd.Timestamp(end)))
+        table = pq.read_table(source, columns=read_columns, filters=filters or None)
+        df = table.to_pandas()
+    else:
+        usecols = read_columns
+        if location is not None and read_columns is not None:
+            # Colonne location optionnelle (absente des CSV mono-ville)
+            wanted_set = set(read_columns) | {"location"}
+            usecols = lambda c: c in wanted_set  # noqa: E731
+        wanted = read_columns if read_columns is not None else OBSERVATION_COLUMNS
+        dtypes = {col: "float32" for col in MEASUREMENT_COLUMNS if col in wanted}
+        if "weather_main" in wanted:
+            dtypes["weather_main"] = "category"
+        df = pd.read_csv(source, usecols=usecols, dtype=dtypes)
+        if location is not None and "location" in df.columns:
+            df = df[df["location"].fillna(DEFAULT_LOCATION) == location]
+        if "datetime" in df.columns:
+            df["datetime"] = pd.to_datetime(df["datetime"], format="ISO8601")
+        if start is not None:
+            df = df[df["datetime"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["datetime"] <= pd.Timestamp(end)]
+
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+
+def write_history(df, path):
+    """Écrit un historique local complet (format déduit de l'extension)"""
+    if _file_format(path) == "parquet":
+        _require_pyarrow()
+        pq.write_table(to_observation_table(df), path)
+    else:
+        df.to_csv(path, index=False, header=True)
+
+
+def partition_prefix(prefix, ts):
+    """Préfixe S3 de la partition date/heure contenant ts"""
+    ts = pd.Timestamp(ts)
+    return f"{prefix}/date={ts:%Y-%m-%d}/hour={ts:%H}/"
+
+
+def partition_object_key(part, prefix=OBSERVATIONS_PREFIX, file_format="csv"):
+    """Clé de l'objet contenant les observations d'une même heure.
+
+    Plage de dt + empreinte des clés (location, dt) du lot : deux villes
+    observées à la même heure (exports horaires, batch multi-villes) donnent
+    deux objets distincts, le même lot réécrit le même objet.
+    """
+    datetimes = pd.to_datetime(part["datetime"])
+    epochs = _epoch_seconds(datetimes)
+    locations = part["location"].fillna(DEFAULT_LOCATION) if "location" in part else [DEFAULT_LOCATION] * len(part)
+    keys = sorted(f"{location}:{epoch}" for location, epoch in zip(locations, epochs))
+    digest = hashlib.sha1("\n".join(keys).encode()).hexdigest()[:8]
+    return f"{partition_prefix(prefix, datetimes.min())}{epochs.min()}-{epochs.max()}-{digest}.{file_format}"
+
+
+def write_partitioned(df, s3_client, bucket, prefix=OBSERVATIONS_PREFIX, file_format="csv"):
+    """Écrit un micro-batch, un objet par partition date/heure touchée.
+
+    Le nom d'objet dépend uniquement des dt contenus : ré-écrire la même
+    observation écrase le même objet (idempotent en cas de retry).
+    """
+    df = df.assign(datetime=pd.to_datetime(df["datetime"]))
+    parts = [part for _, part in df.groupby(df["datetime"].dt.floor("h"), sort=True)]
+
+    def _write(part):
+        key = partition_object_key(part, prefix, file_format)
+        s3_client.put_object(
+            Bucket=bucket, Key=key, Body=serialize_observations(part, file_format)
+        )
+        return key
+
+    if len(parts) <= 1:
+        keys = [_write(part) for part in parts]
+    else:
+        with ThreadPoolExecutor(max_workers=min(WRITE_WORKERS, len(parts))) as pool:
+            keys = list(pool.map(_write, parts))
+
+    if len(keys) <= 3:
+        for key, part in zip(keys, parts):
+            logging.info(f"Partition écrite : s3://{bucket}/{key} ({len(part)} lignes)")
+    else:
+        logging.info(f"{len(keys)} partitions écrites sous s3://{bucket}/{prefix}/ ({len(df)} lignes)")
+    return keys
+
+
+def list_partition_keys(s3_client, bucket, prefix=OBSERVATIONS_PREFIX, start=None, end=None):
+    """Liste les objets des partitions qui recoupent [start, end].
+
+    Sans start, tout le préfixe est listé ; sinon un LIST par jour de la plage.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    if start is None:
+        list_prefixes = [f"{prefix}/"]
+    else:
+        last_day = (end if end is not None else pd.Timestamp.now(tz="UTC").tz_localize(None)).normalize()
+        days = pd.date_range(start.normalize(), last_day, freq="D")
+        list_prefixes = [f"{prefix}/date={day:%Y-%m-%d}/" for day in days]
+
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = []
+    for list_prefix in list_prefixes:
+        for page in paginator.paginate(Bucket=bucket, Prefix=list_prefix):
+            for obj in page.get("Contents", []):
+                match = _PARTITION_RE.search(obj["Key"])
+                if not match:
+                    continue
+                hour = pd.Timestamp(f"{match.group(1)} {match.group(2)}:00:00")
+                if start is not None and hour < start.floor("h"):
+                    continue
+                if end is not None and hour > end:
+                    continue
+                keys.append(obj["Key"])
+    return sorted(keys)
+
+
+def read_partitions(s3_client, bucket, keys, columns=None):
+    """Lit et concatène une liste d'objets partitionnés (GET en parallèle).
+
+    Les objets antérieurs au multi-villes n'ont pas de colonne location :
+    elle est complétée avec DEFAULT_LOCATION.
+    """
+    def _read(key):
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        if _file_format(key) == "parquet":
+            _require_pyarrow()
+            present = pq.read_schema(io.BytesIO(body)).names
+            read_columns = [c for c in columns if c in present] if columns is not None else None
+            return pq.read_table(io.BytesIO(body), columns=read_columns).to_pandas()
+        usecols = (lambda c: c in columns) if columns is not None else None
+        return pd.read_csv(io.BytesIO(body), usecols=usecols)
+
+    if not keys:
+        return pd.DataFrame(columns=columns or OBSERVATION_COLUMNS)
+
+    with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(keys))) as pool:
+        frames = list(pool.map(_read, keys))
+
+    df = pd.concat(frames, ignore_index=True)
+    if "datetime" in df.columns:
+        df["datetime"] = pd.to_datetime(df["datetime"], format="ISO8601")
+    if columns is None or "location" in columns:
+        location = df["location"] if "location" in df.columns else pd.Series(index=df.index, dtype=object)
+        df["location"] = location.astype(object).fillna(DEFAULT_LOCATION)
+    return df
+
+
+def read_time_range(s3_client, bucket, prefix=OBSERVATIONS_PREFIX, start=None, end=None, columns=None,
+                    location=None):
+    """Lit les observations de [start, end] (d'une seule ville si location), triées par datetime"""
+    if columns is not None:
+        columns = list(columns)
+        for required in ("datetime", "location") if location is not None else ("datetime",):
+            if required not in columns:
+                columns.append(required)
+    keys = list_partition_keys(s3_client, bucket, prefix, start=start, end=end)
+    logging.info(f"{len(keys)} partitions à lire sous s3://{bucket}/{prefix}/")
+    df = read_partitions(s3_client, bucket, keys, columns=columns)
+
+    if location is not None:
+        df = df[df["location"] == location]
+    if start is not None:
+        df = df[df["datetime"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["datetime"] <= pd.Timestamp(end)]
+    return df.sort_values("datetime").reset_index(drop=True)
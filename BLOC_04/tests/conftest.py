@@ -15,6 +15,9 @@ _airflow_modules = [
     "airflow.providers.amazon.aws",
     "airflow.providers.amazon.aws.hooks",
     "airflow.providers.amazon.aws.hooks.s3",
+    "airflow.providers.postgres",
+    "airflow.providers.postgres.hooks",
+    "airflow.providers.postgres.hooks.postgres",
 ]
 
 for mod_name in _airflow_modules:
@@ -368,3 +371,14 @@ def reset_random_seed():
     np.random.seed(42)
     yield
     np.random.seed()
+
+
+@pytest.fixture(autouse=True)
+def isolated_openweather_state(tmp_path, monkeypatch):
+    """Cache, quota, états d'ingestion / glissant et journal propres à chaque test (jamais ceux du worker)"""
+    monkeypatch.setenv("OPENWEATHER_CACHE_PATH", str(tmp_path / "openweather_cache.sqlite"))
+    monkeypatch.setenv("OPENWEATHER_QUOTA_PATH", str(tmp_path / "openweather_quota.sqlite"))
+    monkeypatch.setenv("WEATHER_INGESTION_STATE_PATH", str(tmp_path / "ingestion_state.sqlite"))
+    monkeypatch.setenv("WEATHER_BUFFER_PATH", str(tmp_path / "weather_buffer.sqlite"))
+    monkeypatch.setenv("WEATHER_ROLLING_STATE_PATH", str(tmp_path / "rolling_state.pkl"))
+    yield
@@ -1,20 +1,26 @@
-import json
 import logging
-import os  # Pour os.path.exists et os.environ
 from datetime import datetime
 
-import pandas as pd
-import requests
 from airflow import DAG
-from airflow.models import Variable
+from airflow.exceptions import AirflowSkipException
+from airflow.models.xcom_arg import XComArg
 from airflow.operators.python import PythonOperator
-from airflow.providers.amazon.aws.hooks.s3 import S3Hook
-from airflow.providers.common.sql.operators.sql import SQLExecuteQueryOperator
+from airflow.providers.postgres.hooks.postgres import PostgresHook
 from airflow.providers.standard.operators.trigger_dagrun import TriggerDagRunOperator
 
 
 # Plugin custom (doit être placé dans plugins/s3_to_postgres.py)
 from s3_to_postgres import S3ToPostgresOperator
+# Callables de l'ETL (fetch multi-locations, journal, sink) : plugins/weather_ingestion.py
+import weather_ingestion
+from weather_store import OBSERVATIONS_PREFIX
+from weather_partitions import (
+    MONTHS_AHEAD,
+    WEATHER_DATA_COLUMN_TYPES,
+    ensure_table,
+    maintain_partitions,
+)
+from weather_rollups import enqueue_sql, refresh_rollups
 
 
 default_args = {
@@ -22,117 +28,55 @@ default_args = {
     "start_date": datetime(2022, 6, 1),
 }
 
-# Coordonnées de Paris
-LAT = 48.8566
-LON = 2.3522
 
-def setup_aws_environment():
-    """Configure les credentials AWS via Variables Airflow (similaire au DAG ML)"""
+def _create_weather_table(**context):
+    """Table weather_data partitionnée prête pour le chargement (ancienne table classique migrée)"""
+    conn = PostgresHook(postgres_conn_id="neon_db_conn").get_conn()
     try:
-        os.environ["AWS_ACCESS_KEY_ID"] = Variable.get("AWS_ACCESS_KEY_ID")
-        os.environ["AWS_SECRET_ACCESS_KEY"] = Variable.get("AWS_SECRET_ACCESS_KEY")
-        os.environ["AWS_DEFAULT_REGION"] = Variable.get("AWS_DEFAULT_REGION")
-        logging.info("✓ AWS environment configured from Airflow Variables")
-    except Exception as e:
-        logging.error(f"❌ AWS setup failed: {str(e)}")
-        raise
-
-# Appeler l’API OpenWeatherMap pour obtenir les données météo actuelles de Paris.
-# Le JSON reste local (pas d'upload S3 redondant).
-
-def _fetch_weather_data(**context):
-    """Appelle l'API OpenWeatherMap et retourne le JSON local"""
-    logging.info("Fetching weather data from OpenWeatherMap")
-    api_key = Variable.get("OPEN_WEATHER_API_KEY")  # Assumé comme Variable Airflow
-
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={LAT}&lon={LON}&appid={api_key}&units=metric"
-    resp = requests.get(url)
-    if resp.status_code != 200:
-        raise ValueError(f"Erreur API : {resp.status_code} - {resp.text}")
-
-    filename = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}_weather.json"
-    local_path = f"/tmp/{filename}"
-   
-    with open(local_path, "w") as f:
-        json.dump(resp.json(), f)
-    
-    # Push le chemin local du JSON via XCom (pour la tâche suivante)
-    context["ti"].xcom_push(key="local_json_path", value=local_path)
-    logging.info(f"JSON saved locally: {local_path}")
-    # Pas d'upload S3 pour JSON → allégé !
-
-# Télécharger/transformer le JSON local, append au CSV existant sur S3, et upload le CSV mis à jour.
-def _transform_and_append_weather_data(**context):
-    """Transforme le JSON en ligne, append au CSV S3, et upload le CSV final"""
-    # Setup AWS en premier (pour S3Hook)
-    setup_aws_environment()
-    
-    bucket = Variable.get("BUCKET")
-    csv_key = "weather_paris_fect.csv"  # Key fixe pour accumulation
-    
-    # Pull le chemin JSON local via XCom
-    local_json = context["ti"].xcom_pull(task_ids="fetch_weather_data", key="local_json_path")
-    
-    if not local_json or not os.path.exists(local_json):
-        raise ValueError("Impossible de récupérer le JSON local")
-    
-    logging.info(f"DEBUG: Processing {local_json} | Bucket: {bucket} | CSV Key: {csv_key}")
-    
-    # Téléchargement du JSON local
-    with open(local_json, "r") as f:
-        raw_data = json.load(f)
-
-    # Mapping direct vers colonnes compatibles ML (OpenWeatherMap natif)
-    new_row = {
-        "datetime": pd.to_datetime(raw_data["dt"], unit="s"),  # dt est timestamp UTC
-        "temp": raw_data["main"]["temp"],
-        "feels_like": raw_data["main"]["feels_like"],
-        "pressure": raw_data["main"]["pressure"],
-        "humidity": raw_data["main"]["humidity"],
-        "dew_point": None,  # Non direct → NaN (calculable mais simplifié)
-        "clouds": raw_data["clouds"]["all"],
-        "visibility": raw_data.get("visibility", None),  # En mètres
-        "wind_speed": raw_data["wind"]["speed"],
-        "wind_deg": raw_data["wind"]["deg"],
-        "rain_1h": raw_data.get("rain", {}).get("1h", 0.0),  # 0 si absent
-        "weather_main": raw_data["weather"][0]["main"],
-        "weather_description": raw_data["weather"][0]["description"],
-    }
-    new_df = pd.DataFrame([new_row])
+        if ensure_table(conn):
+            logging.info("🔀 Ancienne table weather_data migrée avant le chargement")
+    finally:
+        conn.close()
+
 
-    # Download CSV existant de S3 (ou gérer premier run)
-    local_csv = f"/tmp/{csv_key}"
+def _maintain_weather_partitions(months_ahead=MONTHS_AHEAD, retention_months=0, **context):
+    """Crée les partitions à venir de weather_data, vide DEFAULT, archive les plus anciennes"""
+    conn = PostgresHook(postgres_conn_id="neon_db_conn").get_conn()
     try:
-        S3Hook(aws_conn_id="aws_default").download_file(key=csv_key, bucket_name=bucket, local_path="/tmp")
-        existing_df = pd.read_csv(local_csv)
-        logging.info(f"CSV existant chargé : {len(existing_df)} lignes")
-        
-        # Check doublon : éviter append si datetime déjà présent (convert to str pour comparaison)
-        new_datetime_str = new_df['datetime'].iloc[0].strftime('%Y-%m-%d %H:%M:%S')
-        existing_datetimes = pd.to_datetime(existing_df['datetime']).dt.strftime('%Y-%m-%d %H:%M:%S')
-        if new_datetime_str in existing_datetimes.values:
-            logging.warning("Ligne déjà présente (doublon évité)")
-            existing_df.to_csv(local_csv, index=False, header=True)  # Ré-upload inchangé
-            updated_df = existing_df  # Correction: set updated_df ici
-        else:
-            # Append
-            updated_df = pd.concat([existing_df, new_df], ignore_index=True)
-            updated_df.to_csv(local_csv, index=False, header=True)
-            logging.info(f"Nouvelle ligne appendée : total {len(updated_df)} lignes")
-    except Exception as e:  # Premier run ou fichier absent
-        logging.info(f"Premier run ou CSV absent : création avec {len(new_df)} lignes | Erreur: {e}")
-        new_df.to_csv(local_csv, index=False, header=True)
-        updated_df = new_df  # Pour logs
-
-    # Upload du CSV mis à jour sur S3
-    S3Hook(aws_conn_id="aws_default").load_file(
-        filename=local_csv, key=csv_key, bucket_name=bucket, replace=True
-    )
+        summary = maintain_partitions(
+            conn,
+            now=context.get("data_interval_end"),
+            months_ahead=int(months_ahead),
+            retention_months=int(retention_months),
+        )
+    finally:
+        conn.close()
+    context["ti"].xcom_push(key="partition_maintenance", value=summary)
+
+
+# Tâches amont qui chargent weather_data : (task_id, clé XCom du nombre de lignes écrites)
+ETL_LOAD_XCOMS = [
+    ("transfer_weather_data_to_postgres", "return_value"),
+    ("transform_and_append_weather_data", "rows_inserted"),  # Sink direct
+]
+
+
+def _refresh_weather_rollups(load_xcoms=ETL_LOAD_XCOMS, **context):
+    """Recalcule les agrégats horaires/journaliers des tranches touchées par les nouvelles lignes.
+
+    Aucune ligne chargée en amont (doublons, flush non dû, CSV sans transfert) :
+    tâche sautée sans ouvrir de connexion.
+    """
+    loaded = [context["ti"].xcom_pull(task_ids=task_id, key=key) for task_id, key in load_xcoms]
+    if not any(loaded):
+        raise AirflowSkipException("Aucune ligne chargée en amont : agrégats inchangés")
+    conn = PostgresHook(postgres_conn_id="neon_db_conn").get_conn()
+    try:
+        summary = refresh_rollups(conn)
+    finally:
+        conn.close()
+    context["ti"].xcom_push(key="rollups", value=summary)
 
-    # Push la key CSV fixe via XCom (pour DB)
-    context["ti"].xcom_push(key="weather_csv_key", value=csv_key)
-    logging.info(f"CSV mis à jour uploadé sur S3: s3://{bucket}/{csv_key}")
-    logging.info(f"Colonnes: {list(updated_df.columns)}")
 
 with DAG(
     dag_id="etl_weather_dag",
@@ -142,50 +86,170 @@ with DAG(
     tags=["weather"],
 ) as dag:
 
+    # WEATHER_LOCATIONS : {"paris": {"lat": 48.8566, "lon": 2.3522, "name": "Paris"}, ...}
+    # WEATHER_FETCH_CONCURRENCY : appels API simultanés au maximum
     fetch_weather_data = PythonOperator(
         task_id="fetch_weather_data", 
-        python_callable=_fetch_weather_data
+        python_callable=weather_ingestion.fetch_weather_data,
+        op_kwargs={
+            "locations": "{{ var.value.get('WEATHER_LOCATIONS', '') }}",
+            "max_workers": "{{ var.value.get('WEATHER_FETCH_CONCURRENCY', 8) }}",
+        },
     )
 
+    # WEATHER_STORAGE_MODE : "csv" (fichier unique, défaut) ou "partitioned" (append-only)
+    # WEATHER_FILE_FORMAT : "csv" (défaut) ou "parquet" (schéma typé)
+    # WEATHER_BUFFERED : "true" → journal local, expédié par flush_weather_buffer
+    # WEATHER_SINK : "s3" (défaut) ou "direct" → écriture immédiate dans weather_data,
+    # l'export S3 passant par weather_s3_export_dag
+    storage_kwargs = {
+        "storage_mode": "{{ var.value.get('WEATHER_STORAGE_MODE', 'csv') }}",
+        "file_format": "{{ var.value.get('WEATHER_FILE_FORMAT', 'csv') }}",
+        "buffered": "{{ var.value.get('WEATHER_BUFFERED', 'false') }}",
+        "sink": "{{ var.value.get('WEATHER_SINK', 's3') }}",
+    }
     transform_and_append_weather_data = PythonOperator(
         task_id="transform_and_append_weather_data", 
-        python_callable=_transform_and_append_weather_data
+        python_callable=weather_ingestion.transform_and_append_weather_data,
+        op_kwargs=storage_kwargs,
+    )
+
+    # Flush toutes les WEATHER_FLUSH_MINUTES minutes ou WEATHER_FLUSH_ROWS lignes.
+    # none_failed : évalué à chaque run, même quand le fetch n'a rien de nouveau.
+    flush_weather_buffer = PythonOperator(
+        task_id="flush_weather_buffer",
+        python_callable=weather_ingestion.flush_weather_buffer,
+        op_kwargs={
+            **storage_kwargs,
+            "flush_minutes": "{{ var.value.get('WEATHER_FLUSH_MINUTES', 15) }}",
+            "flush_rows": "{{ var.value.get('WEATHER_FLUSH_ROWS', 100) }}",
+        },
+        trigger_rule="none_failed",
     )
     
-    # Créer la table avec UNIQUE sur datetime pour éviter doublons à l'insert.
-    create_weather_table = SQLExecuteQueryOperator(
+    # Créer la table avec UNIQUE sur (location, datetime) pour éviter doublons à l'insert.
+    # Table partitionnée par mois + index BRIN (DDL : plugins/weather_partitions.py) ;
+    # une ancienne table non partitionnée (sans cette contrainte) est migrée ici.
+    create_weather_table = PythonOperator(
         task_id="create_weather_table",
-        sql="""
-        CREATE TABLE IF NOT EXISTS weather_data (
-            id SERIAL PRIMARY KEY,
-            datetime TIMESTAMP UNIQUE,  -- UNIQUE pour dedup
-            temp DECIMAL(5, 2),
-            feels_like DECIMAL(5, 2),
-            pressure DECIMAL(5, 2),
-            humidity DECIMAL(5, 2),
-            clouds DECIMAL(5, 2),
-            visibility DECIMAL(5, 2),
-            wind_speed DECIMAL(5, 2),
-            wind_deg DECIMAL(5, 2),
-            rain_1h DECIMAL(5, 2),
-            weather_main VARCHAR,
-            weather_description VARCHAR
-        )
-        """,
-        conn_id="neon_db_conn",
+        python_callable=_create_weather_table,
     )
     
-    # Insert du CSV full, mais avec dedup via UNIQUE constraint (assume custom operator gère INSERT ... ON CONFLICT DO NOTHING)
+    # Chargement incrémental (COPY) : seules les lignes postérieures au MAX(datetime) de leur location,
+    # fusionnées via une table de staging avec INSERT ... ON CONFLICT (location, datetime) DO NOTHING
     transfer_weather_data_to_postgres = S3ToPostgresOperator(
         task_id="transfer_weather_data_to_postgres",
         table="weather_data",
         bucket="{{ var.value.BUCKET }}",
-        key="{{ ti.xcom_pull(task_ids='transform_and_append_weather_data', key='weather_csv_key') }}",
+        # XComArg : la liste des partitions du lot arrive telle quelle (pas rendue en chaîne)
+        key=XComArg(flush_weather_buffer, key="weather_csv_key"),
         postgres_conn_id="neon_db_conn",
         aws_conn_id="aws_default",
+        load_mode="incremental",
+        header=0,
+        partition_column="location",
+        loader="copy",
+        chunksize=50000,  # Streaming : mémoire bornée quelle que soit la taille de l'historique
+        on_conflict="nothing",
+        conflict_columns=["location", "datetime"],
+        column_types=WEATHER_DATA_COLUMN_TYPES,
+        # Heures chargées → file des agrégats, dans la transaction du chargement
+        post_merge_sql=enqueue_sql("weather_data_staging"),
     )
 
-
+    # Agrégats horaires / journaliers (weather_hourly, weather_daily) pour l'analyse.
+    # none_failed_min_one_success : aussi après le sink direct (chargement S3 → Postgres
+    # sauté), mais sautée quand tout l'amont l'est (fetch sans nouvelle observation).
+    refresh_weather_rollups = PythonOperator(
+        task_id="refresh_weather_rollups",
+        python_callable=_refresh_weather_rollups,
+        trigger_rule="none_failed_min_one_success",
+    )
 
     # Flux sans trigger_ml_dag
-    fetch_weather_data >> transform_and_append_weather_data >> create_weather_table >> transfer_weather_data_to_postgres 
\ No newline at end of file
+    fetch_weather_data >> transform_and_append_weather_data >> flush_weather_buffer >> create_weather_table >> transfer_weather_data_to_postgres
+    transfer_weather_data_to_postgres >> refresh_weather_rollups
+    transform_and_append_weather_data >> refresh_weather_rollups
+
+
+# Backfill à la demande (déclenché avec une conf "sources") : l'entraînement
+# lit ensuite le store partitionné via la conf "partition_prefix" du DAG ML.
+with DAG(
+    dag_id="weather_backfill_dag",
+    default_args=default_args,
+    schedule=None,
+    catchup=False,
+    tags=["weather", "backfill"],
+) as backfill_dag:
+
+    backfill_weather_history = PythonOperator(
+        task_id="backfill_weather_history",
+        python_callable=weather_ingestion.backfill_weather_history,
+        op_kwargs={"file_format": "{{ var.value.get('WEATHER_FILE_FORMAT', 'csv') }}"},
+    ) 
+
+    # Chargement des partitions en base : parallèle, objets déjà chargés ignorés (journal s3_load_log)
+    load_backfill_to_postgres = S3ToPostgresOperator(
+        task_id="load_backfill_to_postgres",
+        table="weather_data",
+        bucket="{{ var.value.BUCKET }}",
+        key=f"{OBSERVATIONS_PREFIX}/",
+        postgres_conn_id="neon_db_conn",
+        aws_conn_id="aws_default",
+        header=0,
+        loader="copy",
+        on_conflict="nothing",
+        conflict_columns=["location", "datetime"],
+        column_types=WEATHER_DATA_COLUMN_TYPES,
+        # Heures chargées → file des agrégats, dans la transaction du chargement
+        post_merge_sql=enqueue_sql("weather_data_staging"),
+    )
+
+    refresh_backfill_rollups = PythonOperator(
+        task_id="refresh_weather_rollups",
+        python_callable=_refresh_weather_rollups,
+        op_kwargs={"load_xcoms": [("load_backfill_to_postgres", "return_value")]},
+    )
+
+    backfill_weather_history >> load_backfill_to_postgres >> refresh_backfill_rollups
+
+
+# Maintenance quotidienne des partitions mensuelles de weather_data
+with DAG(
+    dag_id="weather_partition_maintenance_dag",
+    default_args=default_args,
+    schedule="@daily",
+    catchup=False,
+    tags=["weather", "maintenance"],
+) as partition_maintenance_dag:
+
+    maintain_weather_partitions = PythonOperator(
+        task_id="maintain_weather_partitions",
+        python_callable=_maintain_weather_partitions,
+        op_kwargs={
+            "months_ahead": "{{ var.value.get('WEATHER_PARTITION_MONTHS_AHEAD', '3') }}",
+            "retention_months": "{{ var.value.get('WEATHER_RETENTION_MONTHS', '0') }}",
+        },
+    )
+
+
+# Export S3 asynchrone du sink direct (WEATHER_SINK="direct") : le journal
+# local est expédié par lots vers l'historique S3 lu par l'entraînement.
+with DAG(
+    dag_id="weather_s3_export_dag",
+    default_args=default_args,
+    schedule="*/15 * * * *",
+    catchup=False,
+    max_active_runs=1,
+    tags=["weather", "export"],
+) as s3_export_dag:
+
+    export_weather_buffer = PythonOperator(
+        task_id="export_weather_buffer",
+        python_callable=weather_ingestion.export_weather_buffer,
+        op_kwargs={
+            "storage_mode": "{{ var.value.get('WEATHER_STORAGE_MODE', 'csv') }}",
+            "file_format": "{{ var.value.get('WEATHER_FILE_FORMAT', 'csv') }}",
+            "sink": "{{ var.value.get('WEATHER_SINK', 's3') }}",
+        },
+    )
@@ -26,8 +26,10 @@ def test_dag_loads_correctly():
     expected_tasks = {
         "fetch_weather_data",
         "transform_and_append_weather_data",
+        "flush_weather_buffer",
         "create_weather_table",
         "transfer_weather_data_to_postgres",
+        "refresh_weather_rollups",
     }
     actual_tasks = set(dag.task_dict.keys())
     assert actual_tasks == expected_tasks
@@ -49,8 +51,10 @@ def test_dag_dependencies():
 
     expected_deps = {
         "fetch_weather_data": ["transform_and_append_weather_data"],
-        "transform_and_append_weather_data": ["create_weather_table"],
+        "transform_and_append_weather_data": ["flush_weather_buffer", "refresh_weather_rollups"],
+        "flush_weather_buffer": ["create_weather_table", "transfer_weather_data_to_postgres"],
         "create_weather_table": ["transfer_weather_data_to_postgres"],
+        "transfer_weather_data_to_postgres": ["refresh_weather_rollups"],
     }
 
     for upstream, downstreams in expected_deps.items():
@@ -211,6 +211,137 @@ class TestForecast6hDataPreparation:
         assert df['datetime'].is_monotonic_increasing
 
 
+# ============================================================================
+# TESTS UNITAIRES - Cibles multi-horizons
+# ============================================================================
+
+class TestMultiHorizonTargets:
+    """Tests des cibles de tous les horizons, construites en une passe"""
+    
+    @pytest.fixture
+    def pipeline(self):
+        import paris_meteo_ml_pipeline
+        return paris_meteo_ml_pipeline
+    
+    def test_parse_horizons(self, pipeline):
+        """Liste, chaîne ou JSON → horizons triés et uniques ; vide → défaut"""
+        assert pipeline.parse_horizons("6,1, 24") == [1, 6, 24]
+        assert pipeline.parse_horizons("[3, 3, 12]") == [3, 12]
+        assert pipeline.parse_horizons("") == pipeline.FORECAST_HORIZONS
+        with pytest.raises(ValueError):
+            pipeline.parse_horizons("0,6")
+    
+    def test_horizon_targets_match_shift_on_hourly_data(self, pipeline):
+        """Données horaires régulières : la jointure as-of équivaut au shift(-h)"""
+        df = pd.DataFrame({
+            'datetime': pd.date_range('2024-01-01', periods=50, freq='H'),
+            'weather_main': np.random.choice(['Clear', 'Rain'], 50),
+        })
+        targets = pipeline.horizon_targets(df, [1, 6, 24])
+        
+        for h in (1, 6, 24):
+            expected = df['weather_main'].shift(-h)
+            assert list(targets[h][:-h]) == list(expected[:-h])
+            assert all(t is None for t in targets[h][-h:])
+    
+    def test_horizon_targets_follow_time_not_rows(self, pipeline):
+        """Données à la minute avec trous : la cible est l'observation à t + 6h, pas 6 lignes plus loin"""
+        times = pd.date_range('2024-01-01', periods=60, freq='min')
+        times = times.append(pd.DatetimeIndex(['2024-01-01 01:10']))
+        times = times.append(pd.date_range('2024-01-01 06:00:20', periods=60, freq='min'))
+        df = pd.DataFrame({'datetime': times, 'weather_main': ['Clear'] * 61 + ['Rain'] * 60})
+        
+        targets = pipeline.horizon_targets(df, [6], tolerance='5min')[6]
+        
+        assert targets[0] == 'Rain'  # 00:00 → 06:00:20
+        assert targets[59] == 'Rain'  # 00:59 → 06:59:20
+        assert targets[60] is None  # 01:10 → rien vers 07:10
+        assert all(t is None for t in targets[61:])
+    
+    def test_horizon_targets_per_location(self, pipeline):
+        """La cible est prise dans la même location"""
+        df = pd.DataFrame({
+            'datetime': pd.to_datetime(['2024-01-01 00:00', '2024-01-01 00:00', '2024-01-01 01:00']),
+            'location': ['paris', 'lyon', 'lyon'],
+            'weather_main': ['Clear', 'Clouds', 'Rain'],
+        })
+        
+        targets = pipeline.horizon_targets(df, [1], by='location')[1]
+        
+        assert list(targets) == [None, 'Rain', None]
+        with pytest.raises(ValueError):
+            pipeline.horizon_targets(df, [1], tolerance='1h')
+    
+    def test_prepare_writes_one_matrix_for_all_horizons(self, pipeline, tmp_path, monkeypatch):
+        """Une seule matrice de features, une cible et un encodeur par horizon"""
+        n = 60
+        np.random.seed(0)
+        features = pd.DataFrame(
+            np.random.rand(n, len(pipeline.FEATURE_COLUMNS)).astype(np.float32), columns=pipeline.FEATURE_COLUMNS
+        )
+        features.insert(0, 'datetime', pd.date_range('2024-01-01', periods=n, freq='H'))
+        features['weather_main'] = np.random.choice(['Clear', 'Clouds', 'Rain'], n)
+        csv_path = tmp_path / "weather.csv"
+        csv_path.write_text("")
+        monkeypatch.setattr(pipeline, "MODEL_PATH", str(tmp_path))
+        monkeypatch.setattr(pipeline, "load_training_features", lambda path, conf: features.copy())
+        ti = MagicMock()
+        ti.xcom_pull.return_value = str(csv_path)
+        
+        pipeline.prepare_data_6h(ti=ti, dag_run=MagicMock(conf={"horizons": "1,6", "target_tolerance": "30min"}))
+        
+        df = pd.read_pickle(tmp_path / "data_forecast.pkl")
+        assert list(df.columns[:17]) == pipeline.FEATURE_COLUMNS
+        assert (df['weather_6h_encoded'] == -1).sum() == 6
+        assert (df['weather_1h_encoded'] == -1).sum() == 1
+        assert (tmp_path / "label_encoder_1h.pkl").exists() and (tmp_path / "label_encoder_6h.pkl").exists()
+        ti.xcom_push.assert_called_once_with(key="forecast_horizons", value=[1, 6])
+
+    
+    def test_prepare_ignores_missing_labels(self, pipeline, tmp_path, monkeypatch):
+        """Labels absents (null du store) : ni classe "nan" dans l'encodeur, ni ligne d'entraînement"""
+        n = 60
+        np.random.seed(1)
+        features = pd.DataFrame(
+            np.random.rand(n, len(pipeline.FEATURE_COLUMNS)).astype(np.float32), columns=pipeline.FEATURE_COLUMNS
+        )
+        features.insert(0, 'datetime', pd.date_range('2024-01-01', periods=n, freq='H'))
+        features['weather_main'] = pd.Series(np.random.choice(['Clear', 'Rain'], n), dtype=object)
+        features.loc[10:19, 'weather_main'] = None
+        csv_path = tmp_path / "weather.csv"
+        csv_path.write_text("")
+        monkeypatch.setattr(pipeline, "MODEL_PATH", str(tmp_path))
+        monkeypatch.setattr(pipeline, "load_training_features", lambda path, conf: features.copy())
+        ti = MagicMock()
+        ti.xcom_pull.return_value = str(csv_path)
+        
+        pipeline.prepare_data_6h(ti=ti, dag_run=MagicMock(conf={"horizons": "1", "target_tolerance": "30min"}))
+        
+        df = pd.read_pickle(tmp_path / "data_forecast.pkl")
+        with open(tmp_path / "label_encoder_1h.pkl", 'rb') as f:
+            le = pickle.load(f)
+        assert list(le.classes_) == ['Clear', 'Rain']
+        assert len(df) == n - 10
+    
+    def test_forecast_reads_history_of_the_run_location(self, pipeline, monkeypatch):
+        """Prévision sur la ville de la conf, comme l'entraînement (pas Paris par défaut)"""
+        calls = []
+        
+        def read_history(path, columns=None, location=None):
+            calls.append(location)
+            raise RuntimeError("arrêt après la lecture")
+        
+        monkeypatch.setattr(pipeline, "read_history", read_history)
+        ti = MagicMock()
+        ti.xcom_pull.side_effect = lambda task_ids, key: [6] if key == "forecast_horizons" else "/tmp/weather.csv"
+        
+        with pytest.raises(RuntimeError):
+            pipeline.generate_6h_forecast(ti=ti, dag_run=MagicMock(conf={"location": "lyon"}))
+        
+        assert calls == ["lyon"]
+        assert pipeline.training_location({"location": "lyon"}) == "lyon"
+        assert pipeline.training_location({}) == pipeline.TRAINING_LOCATION
+
 # ============================================================================
 # TESTS UNITAIRES - Entraînement des modèles
 # ============================================================================
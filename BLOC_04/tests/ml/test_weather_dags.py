@@ -66,8 +66,10 @@ sys.modules["airflow.models.Variable"].Variable = MockVariable
 
 from realtime_prediction_forecast import (
     preprocess_weather_json,
+    select_model_inputs,
     WEATHER_CODE_MAPPING
 )
+from rolling_features import ROLLING_COLUMNS, RollingState
 
 # ============================================================================
 # TESTS UNITAIRES - Prétraitement des données
@@ -128,7 +130,7 @@ class TestPreprocessWeatherJson:
         """Test l'extraction correcte des features de base"""
         result = preprocess_weather_json(sample_api_response, model_type='historical')
         assert result['temp'].iloc[0] == 15.5
-        assert result['feels_like'].iloc[0] == 14.2
+        assert result['feels_like'].iloc[0] == pytest.approx(14.2)  # float32
         assert result['pressure'].iloc[0] == 1013
         assert result['humidity'].iloc[0] == 65
         assert result['wind_speed'].iloc[0] == 3.5
@@ -173,6 +175,35 @@ class TestPreprocessWeatherJson:
         for col in result.columns:
             assert pd.api.types.is_numeric_dtype(result[col])
     
+    def test_preprocess_adds_rolling_features_with_state(self, sample_api_response):
+        """Avec un état glissant : 17 features + features glissantes, état mis à jour"""
+        state = RollingState()
+        earlier = {**sample_api_response, "dt": sample_api_response["dt"] - 3600,
+                   "main": {**sample_api_response["main"], "pressure": 1010}}
+        preprocess_weather_json(earlier, rolling_state=state, locations=["paris"])
+        
+        result = preprocess_weather_json(sample_api_response, rolling_state=state, locations=["paris"])
+        
+        assert result.shape[1] == 17 + len(ROLLING_COLUMNS)
+        assert result["pressure_tendency_3h"].iloc[0] == 3.0
+        assert result["humidity_mean_1h"].iloc[0] == 65.0
+    
+    def test_select_model_inputs_follows_signature(self, sample_api_response):
+        """Colonnes prises du schéma MLflow ; sans signature, les 17 features"""
+        df = preprocess_weather_json(sample_api_response, rolling_state=RollingState())
+        model = MagicMock()
+        model.metadata.get_input_schema.return_value.input_names.return_value = ["pressure_tendency_3h", "temp"]
+        
+        assert list(select_model_inputs(model, df).columns) == ["pressure_tendency_3h", "temp"]
+        
+        model.metadata.get_input_schema.return_value = None
+        assert select_model_inputs(model, df).shape[1] == 17
+        
+        model.metadata.get_input_schema.return_value = MagicMock()
+        model.metadata.get_input_schema.return_value.input_names.return_value = ["humidity_std_6h"]
+        with pytest.raises(ValueError):
+            select_model_inputs(model, preprocess_weather_json(sample_api_response))
+    
     def test_preprocess_weekend_detection(self, sample_api_response):
         """Test la détection correcte du weekend"""
         # Modifier le timestamp pour un samedi (weekday=5)
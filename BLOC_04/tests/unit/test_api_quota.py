@@ -0,0 +1,92 @@
+# tests/unit/test_api_quota.py
+
+#✅ Test — quota partagé de la clé OpenWeather (plugins/api_quota.py)
+
+import multiprocessing
+from unittest.mock import patch
+
+import pytest
+
+import api_quota
+from api_quota import QuotaTimeout, acquire, headroom
+
+
+@pytest.fixture
+def small_quota(monkeypatch):
+    """Plan à 6 appels/min : 6 jetons, recharge d'un jeton toutes les 10s"""
+    monkeypatch.setenv("OPENWEATHER_QUOTA_PER_MINUTE", "6")
+
+
+def test_burst_up_to_capacity(small_quota):
+    """Le bucket plein accorde la capacité sans attente"""
+    for _ in range(6):
+        assert acquire("realtime", timeout=0) == pytest.approx(0, abs=0.5)
+    with pytest.raises(QuotaTimeout):
+        acquire("realtime", timeout=0)
+
+
+def test_lower_priority_keeps_reserve(small_quota):
+    """Un backfill s'arrête à la réserve, le temps réel passe encore"""
+    for _ in range(3):
+        acquire("backfill", timeout=0)
+    with pytest.raises(QuotaTimeout):
+        acquire("backfill", timeout=0)
+    acquire("realtime", timeout=0)
+
+    assert headroom()["granted"] == {"backfill": 3, "realtime": 1}
+
+
+def test_waits_for_refill(small_quota):
+    """Bucket vide : attente du temps de recharge d'un jeton"""
+    for _ in range(6):
+        acquire("realtime", timeout=0)
+    with patch("api_quota.time.sleep") as mock_sleep, \
+         patch("api_quota.time.time", side_effect=[1000.0, 1000.0, 1010.0, 1010.0, 1010.0]):
+        # Horloge : dernier état écrit "maintenant" → 10s pour un jeton
+        api_quota._connect(api_quota.quota_path()).execute(
+            "UPDATE bucket SET tokens = 0, updated_at = 1000.0"
+        )
+        waited = acquire("realtime", timeout=60)
+    mock_sleep.assert_called_once_with(pytest.approx(10.0))
+    assert waited == pytest.approx(10.0)
+
+
+def test_headroom_reports_capacity(small_quota):
+    """headroom() expose jetons restants et pourcentage"""
+    acquire("ingestion", timeout=0)
+    state = headroom()
+    assert state["capacity"] == 6
+    assert 4.9 < state["tokens"] <= 5.1
+    assert state["granted"] == {"ingestion": 1}
+
+
+def test_unknown_priority():
+    with pytest.raises(ValueError, match="Priorité inconnue"):
+        acquire("urgent")
+
+
+def _take_many(path, n, granted):
+    import os
+    os.environ["OPENWEATHER_QUOTA_PATH"] = path
+    os.environ["OPENWEATHER_QUOTA_PER_MINUTE"] = "20"
+    for _ in range(n):
+        try:
+            acquire("realtime", timeout=0)
+            with granted.get_lock():
+                granted.value += 1
+        except QuotaTimeout:
+            pass
+
+
+def test_shared_across_processes(tmp_path):
+    """4 process × 10 demandes sur un bucket de 20 : jamais plus de ~20 accordés"""
+    granted = multiprocessing.Value("i", 0)
+    path = str(tmp_path / "quota.sqlite")
+    procs = [multiprocessing.Process(target=_take_many, args=(path, 10, granted)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=30)
+
+    # Recharge de 1/3 de jeton par seconde pendant le test
+    assert 20 <= granted.value <= 22
@@ -1,18 +1,19 @@
 # tests/unit/test_csv_to_s3_upload.py
 import json
 import os
+from botocore.exceptions import ClientError
 from unittest.mock import patch, MagicMock, mock_open
 import pytest
 from dags.weather_utils import transform_and_append_weather_data
 
 
-@patch("dags.weather_utils.S3Hook")
-@patch("dags.weather_utils.Variable.get")
-@patch("dags.weather_utils.setup_aws_environment")
-@patch("dags.weather_utils.os.path.exists")
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
 @patch("builtins.open", new_callable=mock_open)
-@patch("dags.weather_utils.pd.read_csv")
-@patch("dags.weather_utils.pd.DataFrame.to_csv")
+@patch("weather_ingestion.pd.read_csv")
+@patch("weather_ingestion.pd.DataFrame.to_csv")
 def test_csv_uploaded_to_s3(
     mock_to_csv, mock_read_csv, mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
 ):
@@ -22,6 +23,8 @@ def test_csv_uploaded_to_s3(
     mock_var.return_value = "TEST_BUCKET"
     mock_s3_instance = MagicMock()
     mock_s3_class.return_value = mock_s3_instance
+    # Index de dédup absent sur S3 (premier run)
+    mock_s3_instance.get_conn.return_value.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
     mock_ti = MagicMock()
     mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
     context = {"ti": mock_ti}
@@ -0,0 +1,94 @@
+# tests/unit/test_dedup_index.py
+
+#✅ Test — index de déduplication (plugins/dedup_index.py)
+
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from dedup_index import DedupIndex, dedup_index_key, location_id, observation_keys
+
+
+def test_dedup_index_key():
+    """L'index est stocké à côté du dataset"""
+    assert dedup_index_key("weather_paris_fect.csv") == "weather_paris_fect.csv.dedup.npy"
+    assert dedup_index_key("observations/") == "observations.dedup.npy"
+
+
+def test_contains_and_add():
+    """Recherche dichotomique et ajout gardent l'index trié et unique"""
+    index = DedupIndex([30, 10, 20, 20])
+    assert list(index.epochs) == [10, 20, 30]
+    assert 20 in index
+    assert 25 not in index
+    assert 40 not in index
+
+    index.add(25)
+    index.add([5, 30])
+    assert list(index.epochs) == [5, 10, 20, 25, 30]
+
+
+def test_contains_vectorized():
+    """Masque booléen pour un lot d'epochs"""
+    index = DedupIndex([10, 20, 30])
+    mask = index.contains([5, 10, 25, 30, 99])
+    assert mask.tolist() == [False, True, False, True, False]
+
+
+def test_from_observations_legacy_history():
+    """Bootstrap depuis un CSV historique sans colonne location (clé = epoch)"""
+    df = pd.DataFrame({"datetime": ["2023-01-01 00:00:00", "2023-11-14 22:13:20"]})
+    index = DedupIndex.from_observations(df)
+    assert list(index.epochs) == [1672531200, 1700000000]
+
+
+def test_observation_keys_per_location():
+    """Même dt dans deux villes → deux clés distinctes ; Paris garde l'epoch seul"""
+    keys = observation_keys(["2023-01-01", "2023-01-01"], ["paris", "lyon"])
+    assert keys[0] == 1672531200
+    assert keys[1] == (location_id("lyon") << 32) | 1672531200
+    assert keys[0] != keys[1]
+
+    index = DedupIndex(keys[:1])
+    assert index.contains(keys).tolist() == [True, False]
+
+
+def test_bytes_roundtrip():
+    """Sérialisation .npy sans pickle"""
+    index = DedupIndex(np.arange(1000, dtype=np.int64) * 60)
+    restored = DedupIndex.from_bytes(index.to_bytes())
+    assert np.array_equal(restored.epochs, index.epochs)
+
+
+def test_load_missing_returns_none():
+    """Index absent sur S3 → None (reconstruction par l'appelant)"""
+    s3_client = MagicMock()
+    s3_client.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+    assert DedupIndex.load(s3_client, "bucket", "key.dedup.npy") is None
+
+
+@pytest.mark.parametrize("error", [
+    ClientError({"Error": {"Code": "AccessDenied"}}, "GetObject"),
+    ReadTimeoutError(endpoint_url="https://s3"),
+])
+def test_load_error_is_raised(error):
+    """Timeout / droits : erreur remontée, l'index existant n'est pas écrasé par un index vide"""
+    s3_client = MagicMock()
+    s3_client.get_object.side_effect = error
+    with pytest.raises(type(error)):
+        DedupIndex.load(s3_client, "bucket", "key.dedup.npy")
+
+
+def test_save_then_load():
+    """save() puis load() via un client S3 simulé"""
+    store = {}
+    s3_client = MagicMock()
+    s3_client.put_object.side_effect = lambda Bucket, Key, Body: store.update({Key: Body})
+    s3_client.get_object.side_effect = lambda Bucket, Key: {"Body": MagicMock(read=lambda: store[Key])}
+
+    DedupIndex([1, 2, 3]).save(s3_client, "bucket", "k")
+    loaded = DedupIndex.load(s3_client, "bucket", "k")
+    assert list(loaded.epochs) == [1, 2, 3]
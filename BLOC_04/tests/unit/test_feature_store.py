@@ -0,0 +1,98 @@
+# tests/unit/test_feature_store.py
+
+#✅ Test — feature store incrémental (plugins/feature_store.py)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_store
+from weather_features import FEATURE_COLUMNS, history_features
+
+
+def _history(start, periods, location="paris"):
+    rng = np.random.default_rng(periods)
+    return pd.DataFrame({
+        "datetime": pd.date_range(start, periods=periods, freq="h"),
+        **{c: rng.uniform(0, 30, periods) for c in feature_store.RAW_FEATURES},
+        "weather_main": rng.choice(["Clear", "Rain"], periods),
+        "location": location,
+    })
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / "features")
+
+
+def test_update_only_computes_rows_after_watermark(tmp_path, root):
+    """Second run : seules les lignes du jour sont calculées et ajoutées"""
+    csv_path = tmp_path / "weather.csv"
+    history = _history("2024-01-01", 48)
+    history.to_csv(csv_path, index=False)
+    assert feature_store.update(str(csv_path), "paris", root) == 48
+
+    history = pd.concat([history, _history("2024-01-03", 24)], ignore_index=True)
+    history.to_csv(csv_path, index=False)
+    assert feature_store.update(str(csv_path), "paris", root) == 24
+    assert feature_store.update(str(csv_path), "paris", root) == 0
+
+    assert len(feature_store.list_parts("paris", root)) == 2
+    assert feature_store.watermark("paris", root) == pd.Timestamp("2024-01-03 23:00")
+
+
+def test_store_matches_full_recompute(root):
+    history = _history("2024-01-01", 72)
+    feature_store.append(history.iloc[:30], "paris", root)
+    feature_store.append(history, "paris", root)
+
+    df = feature_store.read_frame("paris", root)
+
+    expected = history_features(history)
+    assert list(df.columns) == ["datetime"] + FEATURE_COLUMNS + ["weather_main"]
+    assert (df[FEATURE_COLUMNS].dtypes == np.float32).all()
+    np.testing.assert_array_equal(df[FEATURE_COLUMNS].to_numpy(), expected.to_numpy())
+    assert df["weather_main"].tolist() == history["weather_main"].tolist()
+
+
+def test_read_frame_time_range_and_locations(root):
+    feature_store.append(_history("2024-01-01", 48), "paris", root)
+    feature_store.append(_history("2024-01-01", 5, "lyon"), "lyon", root)
+
+    df = feature_store.read_frame("paris", root, start="2024-01-02", end="2024-01-02 05:00")
+
+    assert len(df) == 6
+    assert len(feature_store.read_frame("lyon", root)) == 5
+
+
+def test_compaction_merges_parts(root):
+    history = _history("2024-01-01", 40)
+    for i in range(4):
+        feature_store.append(history.iloc[: 10 * (i + 1)], "paris", root)
+
+    assert feature_store.compact("paris", root, max_parts=2)
+
+    assert len(feature_store.list_parts("paris", root)) == 1
+    assert len(feature_store.read_frame("paris", root)) == 40
+    assert feature_store.watermark("paris", root) == history["datetime"].iloc[-1]
+
+
+def test_drop_rebuilds_from_scratch(root):
+    feature_store.append(_history("2024-01-01", 10), "paris", root)
+    feature_store.drop("paris", root)
+
+    assert feature_store.watermark("paris", root) is None
+    assert feature_store.read_frame("paris", root).empty
+
+
+def test_missing_labels_stay_null(root):
+    """Label absent → null dans le store, jamais la chaîne "nan" """
+    history = _history("2024-01-01", 4)
+    history["weather_main"] = history["weather_main"].astype(object)
+    history.loc[[1, 2], "weather_main"] = [np.nan, None]
+    feature_store.append(history, "paris", root)
+
+    labels = feature_store.read_frame("paris", root)["weather_main"]
+
+    assert labels.isna().tolist() == [False, True, True, False]
+    assert "nan" not in labels.tolist() and "None" not in labels.tolist()
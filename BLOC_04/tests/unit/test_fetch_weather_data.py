@@ -5,12 +5,18 @@ import os
 from unittest.mock import patch, MagicMock, mock_open
 import pytest
 from dags.weather_utils import fetch_weather_data  # ✅ Import propre depuis le module utilitaire
+from ingestion_state import mark_ingested
+import openweather_client
 
 
-@patch("dags.weather_utils.requests.get")
-@patch("dags.weather_utils.Variable.get")
+class SkipRun(Exception):
+    """Remplace AirflowSkipException (mockée hors Airflow)"""
+
+
+@patch("openweather_client.get_session")
+@patch("weather_ingestion.Variable.get")
 @patch("builtins.open", new_callable=mock_open)
-def test_fetch_weather_data(mock_file, mock_var, mock_get):
+def test_fetch_weather_data(mock_file, mock_var, mock_session):
     """Test de la fonction fetch_weather_data"""
     
     # Mock de la Variable Airflow
@@ -25,6 +31,7 @@ def test_fetch_weather_data(mock_file, mock_var, mock_get):
         "clouds": {"all": 20},
         "wind": {"speed": 3.0, "deg": 200},
     }
+    mock_get = mock_session.return_value.get
     mock_get.return_value = fake_resp
     
     # Mock du context Airflow avec task instance
@@ -39,7 +46,8 @@ def test_fetch_weather_data(mock_file, mock_var, mock_get):
     mock_get.assert_called_once()
     call_url = mock_get.call_args[0][0]
     assert "api.openweathermap.org" in call_url
-    assert "FAKE_API_KEY" in call_url
+    assert mock_get.call_args[1]["params"]["appid"] == "FAKE_API_KEY"
+    assert mock_get.call_args[1]["timeout"] == (3.05, 10)
     
     # 2. Le fichier a été ouvert en écriture
     mock_file.assert_called_once()
@@ -61,9 +69,9 @@ def test_fetch_weather_data(mock_file, mock_var, mock_get):
 
 
 # Test avec erreur API
-@patch("dags.weather_utils.requests.get")
-@patch("dags.weather_utils.Variable.get")
-def test_fetch_weather_data_api_error(mock_var, mock_get):
+@patch("openweather_client.get_session")
+@patch("weather_ingestion.Variable.get")
+def test_fetch_weather_data_api_error(mock_var, mock_session):
     """Test de gestion d'erreur API"""
     
     mock_var.return_value = "FAKE_API_KEY"
@@ -71,7 +79,7 @@ def test_fetch_weather_data_api_error(mock_var, mock_get):
     # Mock d'une réponse d'erreur
     fake_resp = MagicMock(status_code=401)
     fake_resp.text = "Unauthorized"
-    mock_get.return_value = fake_resp
+    mock_session.return_value.get.return_value = fake_resp
     
     mock_ti = MagicMock()
     context = {"ti": mock_ti}
@@ -79,3 +87,72 @@ def test_fetch_weather_data_api_error(mock_var, mock_get):
     # Doit lever une ValueError
     with pytest.raises(ValueError, match="Erreur API : 401"):
         fetch_weather_data(**context)
+
+
+# Test WEATHER_LOCATIONS vide
+@patch("openweather_client.get_session")
+@patch("weather_ingestion.Variable.get")
+def test_fetch_weather_data_empty_locations(mock_var, mock_session):
+    """Map de locations vide ("{}") : erreur explicite, aucun appel API"""
+    
+    mock_var.return_value = "FAKE_API_KEY"
+    
+    with pytest.raises(ValueError, match="Aucune location"):
+        fetch_weather_data(locations="{}", ti=MagicMock())
+    mock_session.return_value.get.assert_not_called()
+
+
+# Test multi-villes
+@patch("openweather_client.time.sleep")
+@patch("openweather_client.get_session")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.json.dump")
+@patch("builtins.open", new_callable=mock_open)
+def test_fetch_weather_data_multiple_locations(mock_file, mock_dump, mock_var, mock_session, mock_sleep):
+    """Un appel par location, un seul fichier batch ; une location en échec (après retries) est ignorée"""
+    
+    mock_var.return_value = "FAKE_API_KEY"
+    
+    def fake_get(url, params, timeout):
+        if params["lat"] == 45.76:
+            return MagicMock(status_code=500, text="Internal error")
+        return MagicMock(status_code=200, json=MagicMock(return_value={"dt": 1700000000}))
+    mock_get = mock_session.return_value.get
+    mock_get.side_effect = fake_get
+    
+    locations = json.dumps({
+        "paris": {"lat": 48.8566, "lon": 2.3522},
+        "lyon": {"lat": 45.76, "lon": 4.84},
+        "nice": {"lat": 43.70, "lon": 7.27},
+    })
+    mock_ti = MagicMock()
+    fetch_weather_data(locations=locations, max_workers="2", ti=mock_ti)
+    
+    # 500 rejoué MAX_RETRIES fois pour lyon
+    assert mock_get.call_count == 3 + openweather_client.MAX_RETRIES
+    mock_file.assert_called_once()
+    written = mock_dump.call_args[0][0]
+    assert [o["location"] for o in written] == ["nice", "paris"]
+    mock_ti.xcom_push.assert_called_once()
+
+
+# Test du court-circuit : dt inchangé depuis la dernière ingestion
+@patch("openweather_client.get_session")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+@patch("builtins.open", new_callable=mock_open)
+def test_fetch_weather_data_skips_unchanged_dt(mock_file, mock_var, mock_session):
+    """dt déjà ingéré → run skipped, aucun JSON écrit"""
+    
+    mock_var.return_value = "FAKE_API_KEY"
+    mock_session.return_value.get.return_value = MagicMock(
+        status_code=200, json=MagicMock(return_value={"dt": 1700000000})
+    )
+    mark_ingested([{"dt": 1700000000, "location": "paris"}])
+    
+    mock_ti = MagicMock()
+    with pytest.raises(SkipRun, match="Aucune observation nouvelle"):
+        fetch_weather_data(ti=mock_ti)
+    
+    mock_file.assert_not_called()
+    mock_ti.xcom_push.assert_not_called()
@@ -0,0 +1,28 @@
+# tests/unit/test_ingestion_state.py
+
+#✅ Test — dernier dt ingéré par location (plugins/ingestion_state.py)
+
+from ingestion_state import filter_new, last_ingested, mark_ingested
+
+
+def test_filter_new_without_state():
+    """État vide : tout est nouveau"""
+    payloads = [{"dt": 100, "location": "paris"}, {"dt": 100, "location": "lyon"}]
+    assert filter_new(payloads) == payloads
+
+
+def test_only_advanced_dt_are_new():
+    """Seules les locations dont le dt a avancé passent"""
+    mark_ingested([{"dt": 100, "location": "paris"}, {"dt": 100, "location": "lyon"}])
+
+    fresh = filter_new([{"dt": 100, "location": "paris"}, {"dt": 700, "location": "lyon"}])
+
+    assert fresh == [{"dt": 700, "location": "lyon"}]
+
+
+def test_mark_ingested_never_goes_back():
+    """Un dt plus ancien (retry tardif) ne fait pas reculer l'état"""
+    mark_ingested([{"dt": 700, "location": "paris"}])
+    mark_ingested([{"dt": 100}])  # Ancien format : location par défaut
+
+    assert last_ingested() == {"paris": 700}
@@ -0,0 +1,60 @@
+# tests/unit/test_load_metrics.py
+
+#✅ Test — mesures de chargement et export StatsD (plugins/load_metrics.py)
+
+import io
+import json
+import logging
+import socket
+
+from load_metrics import CountingReader, LoadMetrics, log_summary, send_statsd, statsd_lines
+
+
+def test_phases_accumulate_and_summary():
+    metrics = LoadMetrics()
+    for _ in range(2):
+        with metrics.phase("parse"):
+            pass
+    metrics.add(rows=10, nbytes=2_000_000, objects=1)
+    summary = metrics.summary(table="weather_data")
+
+    assert summary["rows"] == 10 and summary["bytes"] == 2_000_000 and summary["objects"] == 1
+    assert set(summary["phases"]) == {"download", "parse", "load", "merge"}
+    assert summary["phases"]["download"] == 0.0
+    assert summary["rows_per_s"] > 0 and summary["table"] == "weather_data"
+
+
+def test_counting_reader_counts_bytes():
+    metrics = LoadMetrics()
+    reader = CountingReader(io.BytesIO(b"a,b\n1,2\n"), metrics)
+    assert reader.read(4) == b"a,b\n"
+    assert reader.read() == b"1,2\n"
+    assert metrics.bytes == 8
+
+
+def test_log_summary_is_json(caplog):
+    with caplog.at_level(logging.INFO):
+        log_summary({"rows": 3, "table": "weather_data"})
+    payload = caplog.records[-1].getMessage().split(" ", 1)[1]
+    assert json.loads(payload) == {"rows": 3, "table": "weather_data"}
+
+
+def test_statsd_lines_and_udp_send(monkeypatch):
+    """Compteurs, jauges et timings par phase, envoyés en un datagramme UDP"""
+    summary = LoadMetrics().summary(table="weather_data")
+    lines = statsd_lines(summary, "weather.load")
+    assert "weather.load.weather_data.rows:0|c" in lines
+    assert any(line.startswith("weather.load.weather_data.phase.parse:") and line.endswith("|ms") for line in lines)
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(2)
+        monkeypatch.setenv("STATSD_HOST", "127.0.0.1")
+        monkeypatch.setenv("STATSD_PORT", str(server.getsockname()[1]))
+        assert send_statsd(summary, prefix="weather.load")
+        assert server.recv(65535).decode().split("\n") == lines
+
+
+def test_statsd_disabled_without_host(monkeypatch):
+    monkeypatch.delenv("STATSD_HOST", raising=False)
+    assert send_statsd(LoadMetrics().summary()) is False
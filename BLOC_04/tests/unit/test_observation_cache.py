@@ -0,0 +1,80 @@
+# tests/unit/test_observation_cache.py
+
+#✅ Test — cache partagé des observations (plugins/observation_cache.py)
+
+import multiprocessing
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+import observation_cache
+from observation_cache import UPDATE_INTERVAL, expires_at, get_or_fetch, lookup, store
+
+
+def test_expires_at_follows_update_interval():
+    """Valide jusqu'à la prochaine mise à jour OpenWeather, au moins MIN_TTL"""
+    assert expires_at({"dt": 1000}, fetched_at=1100) == 1000 + UPDATE_INTERVAL
+    assert expires_at({"dt": 1000}, fetched_at=5000) == 5000 + observation_cache.MIN_TTL
+
+
+def test_second_consumer_hits_cache():
+    """Deux lectures de la même location → un seul appel API"""
+    fetch = MagicMock(return_value={"dt": int(time.time()), "main": {"temp": 12}})
+
+    first = get_or_fetch(48.8566, 2.3522, "metric", fetch)
+    second = get_or_fetch(48.8566, 2.3522, "metric", fetch)
+
+    assert first == second
+    fetch.assert_called_once()
+
+
+def test_expired_entry_is_refetched():
+    """Une entrée expirée n'est plus servie"""
+    store(48.8566, 2.3522, "metric", {"dt": 0}, now=0)
+    assert lookup(48.8566, 2.3522, "metric", now=UPDATE_INTERVAL + 1) is None
+
+
+def test_errors_are_not_cached():
+    """Une erreur API remonte et ne pollue pas le cache"""
+    fetch = MagicMock(side_effect=ValueError("Erreur API : 500 - boom"))
+    with pytest.raises(ValueError):
+        get_or_fetch(1.0, 2.0, "metric", fetch)
+    assert lookup(1.0, 2.0, "metric") is None
+
+
+def test_disabled_cache(monkeypatch):
+    """OPENWEATHER_CACHE_PATH=off : appel direct à chaque lecture"""
+    monkeypatch.setenv("OPENWEATHER_CACHE_PATH", "off")
+    fetch = MagicMock(return_value={"dt": int(time.time())})
+    get_or_fetch(1.0, 2.0, "metric", fetch)
+    get_or_fetch(1.0, 2.0, "metric", fetch)
+    assert fetch.call_count == 2
+
+
+def _slow_fetch_in_process(path, calls):
+    import os
+    os.environ["OPENWEATHER_CACHE_PATH"] = path
+
+    def fetch():
+        with calls.get_lock():
+            calls.value += 1
+        time.sleep(0.3)
+        return {"dt": int(time.time())}
+
+    get_or_fetch(48.8566, 2.3522, "metric", fetch)
+
+
+def test_single_flight_across_processes(tmp_path):
+    """Plusieurs process simultanés sur une location → un seul appel API"""
+    calls = multiprocessing.Value("i", 0)
+    path = str(tmp_path / "shared.sqlite")
+    procs = [
+        multiprocessing.Process(target=_slow_fetch_in_process, args=(path, calls)) for _ in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=30)
+
+    assert calls.value == 1
@@ -0,0 +1,116 @@
+# tests/unit/test_openweather_client.py
+
+#✅ Test — client OpenWeather partagé (plugins/openweather_client.py)
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import openweather_client
+from openweather_client import LatencyHistogram, build_session, get_current_weather
+
+
+@pytest.fixture
+def fake_api():
+    """Serveur HTTP local : répond les statuts de `responses` (ou (statut, en-têtes)) puis 200"""
+    state = {"responses": [], "calls": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            state["calls"] += 1
+            status = state["responses"].pop(0) if state["responses"] else 200
+            status, headers = status if isinstance(status, tuple) else (status, {})
+            body = b'{"dt": 1700000000}' if status == 200 else b"busy"
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with patch.object(openweather_client, "BASE_URL", f"http://127.0.0.1:{server.server_port}"), \
+         patch.object(openweather_client, "BACKOFF_FACTOR", 0):
+        with patch.object(openweather_client, "_session", build_session()):
+            yield state
+    server.shutdown()
+
+
+def test_retries_on_5xx_then_succeeds(fake_api):
+    """503 puis 429 sont rejoués, la 3e réponse (200) est renvoyée ; un jeton de quota par requête"""
+    fake_api["responses"] = [503, 429]
+    with patch.object(openweather_client.api_quota, "acquire") as acquire:
+        assert get_current_weather(48.85, 2.35, "KEY", use_cache=False, priority="realtime") == {"dt": 1700000000}
+    assert fake_api["calls"] == 3
+    assert acquire.call_count == 3
+    acquire.assert_called_with("realtime")
+
+
+def test_429_honours_retry_after(fake_api):
+    """429 avec Retry-After : attente demandée par l'API avant le nouvel essai"""
+    fake_api["responses"] = [(429, {"Retry-After": "2"})]
+    with patch.object(openweather_client.time, "sleep") as sleep:
+        assert get_current_weather(48.85, 2.35, "KEY", use_cache=False) == {"dt": 1700000000}
+    sleep.assert_called_once_with(2.0)
+    assert fake_api["calls"] == 2
+
+
+def test_long_retry_after_gives_up(fake_api):
+    """Retry-After au-delà de RETRY_AFTER_MAX : pas de nouvel appel, le 429 remonte"""
+    fake_api["responses"] = [(429, {"Retry-After": "3600"})]
+    with patch.object(openweather_client.time, "sleep") as sleep:
+        with pytest.raises(ValueError, match="Erreur API : 429"):
+            get_current_weather(48.85, 2.35, "KEY", use_cache=False)
+    sleep.assert_not_called()
+    assert fake_api["calls"] == 1
+
+
+def test_retry_delay_backoff_and_http_date():
+    resp = MagicMock(headers={})
+    assert openweather_client.retry_delay(resp, 0) == openweather_client.BACKOFF_FACTOR
+    assert openweather_client.retry_delay(resp, 10) == openweather_client.BACKOFF_MAX
+    resp.headers = {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert openweather_client.retry_delay(resp, 0) == 0.0
+
+
+def test_retries_are_bounded(fake_api):
+    """Au-delà de MAX_RETRIES, le dernier statut remonte en ValueError"""
+    fake_api["responses"] = [500] * 10
+    with pytest.raises(ValueError, match="Erreur API : 500"):
+        get_current_weather(48.85, 2.35, "KEY")
+    assert fake_api["calls"] == openweather_client.MAX_RETRIES + 1
+
+
+def test_client_error_not_retried(fake_api):
+    """401 : pas de retry"""
+    fake_api["responses"] = [401]
+    with pytest.raises(ValueError, match="Erreur API : 401"):
+        get_current_weather(48.85, 2.35, "KEY")
+    assert fake_api["calls"] == 1
+
+
+def test_session_is_shared():
+    """Une seule session (pool keep-alive) par process"""
+    with patch.object(openweather_client, "_session", None):
+        assert openweather_client.get_session() is openweather_client.get_session()
+
+
+def test_latency_histogram():
+    """Buckets, quantiles et résumé"""
+    hist = LatencyHistogram(buckets_ms=(100, 1000))
+    for seconds in (0.01, 0.05, 0.2, 5):
+        hist.observe(seconds)
+
+    assert hist.snapshot() == {"<=100ms": 2, "<=1000ms": 1, ">1000ms": 1}
+    assert hist.quantile(0.5) == 100
+    assert hist.quantile(0.95) == float("inf")
+    assert "4 appels" in hist.summary()
@@ -0,0 +1,69 @@
+# tests/unit/test_pg_copy.py
+
+#✅ Test — encodage COPY binaire Postgres (plugins/pg_copy.py)
+
+import struct
+
+import pandas as pd
+import pytest
+
+from pg_copy import PGCOPY_HEADER, binary_copy_buffer, copy_sql, encode_numeric, upsert_sql
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1234.5, (2, 0, 0, 1, [1234, 5000])),
+    (-0.05, (1, -1, 0x4000, 2, [500])),
+    (12345678, (2, 1, 0, 0, [1234, 5678])),
+    (0, (0, 0, 0, 0, [])),
+])
+def test_encode_numeric(value, expected):
+    """numeric : (ndigits, weight, sign, dscale) + chiffres en base 10000"""
+    data = encode_numeric(value)
+    ndigits, weight, sign, dscale = struct.unpack(">hhHH", data[:8])
+    digits = list(struct.unpack(f">{ndigits}H", data[8:]))
+    assert (ndigits, weight, sign, dscale, digits) == expected
+
+
+def test_copy_sql():
+    assert copy_sql("weather_data", ["datetime", "temp"], header=True) == (
+        'COPY weather_data ("datetime", "temp") FROM STDIN WITH (FORMAT csv, HEADER true)'
+    )
+    assert copy_sql("weather_data", ["temp"], "binary").endswith("WITH (FORMAT binary)")
+
+
+def test_binary_copy_buffer_layout():
+    """En-tête PGCOPY, une ligne = nb de champs + (longueur, octets), NULL = -1"""
+    df = pd.DataFrame({
+        "datetime": ["2000-01-01 00:00:01"],
+        "temp": [None],
+        "location": ["paris"],
+    })
+    types = {"datetime": "timestamp without time zone", "temp": "numeric", "location": "character varying"}
+    data = binary_copy_buffer(df, types).read()
+
+    assert data.startswith(PGCOPY_HEADER)
+    body = data[len(PGCOPY_HEADER):]
+    assert struct.unpack(">h", body[:2]) == (3,)
+    assert struct.unpack(">iq", body[2:14]) == (8, 1_000_000)  # µs depuis 2000-01-01
+    assert struct.unpack(">i", body[14:18]) == (-1,)
+    assert struct.unpack(">i", body[18:22]) == (5,) and body[22:27] == b"paris"
+    assert body[27:] == struct.pack(">h", -1)
+
+
+def test_binary_copy_buffer_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        binary_copy_buffer(pd.DataFrame({"x": [1]}), {"x": "jsonb"})
+
+
+def test_upsert_sql_do_nothing():
+    assert upsert_sql("weather_data", "stg", ["datetime", "temp"], ["datetime"]) == (
+        'INSERT INTO weather_data ("datetime", "temp") SELECT "datetime", "temp" FROM stg'
+        ' ON CONFLICT ("datetime") DO NOTHING'
+    )
+
+
+def test_upsert_sql_do_update_dedups_batch():
+    """DO UPDATE : une ligne par clé dans le lot, colonnes hors clé réécrites"""
+    sql = upsert_sql("weather_data", "stg", ["datetime", "location", "temp"], ["location", "datetime"], "update")
+    assert 'SELECT DISTINCT ON ("location", "datetime")' in sql
+    assert sql.endswith('DO UPDATE SET "temp" = EXCLUDED."temp"')
@@ -0,0 +1,117 @@
+# tests/unit/test_rolling_features.py
+
+#✅ Test — features glissantes incrémentales (plugins/rolling_features.py)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_features import (
+    ROLLING_COLUMNS,
+    RollingState,
+    load_state,
+    rolling_features,
+    save_state,
+    weather_code,
+)
+
+
+@pytest.fixture
+def observations():
+    """Observations irrégulières (1 à 20 min), avec un trou de 8h et des mesures manquantes"""
+    rng = np.random.default_rng(7)
+    steps = rng.integers(60, 1200, 400)
+    steps[200] = 8 * 3600
+    times = pd.Timestamp("2024-03-01") + pd.to_timedelta(np.cumsum(steps), unit="s")
+    df = pd.DataFrame({
+        "datetime": times,
+        "pressure": rng.uniform(990, 1030, 400),
+        "humidity": rng.uniform(30, 100, 400),
+        "wind_speed": rng.uniform(0, 15, 400),
+        "weather_main": rng.choice(["Clear", "Clouds", "Rain", "Drizzle", "Mist"], 400),
+    })
+    df.loc[[5, 50, 51], "humidity"] = np.nan
+    return df
+
+
+def _incremental(df, location="paris"):
+    state = RollingState()
+    epochs = (df["datetime"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    return np.vstack([
+        state.update(location, dt, row.pressure, row.humidity, row.wind_speed, row.weather_main)
+        for dt, row in zip(epochs, df.itertuples())
+    ])
+
+
+def test_incremental_matches_vectorized_rebuild(observations):
+    """Parité : état O(1) observation par observation == reconstruction vectorisée"""
+    batch = rolling_features(observations)
+    online = _incremental(observations)
+
+    assert list(batch.columns) == ROLLING_COLUMNS
+    assert batch.dtypes.eq(np.float32).all()
+    np.testing.assert_allclose(online, batch.to_numpy(), rtol=1e-4, atol=1e-3, equal_nan=True)
+
+
+def test_window_definitions():
+    """Tendance sur 3h, moyenne 1h, lag 1h (et rien après un trou de plus de 6h)"""
+    df = pd.DataFrame({
+        "datetime": pd.to_datetime(["2024-01-01 00:00", "2024-01-01 00:30", "2024-01-01 02:00", "2024-01-01 10:00"]),
+        "pressure": [1000.0, 1002.0, 1005.0, 1010.0],
+        "humidity": [50.0, 70.0, 90.0, 40.0],
+        "wind_speed": [1.0, 2.0, 3.0, 4.0],
+        "weather_main": ["Clear", "Rain", "Clouds", "Snow"],
+    })
+
+    out = rolling_features(df)
+
+    assert out["pressure_tendency_3h"].tolist() == [0.0, 2.0, 5.0, 0.0]
+    assert out["humidity_mean_1h"].tolist() == [50.0, 60.0, 90.0, 40.0]
+    assert out["weather_main_lag_1h"].iloc[2] == weather_code("Rain")
+    assert np.isnan(out["weather_main_lag_1h"].iloc[0]) and np.isnan(out["weather_main_lag_1h"].iloc[3])
+
+
+def test_locations_are_independent(observations):
+    both = pd.concat([observations.assign(location="paris"), observations.assign(location="lyon")])
+    both = both.sort_values("datetime", kind="stable").reset_index(drop=True)
+
+    out = rolling_features(both, by="location")
+
+    paris = out[both["location"] == "paris"].to_numpy()
+    np.testing.assert_array_equal(paris, rolling_features(observations).to_numpy())
+
+
+def test_replayed_observation_does_not_change_state(tmp_path):
+    """Même dt revu (deux tâches temps réel) : état inchangé, mêmes features ; état persisté"""
+    state = RollingState()
+    first = state.update("paris", 1000, 1010, 60, 3, "Clear")
+    again = state.update("paris", 1000, 900, 10, 30, "Rain")
+    np.testing.assert_array_equal(first, again)
+
+    path = str(tmp_path / "state.pkl")
+    save_state(state, path)
+    restored = load_state(path)
+    later = restored.update("paris", 1600, 1012, 80, 5, "Clouds")
+
+    assert later[ROLLING_COLUMNS.index("pressure_tendency_3h")] == 2.0
+    assert later[ROLLING_COLUMNS.index("humidity_mean_1h")] == 70.0
+    assert isinstance(load_state(str(tmp_path / "missing.pkl")), RollingState)
+
+
+def test_state_path_from_environment(tmp_path, monkeypatch):
+    """Sans chemin explicite : WEATHER_ROLLING_STATE_PATH, comme les autres états du worker"""
+    path = tmp_path / "custom" / "rolling.pkl"
+    monkeypatch.setenv("WEATHER_ROLLING_STATE_PATH", str(path))
+    state = RollingState()
+    state.update("paris", 1000, 1010, 60, 3, "Clear")
+
+    save_state(state)
+
+    assert path.exists()
+    assert list(load_state().locations) == ["paris"]
+
+
+def test_weather_code_groups_aliases():
+    assert weather_code("Drizzle") == weather_code("Rain")
+    assert weather_code("Mist") == weather_code("Fog")
+    assert np.isnan(weather_code("Tornado")) and np.isnan(weather_code(None))
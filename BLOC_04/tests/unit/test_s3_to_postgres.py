@@ -0,0 +1,456 @@
+# tests/unit/test_s3_to_postgres.py
+
+#✅ Test — chargement incrémental S3 → Postgres (plugins/s3_to_postgres.py)
+
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, inspect
+
+PLUGIN_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "plugins", "s3_to_postgres.py")
+
+
+class StubBaseOperator:
+    """BaseOperator minimal (Airflow absent des tests)"""
+
+    log = logging.getLogger("s3_to_postgres")
+
+    def __init__(self, task_id=None, **kwargs):
+        self.task_id = task_id
+
+
+@pytest.fixture
+def plugin():
+    """Module réel (sys.modules['s3_to_postgres'] est mocké par d'autres tests)"""
+    with patch.object(sys.modules["airflow.models"], "BaseOperator", StubBaseOperator):
+        spec = importlib.util.spec_from_file_location("s3_to_postgres_under_test", PLUGIN_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'weather.db'}")
+
+
+def _download(csv_path):
+    """S3Hook.download_file : une copie du fichier par appel, comme un vrai téléchargement"""
+    def download_file(key, bucket_name, local_path):
+        target = f"{csv_path}.download"
+        shutil.copy(csv_path, target)
+        return target
+    return download_file
+
+
+def _run(plugin, engine, csv_path, conn=None, context=None, key="weather.csv", **kwargs):
+    s3_hook = MagicMock()
+    s3_hook.download_file.side_effect = _download(csv_path)
+    s3_hook.get_key.return_value.get.side_effect = lambda: {"Body": open(csv_path, "rb")}
+    pg_hook = MagicMock()
+    pg_hook.get_sqlalchemy_engine.return_value = engine
+    pg_hook.get_conn.return_value = conn
+    with patch.object(plugin, "S3Hook", return_value=s3_hook), \
+         patch.object(plugin, "PostgresHook", return_value=pg_hook):
+        op = plugin.S3ToPostgresOperator(
+            task_id="transfer", bucket="b", key=key, table="weather_data", **kwargs
+        )
+        return op.execute(context=context or {})
+
+
+def _write_csv(path, rows):
+    pd.DataFrame(rows, columns=["datetime", "temp", "location"]).to_csv(path, index=False)
+    return path
+
+
+def test_incremental_requires_header(plugin):
+    """Sans en-tête, impossible de retrouver la colonne watermark"""
+    with pytest.raises(ValueError):
+        plugin.S3ToPostgresOperator(task_id="t", bucket="b", key="k", table="t", load_mode="incremental")
+
+
+def test_incremental_loads_only_rows_after_watermark(plugin, engine, tmp_path):
+    """Premier run : tout ; runs suivants : seulement les lignes plus récentes, en append"""
+    kwargs = dict(load_mode="incremental", header=0, partition_column="location")
+    rows = [("2024-01-01 00:00:00", 10.0, "paris"), ("2024-01-01 01:00:00", 11.0, "paris")]
+    assert _run(plugin, engine, _write_csv(tmp_path / "a.csv", rows), **kwargs) == 2
+
+    rows += [("2024-01-01 02:00:00", 12.0, "paris")]
+    assert _run(plugin, engine, _write_csv(tmp_path / "b.csv", rows), **kwargs) == 1
+    assert _run(plugin, engine, _write_csv(tmp_path / "c.csv", rows), **kwargs) == 0
+
+    loaded = pd.read_sql("SELECT * FROM weather_data ORDER BY datetime", engine)
+    assert loaded["temp"].tolist() == [10.0, 11.0, 12.0]
+
+
+def test_incremental_watermark_per_location(plugin, engine, tmp_path):
+    """Une location en retard n'est pas filtrée par le watermark d'une autre"""
+    kwargs = dict(load_mode="incremental", header=0, partition_column="location")
+    _run(plugin, engine, _write_csv(tmp_path / "a.csv", [("2024-01-01 05:00:00", 10.0, "paris")]), **kwargs)
+
+    rows = [
+        ("2024-01-01 05:00:00", 10.0, "paris"),
+        ("2024-01-01 03:00:00", 7.0, "lyon"),
+        ("2024-01-01 06:00:00", 11.0, "paris"),
+    ]
+    assert _run(plugin, engine, _write_csv(tmp_path / "b.csv", rows), **kwargs) == 2
+
+    loaded = pd.read_sql("SELECT location, temp FROM weather_data ORDER BY temp", engine)
+    assert loaded.values.tolist() == [["lyon", 7.0], ["paris", 10.0], ["paris", 11.0]]
+
+
+def test_incremental_parquet_with_dictionary_encoded_location(plugin, engine, tmp_path):
+    """Parquet : location lue en catégorielle, toutes les locations déjà en base (second run)"""
+    kwargs = dict(load_mode="incremental", header=0, partition_column="location", key="weather.parquet")
+
+    def write_parquet(path, rows):
+        df = pd.DataFrame(rows, columns=["datetime", "temp", "location"])
+        df["datetime"] = pd.to_datetime(df["datetime"]).astype("datetime64[ms]")
+        df["location"] = df["location"].astype("category")
+        df.to_parquet(path, index=False)
+        return path
+
+    # Watermarks distincts : map() sur la catégorielle renverrait une Categorical
+    rows = [("2024-01-01 00:00:00", 10.0, "paris"), ("2024-01-01 01:00:00", 5.0, "lyon")]
+    assert _run(plugin, engine, write_parquet(tmp_path / "a.parquet", rows), **kwargs) == 2
+
+    rows += [("2024-01-01 02:00:00", 11.0, "paris")]
+    assert _run(plugin, engine, write_parquet(tmp_path / "b.parquet", rows), **kwargs) == 1
+
+
+def test_watermark_bounds_from_categorical_partitions(plugin, engine):
+    """Une requête indexée par partition, résultat datetime comparable (NaT si inconnue)"""
+    pd.DataFrame({
+        "datetime": ["2024-01-01 05:00:00", "2024-01-01 03:00:00", "2024-01-01 02:00:00"],
+        "location": ["paris", "paris", "lyon"],
+    }).to_sql("weather_data", engine, index=False)
+    watermarks = plugin.Watermarks(engine, "weather_data", "datetime", "location")
+
+    bounds = watermarks.bounds(pd.Series(["paris", "lyon", "nice", "paris"], dtype="category"))
+
+    assert bounds.dtype.kind == "M"
+    assert bounds.tolist()[:2] == [pd.Timestamp("2024-01-01 05:00"), pd.Timestamp("2024-01-01 02:00")]
+    assert pd.isna(bounds.iloc[2])
+    assert watermarks.get() == pd.Timestamp("2024-01-01 05:00")
+
+
+def test_full_mode_keeps_replace_behaviour(plugin, engine, tmp_path):
+    """Mode par défaut inchangé : table réécrite"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris")])
+    _run(plugin, engine, path, header=0)
+    _run(plugin, engine, path, header=0)
+    assert pd.read_sql("SELECT COUNT(*) AS n FROM weather_data", engine)["n"][0] == 1
+    assert not os.path.exists(f"{path}.download")  # Fichier téléchargé supprimé
+
+
+class FakeCursor:
+    """Curseur psycopg2 minimal : capture les COPY"""
+
+    def __init__(self, copies, executed):
+        self.copies = copies
+        self.executed = executed
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append(query)
+        self.rowcount = 1 if query.startswith("INSERT") else -1
+
+    def fetchall(self):
+        return [("datetime", "timestamp without time zone"), ("temp", "double precision"), ("location", "text")]
+
+    def copy_expert(self, sql, source):
+        data = source.read()
+        self.copies.append((sql, data))
+        self.rowcount = len(data.splitlines()) - (1 if "HEADER true" in sql else 0) if isinstance(data, str) else 1
+
+
+def _run_copy(plugin, engine, csv_path, executed=None, **kwargs):
+    copies = []
+    executed = [] if executed is None else executed
+    conn = MagicMock()
+    conn.cursor.side_effect = lambda: FakeCursor(copies, executed)
+    rows = _run(plugin, engine, csv_path, conn=conn, loader="copy", **kwargs)
+    conn.commit.assert_called_once()
+    return rows, copies
+
+
+def test_copy_streams_csv_file(plugin, engine, tmp_path):
+    """Mode full + CSV : le fichier est envoyé tel quel (HEADER true), table créée au préalable"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris"), ("2024-01-01 01:00:00", 11.0, "paris")])
+    rows, copies = _run_copy(plugin, engine, path, header=0)
+
+    assert rows == 2
+    sql, data = copies[0]
+    assert sql == 'COPY weather_data ("datetime", "temp", "location") FROM STDIN WITH (FORMAT csv, HEADER true)'
+    assert data == path.read_text()
+    assert pd.read_sql("SELECT COUNT(*) AS n FROM weather_data", engine)["n"][0] == 0  # créée vide
+
+
+def test_copy_incremental_sends_only_new_rows(plugin, engine, tmp_path):
+    """Incrémental + COPY : seules les lignes après le watermark partent dans le flux"""
+    kwargs = dict(load_mode="incremental", header=0, partition_column="location")
+    _run(plugin, engine, _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris")]), **kwargs)
+
+    rows = [("2024-01-01 00:00:00", 10.0, "paris"), ("2024-01-01 01:00:00", 11.0, "paris")]
+    loaded, copies = _run_copy(plugin, engine, _write_csv(tmp_path / "b.csv", rows), **kwargs)
+
+    assert loaded == 1
+    assert copies[0][1] == "2024-01-01 01:00:00,11.0,paris\n"
+
+
+def test_copy_binary_format(plugin, engine, tmp_path):
+    """copy_format=binary : flux PGCOPY encodé selon les types de la table"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris")])
+    rows, copies = _run_copy(plugin, engine, path, header=0, copy_format="binary")
+
+    sql, data = copies[0]
+    assert rows == 1
+    assert sql.endswith("WITH (FORMAT binary)")
+    assert data.startswith(b"PGCOPY\n\xff\r\n\x00")
+
+
+def test_streaming_loads_chunk_by_chunk(plugin, engine, tmp_path):
+    """chunksize : corps S3 lu en flux, un COPY par bloc, sans téléchargement"""
+    rows = [(f"2024-01-01 0{h}:00:00", float(h), "paris") for h in range(5)]
+    path = _write_csv(tmp_path / "a.csv", rows)
+    loaded, copies = _run_copy(plugin, engine, path, header=0, chunksize=2)
+
+    assert loaded == 5
+    assert [len(data.splitlines()) for _, data in copies] == [2, 2, 1]
+    assert not os.path.exists(f"{path}.download")
+
+
+def test_streaming_incremental_insert(plugin, engine, tmp_path):
+    """Streaming + incrémental : watermark lu une fois, blocs filtrés puis ajoutés"""
+    kwargs = dict(load_mode="incremental", header=0, partition_column="location", chunksize=2)
+    _run(plugin, engine, _write_csv(tmp_path / "a.csv", [("2024-01-01 01:00:00", 1.0, "paris")]), **kwargs)
+
+    rows = [(f"2024-01-01 0{h}:00:00", float(h), "paris") for h in range(5)]
+    assert _run(plugin, engine, _write_csv(tmp_path / "b.csv", rows), **kwargs) == 3
+    assert pd.read_sql("SELECT temp FROM weather_data ORDER BY temp", engine)["temp"].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_upsert_copies_to_staging_then_merges(plugin, engine, tmp_path):
+    """on_conflict : COPY vers une table temporaire puis un seul INSERT ... ON CONFLICT"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris"), ("2024-01-01 01:00:00", 11.0, "paris")])
+    executed = []
+    rows, copies = _run_copy(
+        plugin, engine, path, executed=executed, header=0,
+        on_conflict="update", conflict_columns=["location", "datetime"],
+    )
+
+    assert executed[0] == "CREATE TEMP TABLE weather_data_staging (LIKE weather_data INCLUDING DEFAULTS) ON COMMIT DROP"
+    assert copies[0][0].startswith("COPY weather_data_staging ")
+    assert executed[-1].startswith('INSERT INTO weather_data ("datetime", "temp", "location") SELECT DISTINCT ON')
+    assert executed[-1].endswith('ON CONFLICT ("location", "datetime") DO UPDATE SET "temp" = EXCLUDED."temp"')
+    assert rows == 1  # rowcount de l'INSERT (lignes réellement écrites)
+    assert not inspect(engine).has_table("weather_data")  # if_exists ignoré : pas de création
+
+
+def test_post_merge_sql_runs_in_merge_transaction(plugin, engine, tmp_path):
+    """post_merge_sql : exécuté juste après la fusion, avant le commit (staging encore présente)"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris")])
+    executed = []
+    _run_copy(
+        plugin, engine, path, executed=executed, header=0, on_conflict="nothing",
+        post_merge_sql="INSERT INTO weather_rollup_queue SELECT 1 FROM weather_data_staging",
+    )
+
+    assert executed[-2].startswith("INSERT INTO weather_data ")
+    assert executed[-1] == "INSERT INTO weather_rollup_queue SELECT 1 FROM weather_data_staging"
+
+    with pytest.raises(ValueError, match="on_conflict"):
+        plugin.S3ToPostgresOperator(task_id="t", bucket="b", key="k", table="t", post_merge_sql="SELECT 1")
+
+
+def test_upsert_with_insert_loader_still_stages_with_copy(plugin, engine, tmp_path):
+    """La staging est toujours chargée par COPY, même avec loader=insert"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris")])
+    copies, executed = [], []
+    conn = MagicMock()
+    conn.cursor.side_effect = lambda: FakeCursor(copies, executed)
+    _run(plugin, engine, path, conn=conn, header=0, on_conflict="nothing")
+
+    assert copies[0][1] == "2024-01-01 00:00:00,10.0,paris\n"
+    assert executed[-1].endswith('ON CONFLICT ("datetime") DO NOTHING')
+    conn.commit.assert_called_once()
+
+
+def _bucket(tmp_path, objects):
+    """S3Hook mocké sur un « bucket » local {clé: lignes} ; renvoie (hook, ETags)"""
+    files, etags = {}, {}
+    for key, rows in objects.items():
+        path = tmp_path / key.replace("/", "__")
+        files[key] = _write_csv(path, rows)
+        etags[key] = f'"{hash(path.read_bytes()) & 0xFFFF:x}"'
+    s3_hook = MagicMock()
+    s3_hook.get_conn.return_value.get_paginator.return_value.paginate.side_effect = lambda Bucket, Prefix: [
+        {"Contents": [{"Key": k, "ETag": etags[k]} for k in sorted(files) if k.startswith(Prefix)]}
+    ]
+
+    def download_file(key, bucket_name, local_path):
+        if key.endswith("broken.csv"):
+            raise OSError("téléchargement interrompu")
+        return _download(files[key])(key, bucket_name, local_path)
+
+    s3_hook.download_file.side_effect = download_file
+    s3_hook.get_conn.return_value.head_object.side_effect = lambda Bucket, Key: {"ETag": etags[Key]}
+    return s3_hook
+
+
+def _run_multi(plugin, engine, s3_hook, key, conn=None, **kwargs):
+    pg_hook = MagicMock()
+    pg_hook.get_sqlalchemy_engine.return_value = engine
+    pg_hook.get_conn.return_value = conn
+    with patch.object(plugin, "S3Hook", return_value=s3_hook), \
+         patch.object(plugin, "PostgresHook", return_value=pg_hook):
+        op = plugin.S3ToPostgresOperator(
+            task_id="transfer", bucket="b", key=key, table="weather_data", header=0, **kwargs
+        )
+        return op.execute(context={})
+
+
+def _hour(day, hour):
+    return [(f"2024-01-{day:02d} {hour:02d}:00:00", float(day * 100 + hour), "paris")]
+
+
+def test_multi_object_glob_and_ledger(plugin, engine, tmp_path):
+    """Glob : objets listés/chargés en parallèle ; un second run ne recharge que les nouveaux"""
+    objects = {f"observations/date=2024-01-0{d}/hour=00/part.csv": _hour(d, 0) for d in (1, 2, 3)}
+    objects["observations/date=2024-02-01/hour=00/part.csv"] = _hour(31, 0)  # Hors glob
+    s3_hook = _bucket(tmp_path, objects)
+
+    assert _run_multi(plugin, engine, s3_hook, "observations/date=2024-01-*/*/part.csv", max_workers=3) == 3
+    assert pd.read_sql("SELECT COUNT(*) AS n FROM weather_data", engine)["n"][0] == 3
+    ledger = pd.read_sql("SELECT s3_key, row_count FROM s3_load_log", engine)
+    assert sorted(ledger["s3_key"]) == sorted(k for k in objects if "2024-01" in k)
+
+    objects["observations/date=2024-01-04/hour=00/part.csv"] = _hour(4, 0)
+    s3_hook = _bucket(tmp_path, objects)
+    assert _run_multi(plugin, engine, s3_hook, "observations/date=2024-01-*/*/part.csv") == 1
+    assert pd.read_sql("SELECT COUNT(*) AS n FROM weather_data", engine)["n"][0] == 4
+
+
+def test_key_list_loads_every_partition_of_the_batch(plugin, engine, tmp_path):
+    """Liste de clés (XCom d'un lot sur deux heures) : tous les objets chargés, pas seulement le dernier"""
+    objects = {f"observations/date=2024-01-01/hour=0{h}/part.csv": _hour(1, h) for h in range(3)}
+    s3_hook = _bucket(tmp_path, objects)
+    kwargs = dict(load_mode="incremental", partition_column="location")
+
+    batch = sorted(objects)[:2]
+    assert _run_multi(plugin, engine, s3_hook, batch, **kwargs) == 2
+    assert pd.read_sql("SELECT temp FROM weather_data ORDER BY temp", engine)["temp"].tolist() == [100.0, 101.0]
+
+    # Une seule clé : chargement mono-objet
+    assert _run_multi(plugin, engine, s3_hook, sorted(objects)[2:], **kwargs) == 1
+    assert pd.read_sql("SELECT COUNT(*) AS n FROM weather_data", engine)["n"][0] == 3
+
+
+def test_multi_object_failure_is_retried_alone(plugin, engine, tmp_path):
+    """Un objet en échec fait échouer la tâche ; les autres restent acquis au journal"""
+    objects = {
+        "observations/a.csv": _hour(1, 0),
+        "observations/broken.csv": _hour(1, 1),
+        "observations/c.csv": _hour(1, 2),
+        "observations.dedup.npy": [],  # Hors préfixe
+    }
+    s3_hook = _bucket(tmp_path, objects)
+    with pytest.raises(RuntimeError, match="1 objets non chargés"):
+        _run_multi(plugin, engine, s3_hook, "observations/")
+    assert sorted(pd.read_sql("SELECT s3_key FROM s3_load_log", engine)["s3_key"]) == [
+        "observations/a.csv", "observations/c.csv"
+    ]
+    assert s3_hook.download_file.call_count == 3
+
+    s3_hook.download_file.reset_mock()
+    with pytest.raises(RuntimeError):
+        _run_multi(plugin, engine, s3_hook, "observations/")
+    assert [c.kwargs["key"] for c in s3_hook.download_file.call_args_list] == ["observations/broken.csv"]
+
+
+def test_multi_object_copy_uses_connection_pool(plugin, engine, tmp_path):
+    """loader=copy : COPY + inscription au journal sur une connexion du pool, puis commit"""
+    objects = {f"observations/{h}.csv": _hour(1, h) for h in range(4)}
+    s3_hook = _bucket(tmp_path, objects)
+    copies, executed = [], []
+    conn = MagicMock()
+    conn.cursor.side_effect = lambda: FakeCursor(copies, executed)
+
+    assert _run_multi(plugin, engine, s3_hook, "observations/", conn=conn, loader="copy", db_connections=2) == 4
+    assert len(copies) == 4
+    assert sum(q.startswith("INSERT INTO s3_load_log") for q in executed) == 4
+    assert conn.commit.call_count == 4
+
+
+COLUMN_TYPES = {"datetime": "TIMESTAMP", "temp": "DECIMAL(5, 2)", "location": "VARCHAR"}
+
+
+def test_arrow_type_from_ddl(plugin):
+    import pyarrow as pa
+
+    assert plugin.arrow_type("DECIMAL(6, 2)") == pa.float64()
+    assert plugin.arrow_type("timestamp") == pa.timestamp("us")
+    with pytest.raises(ValueError):
+        plugin.arrow_type("JSONB")
+
+
+def test_typed_parsing_without_header_uses_mapping_names(plugin, engine, tmp_path):
+    """header=None + column_types : noms et types du mapping, aucune inférence"""
+    path = tmp_path / "a.csv"
+    path.write_text("2024-01-01 00:00:00,10.5,paris\n2024-01-01 01:00:00,,lyon\n")
+    copies, executed = [], []
+    conn = MagicMock()
+    conn.cursor.side_effect = lambda: FakeCursor(copies, executed)
+    _run(plugin, engine, path, conn=conn, loader="copy", copy_format="binary", column_types=COLUMN_TYPES)
+
+    assert copies[0][0].startswith('COPY weather_data ("datetime", "temp", "location")')
+    columns = {c["name"]: str(c["type"]) for c in inspect(engine).get_columns("weather_data")}
+    assert columns == {"datetime": "DATETIME", "temp": "FLOAT", "location": "TEXT"}
+
+
+def test_typed_parsing_with_header(plugin, tmp_path):
+    """header=0 : l'en-tête n'est plus une ligne de données ; les types suivent le mapping"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris")])
+    op = plugin.S3ToPostgresOperator(
+        task_id="t", bucket="b", key="weather.csv", table="weather_data", header=0, column_types=COLUMN_TYPES
+    )
+    df = op._read(str(path))
+    assert len(df) == 1
+    assert str(df["datetime"].dtype) == "datetime64[us]" and df["temp"].dtype == "float64"
+
+
+def test_typed_streaming_incremental(plugin, engine, tmp_path):
+    """Streaming Arrow typé + watermark : seules les lignes nouvelles sont chargées"""
+    kwargs = dict(load_mode="incremental", header=0, partition_column="location", chunksize=2,
+                  column_types=COLUMN_TYPES)
+    _run(plugin, engine, _write_csv(tmp_path / "a.csv", [("2024-01-01 01:00:00", 1.0, "paris")]), **kwargs)
+
+    rows = [(f"2024-01-01 0{h}:00:00", float(h), "paris") for h in range(4)]
+    assert _run(plugin, engine, _write_csv(tmp_path / "b.csv", rows), **kwargs) == 2
+
+
+def test_load_metrics_pushed_to_xcom(plugin, engine, tmp_path):
+    """Phases, lignes, octets et débit en XCom (load_metrics)"""
+    path = _write_csv(tmp_path / "a.csv", [("2024-01-01 00:00:00", 10.0, "paris"), ("2024-01-01 01:00:00", 11.0, "paris")])
+    ti = MagicMock()
+    _run(plugin, engine, path, context={"ti": ti}, header=0, load_mode="incremental")
+
+    ti.xcom_push.assert_called_once()
+    metrics = ti.xcom_push.call_args.kwargs["value"]
+    assert ti.xcom_push.call_args.kwargs["key"] == "load_metrics"
+    assert metrics["rows"] == 2 and metrics["objects"] == 1
+    assert metrics["bytes"] == path.stat().st_size
+    assert metrics["table"] == "weather_data" and metrics["load_mode"] == "incremental"
+    assert metrics["phases"]["load"] > 0 and metrics["phases"]["parse"] > 0
@@ -6,7 +6,7 @@ import pytest
 from dags.weather_utils import setup_aws_environment
 
 
-@patch("dags.weather_utils.Variable.get")
+@patch("weather_ingestion.Variable.get")
 def test_setup_aws_environment(mock_get):
     """Test de la configuration des variables AWS"""
     
@@ -32,7 +32,7 @@ def test_setup_aws_environment(mock_get):
     mock_get.assert_any_call("AWS_DEFAULT_REGION")
 
 
-@patch("dags.weather_utils.Variable.get")
+@patch("weather_ingestion.Variable.get")
 def test_setup_aws_environment_missing_variable(mock_get):
     """Test de gestion d'erreur si une variable est manquante"""
     
@@ -48,7 +48,7 @@ def test_setup_aws_environment_missing_variable(mock_get):
         setup_aws_environment()
 
 
-@patch("dags.weather_utils.Variable.get")
+@patch("weather_ingestion.Variable.get")
 def test_setup_aws_environment_cleanup(mock_get):
     """Test avec nettoyage après exécution (bonne pratique pour l'isolation des tests)"""
     
@@ -4,16 +4,24 @@
 
 import json
 import os
+import re
 import pandas as pd
 from unittest.mock import patch, MagicMock, mock_open
 import pytest
+from botocore.exceptions import ClientError
 from dags.weather_utils import transform_and_append_weather_data
+from dedup_index import DedupIndex
+from ingestion_state import last_ingested
 
 
-@patch("dags.weather_utils.S3Hook")
-@patch("dags.weather_utils.Variable.get")
-@patch("dags.weather_utils.setup_aws_environment")
-@patch("dags.weather_utils.os.path.exists")
+class SkipRun(Exception):
+    """Remplace AirflowSkipException (mockée hors Airflow)"""
+
+
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
 @patch("builtins.open", new_callable=mock_open)
 def test_transform_and_append_weather_data_new_csv(
     mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
@@ -26,6 +34,8 @@ def test_transform_and_append_weather_data_new_csv(
     # Mock du S3Hook
     mock_s3_instance = MagicMock()
     mock_s3_class.return_value = mock_s3_instance
+    # Index de dédup absent sur S3 (premier run)
+    mock_s3_instance.get_conn.return_value.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
     
     # Simuler que le CSV n'existe pas sur S3 (premier run)
     mock_s3_instance.download_file.side_effect = Exception("CSV not found")
@@ -70,14 +80,15 @@ def test_transform_and_append_weather_data_new_csv(
         key="weather_csv_key",
         value="weather_paris_fect.csv"
     )
+    assert last_ingested() == {"paris": 1700000000}
 
 
-@patch("dags.weather_utils.S3Hook")
-@patch("dags.weather_utils.Variable.get")
-@patch("dags.weather_utils.setup_aws_environment")
-@patch("dags.weather_utils.os.path.exists")
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
 @patch("builtins.open", new_callable=mock_open)
-@patch("dags.weather_utils.pd.read_csv")
+@patch("weather_ingestion.pd.read_csv")
 def test_transform_and_append_weather_data_existing_csv(
     mock_read_csv, mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
 ):
@@ -86,6 +97,8 @@ def test_transform_and_append_weather_data_existing_csv(
     mock_var.return_value = "FAKE_BUCKET"
     mock_s3_instance = MagicMock()
     mock_s3_class.return_value = mock_s3_instance
+    # Index de dédup absent sur S3 (premier run)
+    mock_s3_instance.get_conn.return_value.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
     mock_ti = MagicMock()
     mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
     context = {"ti": mock_ti}
@@ -129,8 +142,8 @@ def test_transform_and_append_weather_data_existing_csv(
     )
 
 
-@patch("dags.weather_utils.setup_aws_environment")
-@patch("dags.weather_utils.os.path.exists")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
 def test_transform_and_append_weather_data_missing_json(mock_exists, mock_setup):
     """Test avec JSON manquant (doit lever une erreur)"""
     
@@ -143,12 +156,13 @@ def test_transform_and_append_weather_data_missing_json(mock_exists, mock_setup)
         transform_and_append_weather_data(**context)
 
 
-@patch("dags.weather_utils.S3Hook")
-@patch("dags.weather_utils.Variable.get")
-@patch("dags.weather_utils.setup_aws_environment")
-@patch("dags.weather_utils.os.path.exists")
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
 @patch("builtins.open", new_callable=mock_open)
-@patch("dags.weather_utils.pd.read_csv")
+@patch("weather_ingestion.pd.read_csv")
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
 def test_transform_and_append_weather_data_duplicate_prevention(
     mock_read_csv, mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
 ):
@@ -157,6 +171,8 @@ def test_transform_and_append_weather_data_duplicate_prevention(
     mock_var.return_value = "FAKE_BUCKET"
     mock_s3_instance = MagicMock()
     mock_s3_class.return_value = mock_s3_instance
+    # Index de dédup absent sur S3 (premier run)
+    mock_s3_instance.get_conn.return_value.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
     mock_ti = MagicMock()
     mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
     context = {"ti": mock_ti}
@@ -189,7 +205,229 @@ def test_transform_and_append_weather_data_duplicate_prevention(
     mock_read_csv.return_value = existing_df
     mock_s3_instance.download_file.return_value = None
     
+    with pytest.raises(SkipRun):
+        transform_and_append_weather_data(**context)
+    
+    # Plus de ré-upload inchangé : ni S3, ni transfert Postgres
+    mock_s3_instance.load_file.assert_not_called()
+    mock_ti.xcom_push.assert_not_called()
+    assert last_ingested() == {"paris": 1672531200}
+
+
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
+@patch("builtins.open", new_callable=mock_open)
+@patch("weather_ingestion.pd.read_csv")
+def test_transform_and_append_weather_data_partitioned(
+    mock_read_csv, mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
+):
+    """Mode partitionné : un objet par observation, sans relire l'historique"""
+    
+    mock_var.return_value = "FAKE_BUCKET"
+    mock_s3_instance = MagicMock()
+    mock_s3_class.return_value = mock_s3_instance
+    # Index de dédup absent sur S3 (premier run)
+    mock_s3_instance.get_conn.return_value.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+    mock_s3_client = mock_s3_instance.get_conn.return_value
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
+    context = {"ti": mock_ti}
+    
+    fake_json = {
+        "dt": 1700000000,  # 2023-11-14 22:13:20 UTC
+        "main": {"temp": 20, "feels_like": 19, "pressure": 1000, "humidity": 50},
+        "clouds": {"all": 10},
+        "wind": {"speed": 3.5, "deg": 180},
+        "weather": [{"main": "Clear", "description": "sunny"}],
+    }
+    mock_exists.return_value = True
+    mock_file.return_value.read.return_value = json.dumps(fake_json)
+    
+    transform_and_append_weather_data(storage_mode="partitioned", **context)
+    
+    # Aucun download / read du CSV historique, aucun ré-upload complet
+    mock_s3_instance.download_file.assert_not_called()
+    mock_read_csv.assert_not_called()
+    mock_s3_instance.load_file.assert_not_called()
+    
+    # Un PUT pour la partition, un pour l'index de dédup
+    put_keys = [c[1]["Key"] for c in mock_s3_client.put_object.call_args_list]
+    expected_key = put_keys[0]
+    assert re.fullmatch(r"observations/date=2023-11-14/hour=22/1700000000-1700000000-[0-9a-f]{8}\.csv", expected_key)
+    assert put_keys[1:] == ["observations.dedup.npy"]
+    assert mock_s3_client.put_object.call_args_list[0][1]["Bucket"] == "FAKE_BUCKET"
+    mock_ti.xcom_push.assert_called_once_with(key="weather_csv_key", value=[expected_key])
+
+
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
+@patch("builtins.open", new_callable=mock_open)
+def test_transform_and_append_weather_data_partitioned_batch_spanning_two_hours(
+    mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
+):
+    """Lot sur deux heures : deux partitions, toutes deux poussées pour le transfert Postgres"""
+    
+    mock_var.return_value = "FAKE_BUCKET"
+    mock_s3_instance = MagicMock()
+    mock_s3_class.return_value = mock_s3_instance
+    mock_s3_client = mock_s3_instance.get_conn.return_value
+    mock_s3_client.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")  # Index absent
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
+    context = {"ti": mock_ti}
+    
+    def payload(dt, location):
+        return {
+            "dt": dt, "location": location,
+            "main": {"temp": 20, "feels_like": 19, "pressure": 1000, "humidity": 50},
+            "clouds": {"all": 10},
+            "wind": {"speed": 3.5, "deg": 180},
+            "weather": [{"main": "Clear", "description": "sunny"}],
+        }
+    
+    batch = [payload(1700000000, "paris"), payload(1700003000, "lyon")]  # 22:13 puis 23:03
+    mock_exists.return_value = True
+    mock_file.return_value.read.return_value = json.dumps(batch)
+    
+    transform_and_append_weather_data(storage_mode="partitioned", **context)
+    
+    put_keys = [c[1]["Key"] for c in mock_s3_client.put_object.call_args_list]
+    expected_keys = sorted(put_keys[:2])
+    assert re.fullmatch(r"observations/date=2023-11-14/hour=22/1700000000-1700000000-[0-9a-f]{8}\.csv", expected_keys[0])
+    assert re.fullmatch(r"observations/date=2023-11-14/hour=23/1700003000-1700003000-[0-9a-f]{8}\.csv", expected_keys[1])
+    mock_ti.xcom_push.assert_called_once_with(key="weather_csv_key", value=expected_keys)
+
+
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
+@patch("builtins.open", new_callable=mock_open)
+@patch("weather_ingestion.pd.read_csv")
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+def test_transform_and_append_weather_data_dedup_index_hit(
+    mock_read_csv, mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
+):
+    """Doublon détecté par l'index : ni download, ni parse, ni upload du CSV"""
+    
+    mock_var.return_value = "FAKE_BUCKET"
+    mock_s3_instance = MagicMock()
+    mock_s3_class.return_value = mock_s3_instance
+    mock_s3_client = mock_s3_instance.get_conn.return_value
+    mock_s3_client.get_object.return_value = {
+        "Body": MagicMock(read=MagicMock(return_value=DedupIndex([1672531200]).to_bytes()))
+    }
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
+    context = {"ti": mock_ti}
+    
+    fake_json = {
+        "dt": 1672531200,
+        "main": {"temp": 20, "feels_like": 19, "pressure": 1000, "humidity": 50},
+        "clouds": {"all": 10},
+        "wind": {"speed": 3.5, "deg": 180},
+        "weather": [{"main": "Clear", "description": "sunny"}],
+    }
+    mock_exists.return_value = True
+    mock_file.return_value.read.return_value = json.dumps(fake_json)
+    
+    with pytest.raises(SkipRun):
+        transform_and_append_weather_data(**context)
+    
+    mock_s3_client.get_object.assert_called_once_with(
+        Bucket="FAKE_BUCKET", Key="weather_paris_fect.csv.dedup.npy"
+    )
+    mock_s3_instance.download_file.assert_not_called()
+    mock_read_csv.assert_not_called()
+    mock_s3_instance.load_file.assert_not_called()
+    mock_ti.xcom_push.assert_not_called()
+
+
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
+@patch("builtins.open", new_callable=mock_open)
+@patch("weather_ingestion.pd.read_csv")
+@patch("weather_ingestion.pd.DataFrame.to_csv")
+def test_transform_and_append_weather_data_dedup_index_updated(
+    mock_to_csv, mock_read_csv, mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
+):
+    """Index absent : reconstruit depuis l'historique puis sauvegardé avec le nouveau dt"""
+    
+    mock_var.return_value = "FAKE_BUCKET"
+    mock_s3_instance = MagicMock()
+    mock_s3_class.return_value = mock_s3_instance
+    mock_s3_client = mock_s3_instance.get_conn.return_value
+    mock_s3_client.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
+    context = {"ti": mock_ti}
+    
+    fake_json = {
+        "dt": 1700000000,
+        "main": {"temp": 20, "feels_like": 19, "pressure": 1000, "humidity": 50},
+        "clouds": {"all": 10},
+        "wind": {"speed": 3.5, "deg": 180},
+        "weather": [{"main": "Clear", "description": "sunny"}],
+    }
+    mock_exists.return_value = True
+    mock_file.return_value.read.return_value = json.dumps(fake_json)
+    mock_read_csv.return_value = pd.DataFrame([
+        {"datetime": "2023-01-01 00:00:00", "temp": 15.0, "weather_main": "Rain"},
+    ])
+    
     transform_and_append_weather_data(**context)
     
     mock_s3_instance.load_file.assert_called_once()
-    mock_ti.xcom_push.assert_called_once()
+    put_kwargs = mock_s3_client.put_object.call_args[1]
+    assert put_kwargs["Key"] == "weather_paris_fect.csv.dedup.npy"
+    saved = DedupIndex.from_bytes(put_kwargs["Body"])
+    assert list(saved.epochs) == [1672531200, 1700000000]
+
+
+@patch("weather_ingestion.S3Hook")
+@patch("weather_ingestion.Variable.get")
+@patch("weather_ingestion.setup_aws_environment")
+@patch("weather_ingestion.os.path.exists")
+@patch("builtins.open", new_callable=mock_open)
+@patch("weather_ingestion.pd.read_csv")
+def test_transform_and_append_weather_data_multi_location_batch(
+    mock_read_csv, mock_file, mock_exists, mock_setup, mock_var, mock_s3_class
+):
+    """Batch multi-villes : un seul objet écrit, doublons filtrés par (location, dt)"""
+    
+    mock_var.return_value = "FAKE_BUCKET"
+    mock_s3_instance = MagicMock()
+    mock_s3_class.return_value = mock_s3_instance
+    mock_s3_client = mock_s3_instance.get_conn.return_value
+    # Paris déjà ingéré à ce dt, Lyon non
+    mock_s3_client.get_object.return_value = {
+        "Body": MagicMock(read=MagicMock(return_value=DedupIndex([1700000000]).to_bytes()))
+    }
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
+    context = {"ti": mock_ti}
+    
+    base = {
+        "dt": 1700000000,
+        "main": {"temp": 20, "feels_like": 19, "pressure": 1000, "humidity": 50},
+        "clouds": {"all": 10},
+        "wind": {"speed": 3.5, "deg": 180},
+        "weather": [{"main": "Clear", "description": "sunny"}],
+    }
+    batch = [{**base, "location": "paris"}, {**base, "location": "lyon"}]
+    mock_exists.return_value = True
+    mock_file.return_value.read.return_value = json.dumps(batch)
+    
+    transform_and_append_weather_data(storage_mode="partitioned", **context)
+    
+    mock_read_csv.assert_not_called()
+    partition_put, index_put = mock_s3_client.put_object.call_args_list
+    rows = partition_put[1]["Body"].decode("utf-8").strip().splitlines()
+    assert len(rows) == 2 and rows[1].endswith(",lyon")
+    assert len(DedupIndex.from_bytes(index_put[1]["Body"])) == 2
@@ -0,0 +1,85 @@
+# tests/unit/test_weather_backfill.py
+
+#✅ Test — backfill depuis les exports bulk (plugins/weather_backfill.py)
+
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_s3
+
+from weather_backfill import backfill, byte_chunks, load_bulk
+from weather_store import read_time_range
+
+BUCKET = "test-weather-bucket"
+
+BULK_HEADER = (
+    "dt,dt_iso,timezone,city_name,lat,lon,temp,visibility,dew_point,feels_like,temp_min,temp_max,"
+    "pressure,sea_level,grnd_level,humidity,wind_speed,wind_deg,wind_gust,rain_1h,rain_3h,snow_1h,"
+    "snow_3h,clouds_all,weather_id,weather_main,weather_description,weather_icon"
+)
+
+
+@pytest.fixture
+def s3_client():
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _write_bulk(path, start, hours, city="Lyon"):
+    """Export horaire au format OpenWeather History Bulk"""
+    rows = [BULK_HEADER]
+    for i, ts in enumerate(pd.date_range(start, periods=hours, freq="h")):
+        dt = int(ts.timestamp())
+        rain = "0.5" if i % 5 == 0 else ""
+        rows.append(
+            f"{dt},{ts} +0000 UTC,3600,{city},45.76,4.84,{10 + i % 7},10000,5.1,9.5,8,12,"
+            f"1015,,,80,3.2,200,,{rain},,,,75,803,Clouds,broken clouds,04d"
+        )
+    path.write_text("\n".join(rows) + "\n")
+    return str(path)
+
+
+def test_byte_chunks_cover_file(tmp_path):
+    """Les tranches sont contiguës, alignées sur les lignes, et couvrent tout le fichier"""
+    path = _write_bulk(tmp_path / "lyon.csv", "2020-01-01", 200)
+    header, chunks = byte_chunks(path, chunk_bytes=1000)
+
+    assert header[0] == "dt" and len(chunks) > 5
+    data = open(path, "rb").read()
+    assert chunks[-1][1] == len(data)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start and data[end - 1:end] == b"\n"
+
+
+def test_load_bulk_parallel_matches_sequential(tmp_path):
+    """Parsing en pool de process = parsing séquentiel ; mapping vers les colonnes ETL"""
+    path = _write_bulk(tmp_path / "lyon.csv", "2020-01-01", 300)
+
+    parallel = load_bulk({"lyon": path}, workers=2, chunk_bytes=2000)
+    sequential = load_bulk({"lyon": path}, workers=1, chunk_bytes=10**9)
+
+    pd.testing.assert_frame_equal(parallel, sequential)
+    assert len(parallel) == 300
+    assert parallel["clouds"].iloc[0] == 75
+    assert parallel["rain_1h"].isna().sum() == 0
+    assert set(parallel["location"]) == {"lyon"}
+
+
+def test_backfill_writes_range_once(tmp_path, s3_client):
+    """Plage de dates respectée ; un second backfill n'écrit rien (dédup)"""
+    bulk_dir = tmp_path / "bulk"
+    bulk_dir.mkdir()
+    _write_bulk(bulk_dir / "lyon_2020.csv", "2020-01-01", 72)
+    sources = {"lyon": str(bulk_dir)}
+
+    stats = backfill(s3_client, BUCKET, sources, start="2020-01-02", end="2020-01-02 23:00",
+                     workers=2, chunk_bytes=1500)
+    again = backfill(s3_client, BUCKET, sources, start="2020-01-02", end="2020-01-02 23:00",
+                     workers=1)
+
+    assert stats["written"] == 24 and stats["objects"] == 24
+    assert again["written"] == 0 and again["duplicates"] == 24
+    df = read_time_range(s3_client, BUCKET, start="2020-01-01", end="2020-01-04", location="lyon")
+    assert len(df) == 24
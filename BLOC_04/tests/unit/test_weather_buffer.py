@@ -0,0 +1,113 @@
+# tests/unit/test_weather_buffer.py
+
+#✅ Test — journal local et flush par lots (plugins/weather_buffer.py)
+
+import json
+from unittest.mock import MagicMock, mock_open, patch
+
+import pytest
+
+import weather_buffer
+from dags.weather_utils import flush_weather_buffer, transform_and_append_weather_data
+
+
+class SkipRun(Exception):
+    """Remplace AirflowSkipException (mockée hors Airflow)"""
+
+
+def _payload(dt, location="paris"):
+    return {
+        "dt": dt,
+        "main": {"temp": 20, "feels_like": 19, "pressure": 1000, "humidity": 50},
+        "clouds": {"all": 10},
+        "wind": {"speed": 3.5, "deg": 180},
+        "weather": [{"main": "Clear", "description": "sunny"}],
+        "location": location,
+    }
+
+
+def test_append_ignores_duplicates():
+    """(location, dt) déjà journalisé → ignoré"""
+    assert weather_buffer.append([_payload(100), _payload(100, "lyon")]) == 2
+    assert weather_buffer.append([_payload(100)]) == 0
+    assert weather_buffer.status()[0] == 2
+
+
+def test_is_due_by_rows_or_age():
+    """Flush dû à M lignes, ou quand la plus ancienne a N minutes"""
+    assert not weather_buffer.is_due(max_minutes=15, max_rows=3)
+    weather_buffer.append([_payload(100), _payload(200)], now=1000)
+
+    assert not weather_buffer.is_due(max_minutes=15, max_rows=3, now=1000 + 60)
+    assert weather_buffer.is_due(max_minutes=15, max_rows=3, now=1000 + 15 * 60)
+    assert weather_buffer.is_due(max_minutes=15, max_rows=2, now=1000)
+
+
+def test_ack_only_removes_shipped_rows():
+    """Les lignes arrivées pendant le flush restent dans le journal"""
+    weather_buffer.append([_payload(100)])
+    last_id, payloads = weather_buffer.pending()
+    weather_buffer.append([_payload(200)])
+
+    weather_buffer.ack(last_id)
+
+    assert [p["dt"] for p in payloads] == [100]
+    assert [p["dt"] for p in weather_buffer.pending()[1]] == [200]
+
+
+@patch("weather_ingestion._persist_observations")
+@patch("weather_ingestion.os.path.exists", return_value=True)
+@patch("builtins.open", new_callable=mock_open)
+def test_buffered_transform_writes_nothing_to_s3(mock_file, mock_exists, mock_persist):
+    """Mode buffered : journal local seulement"""
+    mock_file.return_value.read.return_value = json.dumps([_payload(100)])
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
+
+    transform_and_append_weather_data(buffered="true", ti=mock_ti)
+
+    mock_persist.assert_not_called()
+    mock_ti.xcom_push.assert_not_called()
+    assert weather_buffer.status()[0] == 1
+
+
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+@patch("weather_ingestion._persist_observations")
+def test_flush_not_due_is_skipped(mock_persist):
+    weather_buffer.append([_payload(100)])
+    with pytest.raises(SkipRun, match="Flush non dû"):
+        flush_weather_buffer(buffered="true", flush_minutes="15", flush_rows="100", ti=MagicMock())
+    mock_persist.assert_not_called()
+
+
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+@patch("weather_ingestion._persist_observations")
+def test_flush_ships_batch_then_acks(mock_persist):
+    """Flush dû : un seul lot expédié, journal vidé"""
+    weather_buffer.append([_payload(100), _payload(200), _payload(100, "lyon")])
+
+    flush_weather_buffer(buffered="true", flush_minutes="15", flush_rows="3", ti=MagicMock())
+
+    payloads = mock_persist.call_args[0][0]
+    assert len(payloads) == 3
+    assert weather_buffer.status()[0] == 0
+
+
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+@patch("weather_ingestion._persist_observations", side_effect=RuntimeError("S3 down"))
+def test_failed_flush_keeps_rows_for_replay(mock_persist):
+    """Échec S3 : rien n'est retiré, le flush suivant rejoue"""
+    weather_buffer.append([_payload(100)])
+    with pytest.raises(RuntimeError):
+        flush_weather_buffer(buffered="true", flush_minutes="0", flush_rows="1", ti=MagicMock())
+    assert weather_buffer.status()[0] == 1
+
+
+def test_flush_passthrough_when_not_buffered():
+    """Mode direct : la clé de la transformation est relayée"""
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "weather_paris_fect.csv"
+
+    flush_weather_buffer(buffered="false", ti=mock_ti)
+
+    mock_ti.xcom_push.assert_called_once_with(key="weather_csv_key", value="weather_paris_fect.csv")
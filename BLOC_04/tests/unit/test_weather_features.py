@@ -0,0 +1,83 @@
+# tests/unit/test_weather_features.py
+
+#✅ Test — features partagées entraînement / temps réel (plugins/weather_features.py)
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from weather_features import (
+    FEATURE_COLUMNS,
+    build_features,
+    history_features,
+    payload_features,
+)
+
+
+def _payload(dt, temp=15.5):
+    return {
+        "dt": dt,
+        "main": {"temp": temp, "feels_like": 14.2, "pressure": 1013, "humidity": 65},
+        "clouds": {"all": 75},
+        "visibility": 10000,
+        "wind": {"speed": 3.5, "deg": 180},
+    }
+
+
+@pytest.fixture
+def history():
+    rng = np.random.default_rng(0)
+    n = 500
+    return pd.DataFrame({
+        "datetime": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365 * 24, n), unit="h"),
+        **{c: rng.uniform(0, 100, n) for c in FEATURE_COLUMNS[:9]},
+    })
+
+
+def test_matrix_is_contiguous_float32_in_model_order(history):
+    matrix = build_features(history["datetime"], history)
+
+    assert matrix.dtype == np.float32
+    assert matrix.flags["C_CONTIGUOUS"]
+    assert matrix.shape == (len(history), len(FEATURE_COLUMNS)) == (500, 17)
+
+
+def test_calendar_features_match_pandas(history):
+    """hour / month / weekday identiques aux accesseurs .dt"""
+    features = history_features(history)
+    dt = history["datetime"].dt
+
+    assert (features["hour"] == dt.hour).all()
+    assert (features["month"] == dt.month).all()
+    assert (features["weekday"] == dt.weekday).all()
+    assert (features["is_weekend"] == (dt.weekday >= 5)).all()
+    np.testing.assert_allclose(features["month_cos"], np.cos(2 * np.pi * dt.month / 12), atol=1e-6)
+
+
+def test_payloads_and_history_give_same_features():
+    """Parité : même observation en JSON API ou en ligne d'historique"""
+    payloads = [_payload(1697270400), _payload(1697500000, temp=-4.25)]
+    history = pd.DataFrame({
+        "datetime": pd.to_datetime([1697270400, 1697500000], unit="s"),
+        "temp": [15.5, -4.25], "feels_like": [14.2, 14.2], "pressure": [1013, 1013],
+        "humidity": [65, 65], "clouds": [75, 75], "visibility": [10000, 10000],
+        "wind_speed": [3.5, 3.5], "wind_deg": [180, 180], "rain_1h": [0.0, 0.0],
+    })
+
+    pd.testing.assert_frame_equal(payload_features(payloads), history_features(history))
+
+
+def test_arrow_columns_and_missing_measures():
+    """Colonnes Arrow acceptées ; mesure absente → NaN"""
+    table = pa.table({
+        "datetime": pa.array(pd.to_datetime(["2024-06-01 13:00"]).to_numpy(), pa.timestamp("ns")),
+        "temp": pa.array([21.0]),
+    })
+
+    matrix = build_features(table["datetime"], table)
+
+    assert matrix[0, FEATURE_COLUMNS.index("temp")] == 21.0
+    assert np.isnan(matrix[0, FEATURE_COLUMNS.index("rain_1h")])
+    assert matrix[0, FEATURE_COLUMNS.index("hour")] == 13
+    assert matrix[0, FEATURE_COLUMNS.index("is_weekend")] == 1  # samedi
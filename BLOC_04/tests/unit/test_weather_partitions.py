@@ -0,0 +1,204 @@
+# tests/unit/test_weather_partitions.py
+
+#✅ Test — partitions mensuelles de weather_data (plugins/weather_partitions.py)
+
+from unittest.mock import MagicMock
+
+import pandas as pd
+
+import weather_partitions as wp
+
+
+class ScriptedCursor:
+    """Curseur Postgres simulé : catalogue minimal (relkind, partitions, mois en DEFAULT)"""
+
+    def __init__(self, relkind="p", partitions=(), default_months=(), legacy_months=(),
+                 legacy_relkind=None, legacy_constraints=(), legacy_indexes=(),
+                 legacy_columns=("datetime", "temp", "location")):
+        self.relkind = relkind
+        self.legacy_relkind = legacy_relkind
+        self.legacy_constraints = list(legacy_constraints)
+        self.legacy_indexes = list(legacy_indexes)
+        self.legacy_columns = list(legacy_columns)
+        self.partitions = set(partitions)
+        self.default_months = [pd.Timestamp(m) for m in default_months]
+        self.legacy_months = [pd.Timestamp(m) for m in legacy_months]
+        self.executed = []
+        self.rowcount = 0
+        self._result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append(query)
+        self._result = []
+        if "pg_class WHERE oid" in query:
+            kind = self.legacy_relkind if params[0].endswith("_legacy") else self.relkind
+            self._result = [(kind,)] if kind else []
+        elif "pg_constraint" in query:
+            self._result = [(name,) for name in self.legacy_constraints]
+        elif "pg_indexes" in query:
+            self._result = [(name,) for name in self.legacy_indexes]
+        elif "pg_inherits" in query:
+            self._result = [(name,) for name in self.partitions]
+        elif "date_trunc" in query:
+            months = self.default_months if "_default" in query else self.legacy_months
+            self._result = [(m,) for m in months]
+        elif "information_schema.columns" in query:
+            self._result = [(name,) for name in self.legacy_columns]
+        elif "PARTITION OF" in query or "ATTACH PARTITION" in query:
+            self.partitions.add(query.split()[5] if "IF NOT EXISTS" in query else query.split()[2])
+        elif "DETACH PARTITION" in query:
+            self.partitions.discard(query.split()[-1])
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+
+def _conn(cursor):
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    return conn
+
+
+def test_create_table_statements():
+    """Table partitionnée par mois, clés incluant datetime, index BRIN"""
+    ddl, default, brin = wp.create_table_statements()
+    assert "PARTITION BY RANGE (datetime)" in ddl
+    assert "PRIMARY KEY (id, datetime)" in ddl and "UNIQUE (location, datetime)" in ddl
+    assert "pressure DECIMAL(6, 2)" in ddl and "location VARCHAR NOT NULL DEFAULT 'paris'" in ddl
+    assert default == "CREATE TABLE IF NOT EXISTS weather_data_default PARTITION OF weather_data DEFAULT"
+    assert brin.endswith("USING BRIN (datetime)")
+
+
+def test_partition_names_and_bounds():
+    assert wp.partition_name("2024-12-15 10:00") == "weather_data_2024_12"
+    assert wp.partition_month("weather_data_2024_12") == pd.Timestamp("2024-12-01")
+    assert wp.partition_month("weather_data_default") is None
+    assert wp.create_partition_sql("2024-12-15").endswith("FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')")
+
+
+def test_maintain_creates_future_partitions():
+    """Mois courant + months_ahead créés, les existants ignorés"""
+    cursor = ScriptedCursor(partitions=["weather_data_default", "weather_data_2024_03"])
+    conn = _conn(cursor)
+    summary = wp.maintain_partitions(conn, now="2024-03-20", months_ahead=2)
+
+    assert summary["created"] == ["weather_data_2024_04", "weather_data_2024_05"]
+    assert summary["archived"] == [] and not summary["migrated"]
+    conn.commit.assert_called_once()
+
+
+def test_maintain_splits_default_partition():
+    """Lignes tombées dans DEFAULT → partition dédiée attachée après déplacement"""
+    cursor = ScriptedCursor(partitions=["weather_data_default"], default_months=["2019-06-01"])
+    summary = wp.maintain_partitions(_conn(cursor), now="2024-03-20", months_ahead=0)
+
+    assert summary["split"] == ["weather_data_2019_06"]
+    first = cursor.executed.index("CREATE TABLE weather_data_2019_06 (LIKE weather_data INCLUDING DEFAULTS)")
+    split = cursor.executed[first:first + 4]
+    assert split[0] == "CREATE TABLE weather_data_2019_06 (LIKE weather_data INCLUDING DEFAULTS)"
+    assert split[2].startswith("DELETE FROM weather_data_default WHERE datetime >= '2019-06-01'")
+    assert split[3].startswith("ALTER TABLE weather_data ATTACH PARTITION weather_data_2019_06")
+
+
+def test_maintain_archives_old_partitions():
+    """Rétention (3 mois pleins avant le mois courant) : partitions plus anciennes archivées"""
+    cursor = ScriptedCursor(partitions=[
+        "weather_data_default", "weather_data_2023_01", "weather_data_2023_12", "weather_data_2024_03",
+    ])
+    summary = wp.maintain_partitions(_conn(cursor), now="2024-03-20", months_ahead=0, retention_months=3)
+
+    assert summary["archived"] == ["weather_data_2023_01"]
+    assert "ALTER TABLE weather_data_2023_01 SET SCHEMA weather_archive" in cursor.executed
+
+
+def test_maintain_migrates_legacy_table():
+    """Table non partitionnée existante : renommée, recréée partitionnée, lignes recopiées"""
+    cursor = ScriptedCursor(relkind="r", legacy_months=["2024-01-01", "2024-02-01"])
+    summary = wp.maintain_partitions(_conn(cursor), now="2024-02-10", months_ahead=0)
+
+    assert summary["migrated"]
+    assert "ALTER TABLE weather_data RENAME TO weather_data_legacy" in cursor.executed
+    assert any(q.startswith("CREATE TABLE IF NOT EXISTS weather_data_2024_01 PARTITION OF") for q in cursor.executed)
+    assert (
+        "INSERT INTO weather_data (datetime, temp, location) SELECT datetime, temp, location"
+        " FROM weather_data_legacy WHERE datetime IS NOT NULL ON CONFLICT DO NOTHING"
+    ) in cursor.executed
+    assert summary["created"] == []  # 2024_02 déjà créée par la migration
+    assert wp.enqueue_sql("weather_data") in cursor.executed  # Lignes recopiées → file des agrégats
+
+
+def test_migration_maps_positional_legacy_columns():
+    """Ancienne table issue de read_csv(header=None) : colonnes "0".."12" converties, en-tête écarté"""
+    cursor = ScriptedCursor(relkind="r", legacy_months=["2024-01-01"],
+                            legacy_columns=[str(i) for i in range(13)])
+    assert wp.ensure_table(_conn(cursor))
+
+    datetime_sql = "CAST(NULLIF(NULLIF(\"0\"::TEXT, 'datetime'), '') AS TIMESTAMP)"
+    assert f"SELECT DISTINCT date_trunc('month', {datetime_sql}) FROM weather_data_legacy" in cursor.executed
+    insert = next(q for q in cursor.executed if q.startswith("INSERT INTO weather_data "))
+    assert insert.startswith("INSERT INTO weather_data (datetime, temp, feels_like,")
+    assert "weather_description) SELECT " in insert and ", location" not in insert
+    assert "CAST(NULLIF(NULLIF(\"1\"::TEXT, 'temp'), '') AS DECIMAL(5, 2))" in insert
+    assert insert.endswith(f"WHERE {datetime_sql} IS NOT NULL ON CONFLICT DO NOTHING")
+
+
+def test_migration_skips_copy_without_known_columns():
+    """Aucune colonne reconnue : table partitionnée créée, pas d'INSERT invalide"""
+    cursor = ScriptedCursor(relkind="r", legacy_columns=["foo", "bar"])
+    assert wp.ensure_table(_conn(cursor))
+
+    assert not any(q.startswith("INSERT INTO") for q in cursor.executed)
+    assert not any("date_trunc" in q for q in cursor.executed)
+    assert any(q.startswith("CREATE INDEX IF NOT EXISTS weather_data_datetime_brin") for q in cursor.executed)
+
+
+def test_migration_renames_legacy_indexes_before_creating_brin():
+    """Index / contraintes de l'ancienne table renommés : le BRIN de la table partitionnée est créé"""
+    cursor = ScriptedCursor(
+        relkind="r",
+        legacy_constraints=["weather_data_pkey", "weather_data_datetime_key"],
+        legacy_indexes=["weather_data_datetime_brin", "weather_data_legacy_pkey"],
+    )
+    wp.maintain_partitions(_conn(cursor), now="2024-02-10", months_ahead=0)
+
+    renames = [
+        "ALTER TABLE weather_data_legacy RENAME CONSTRAINT weather_data_pkey TO weather_data_legacy_pkey",
+        "ALTER TABLE weather_data_legacy RENAME CONSTRAINT weather_data_datetime_key TO weather_data_legacy_datetime_key",
+        "ALTER INDEX weather_data_datetime_brin RENAME TO weather_data_legacy_datetime_brin",
+    ]
+    assert all(q in cursor.executed for q in renames)
+    assert not any("RENAME TO weather_data_legacy_legacy" in q for q in cursor.executed)
+    brin = next(i for i, q in enumerate(cursor.executed) if q.startswith("CREATE INDEX IF NOT EXISTS weather_data_datetime_brin"))
+    assert brin > cursor.executed.index(renames[-1])
+
+
+def test_ensure_table_migrates_legacy_table_before_load():
+    """Appelé par l'ETL : une table classique est migrée sans attendre la maintenance"""
+    cursor = ScriptedCursor(relkind="r")
+    conn = _conn(cursor)
+
+    assert wp.ensure_table(conn)
+
+    assert cursor.executed[0].startswith("SELECT pg_advisory_xact_lock")
+    assert "ALTER TABLE weather_data RENAME TO weather_data_legacy" in cursor.executed
+    conn.commit.assert_called_once()
+
+
+def test_ensure_table_frees_brin_name_after_earlier_migration():
+    """Migration déjà faite (index non renommés) : l'index BRIN de l'ancienne table est renommé puis recréé"""
+    cursor = ScriptedCursor(relkind="p", legacy_relkind="r", legacy_indexes=["weather_data_datetime_brin"])
+
+    assert not wp.ensure_table(_conn(cursor))
+
+    rename = cursor.executed.index("ALTER INDEX weather_data_datetime_brin RENAME TO weather_data_legacy_datetime_brin")
+    assert cursor.executed[-1].startswith("CREATE INDEX IF NOT EXISTS weather_data_datetime_brin")
+    assert rename < len(cursor.executed) - 1
@@ -0,0 +1,239 @@
+# tests/unit/test_weather_pg_sink.py
+
+#✅ Test — écriture directe dans weather_data (plugins/weather_pg_sink.py)
+
+import json
+import threading
+from unittest.mock import MagicMock, mock_open, patch
+
+import pandas as pd
+import pytest
+
+import weather_buffer
+import weather_pg_sink
+from dags.weather_utils import export_weather_buffer, flush_weather_buffer, transform_and_append_weather_data
+
+
+class SkipRun(Exception):
+    """Remplace AirflowSkipException (mockée hors Airflow)"""
+
+
+def _payload(dt, location="paris"):
+    return {
+        "dt": dt,
+        "main": {"temp": 20, "feels_like": 19, "pressure": 1000, "humidity": 50},
+        "clouds": {"all": 10},
+        "wind": {"speed": 3.5, "deg": 180},
+        "weather": [{"main": "Clear", "description": "sunny"}],
+        "location": location,
+    }
+
+
+class FakePool:
+    """ThreadedConnectionPool minimal : une connexion, curseur enregistreur"""
+
+    def __init__(self, rowcount=2, fail=False):
+        self.conn = MagicMock()
+        self.cursor = self.conn.cursor.return_value.__enter__.return_value
+        self.cursor.rowcount = rowcount
+        self.cursor.fetchone.return_value = ("p",)  # weather_data déjà partitionnée
+        self.cursor.fetchall.return_value = []
+        if fail:
+            self.cursor.execute.side_effect = lambda sql, params=None: (
+                (_ for _ in ()).throw(RuntimeError("db down")) if sql.startswith("INSERT") else None
+            )
+        self.released = 0
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn):
+        self.released += 1
+
+    def statements(self):
+        return [c.args[0] for c in self.cursor.execute.call_args_list]
+
+
+@pytest.fixture(autouse=True)
+def _reset_sink():
+    weather_pg_sink.close_pools()
+    yield
+    weather_pg_sink.close_pools()
+
+
+def test_array_types_follow_column_types():
+    assert weather_pg_sink.array_type("DECIMAL(5, 2)") == "numeric[]"
+    assert weather_pg_sink.array_type("TIMESTAMP") == "timestamp[]"
+    assert weather_pg_sink.array_type("VARCHAR") == "varchar[]"
+
+
+def test_insert_sql_is_one_set_based_statement():
+    """Un tableau par colonne, déplié par unnest, dédup par ON CONFLICT"""
+    sql = weather_pg_sink.insert_sql()
+
+    assert sql.count("%s") == len(weather_pg_sink.WEATHER_DATA_COLUMN_TYPES)
+    assert "SELECT * FROM unnest(%s::timestamp[], %s::numeric[]" in sql
+    assert sql.endswith('ON CONFLICT ("location", "datetime") DO NOTHING')
+
+
+def test_column_arrays_convert_missing_values():
+    df = pd.DataFrame({
+        "datetime": pd.to_datetime([1700000000, None], unit="s"),
+        "temp": [20.5, float("nan")],
+        "location": ["paris", None],
+    })
+
+    datetimes, temps, locations = weather_pg_sink.column_arrays(df, ["datetime", "temp", "location"])
+
+    assert datetimes == [pd.Timestamp(1700000000, unit="s").to_pydatetime(), None]
+    assert temps == [20.5, None]
+    assert locations == ["paris", None]
+
+
+def test_write_observations_single_insert_and_ddl_once():
+    """DDL (ensure_table) au premier lot seulement, puis un seul INSERT par lot"""
+    pool = FakePool(rowcount=2)
+
+    assert weather_pg_sink.write_observations([_payload(100), _payload(100, "lyon")], pool=pool) == 2
+    weather_pg_sink.write_observations([_payload(200)], pool=pool)
+
+    statements = pool.statements()
+    inserts = [s for s in statements if s.startswith("INSERT INTO weather_data ")]
+    assert len(inserts) == 2
+    assert sum(s.startswith("CREATE TABLE IF NOT EXISTS weather_data (") for s in statements) == 1
+    assert sum(s.startswith("SELECT pg_advisory_xact_lock") for s in statements) == 1
+    params = pool.cursor.execute.call_args_list[-2].args[1]
+    assert params[-1] == ["paris"]
+    assert pool.conn.commit.call_count == 3 and pool.released == 2  # DDL + deux lots
+
+
+def test_write_observations_migrates_legacy_table():
+    """Sink direct (create_weather_table sautée) : une ancienne table est migrée avant l'INSERT"""
+    pool = FakePool()
+    pool.cursor.fetchone.return_value = ("r",)
+
+    weather_pg_sink.write_observations([_payload(100)], pool=pool)
+
+    statements = pool.statements()
+    rename = statements.index("ALTER TABLE weather_data RENAME TO weather_data_legacy")
+    assert rename < next(i for i, s in enumerate(statements) if s.startswith("INSERT INTO weather_data (\"datetime\""))
+
+
+def test_connection_kwargs_drop_airflow_extras():
+    """Extras du hook (cursor, iam, ...) écartés, extras libpq transmis au pool"""
+    conn = MagicMock(host="db", port=None, login="u", password="p", schema="weather")
+    conn.extra_dejson = {"sslmode": "require", "cursor": "dictcursor", "iam": False, "sqlalchemy_scheme": "postgresql"}
+
+    assert weather_pg_sink.connection_kwargs(conn) == {
+        "host": "db", "port": 5432, "user": "u", "password": "p", "dbname": "weather", "sslmode": "require",
+    }
+
+
+def test_write_observations_queues_hours_for_rollups():
+    """Heures du lot inscrites dans la file des agrégats, dans la transaction de l'INSERT"""
+    pool = FakePool(rowcount=2)
+
+    weather_pg_sink.write_observations([_payload(100), _payload(100, "lyon")], pool=pool)
+
+    sql, params = pool.cursor.execute.call_args_list[-1].args
+    assert sql.startswith("INSERT INTO weather_rollup_queue (location, bucket)")
+    assert params[0] == ["paris", "lyon"] and len(params[1]) == 2
+    assert pool.conn.commit.call_count == 2  # DDL, puis INSERT + file ensemble
+
+
+def test_write_observations_rolls_back_on_failure():
+    pool = FakePool(fail=True)
+
+    with pytest.raises(RuntimeError):
+        weather_pg_sink.write_observations([_payload(100)], pool=pool)
+
+    pool.conn.rollback.assert_called_once()
+    pool.conn.commit.assert_called_once()  # DDL seulement, l'INSERT est annulé
+    assert pool.released == 1
+
+
+@patch("weather_ingestion.weather_pg_sink.write_observations", return_value=1)
+@patch("weather_ingestion._persist_observations")
+@patch("weather_ingestion.os.path.exists", return_value=True)
+@patch("builtins.open", new_callable=mock_open)
+def test_direct_sink_writes_postgres_and_queues_export(mock_file, mock_exists, mock_persist, mock_write):
+    """Sink direct : Postgres tout de suite, S3 plus tard (journal)"""
+    mock_file.return_value.read.return_value = json.dumps([_payload(100)])
+    mock_ti = MagicMock()
+    mock_ti.xcom_pull.return_value = "/tmp/test_weather.json"
+
+    transform_and_append_weather_data(sink="direct", ti=mock_ti)
+
+    assert mock_write.call_args[0][0][0]["dt"] == 100
+    mock_persist.assert_not_called()
+    mock_ti.xcom_push.assert_called_once_with(key="rows_inserted", value=1)
+    assert weather_buffer.status()[0] == 1
+
+
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+def test_flush_skipped_with_direct_sink():
+    with pytest.raises(SkipRun, match="sink direct"):
+        flush_weather_buffer(sink="direct", ti=MagicMock())
+
+
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+@patch("weather_ingestion._persist_observations")
+def test_export_ships_whole_journal(mock_persist):
+    """Export asynchrone : tout ce qui attend part, sans seuil"""
+    weather_buffer.append([_payload(100)])
+
+    export_weather_buffer(storage_mode="partitioned", sink="direct", ti=MagicMock())
+
+    assert mock_persist.call_args[0][1] == "partitioned"
+    assert weather_buffer.status()[0] == 0
+
+
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+@patch("weather_ingestion._persist_observations")
+def test_export_skipped_without_direct_sink(mock_persist):
+    """Sink S3 (journal du mode buffered) : l'export laisse le journal à flush_weather_buffer"""
+    weather_buffer.append([_payload(100)])
+
+    with pytest.raises(SkipRun, match="flush_weather_buffer"):
+        export_weather_buffer(storage_mode="partitioned", sink="s3", ti=MagicMock())
+
+    mock_persist.assert_not_called()
+    assert weather_buffer.status()[0] == 1
+
+
+@patch("weather_ingestion.AirflowSkipException", SkipRun)
+@patch("weather_ingestion._persist_observations")
+def test_flush_waits_for_running_export(mock_persist):
+    """Flush pendant un export : attend le verrou, puis ne renvoie pas le lot déjà expédié"""
+    weather_buffer.append([_payload(100)])
+    started, release = threading.Event(), threading.Event()
+
+    def slow_persist(*args, **kwargs):
+        started.set()
+        release.wait(5)
+
+    mock_persist.side_effect = slow_persist
+    export = threading.Thread(
+        target=export_weather_buffer, kwargs={"sink": "direct", "ti": MagicMock()}
+    )
+    export.start()
+    started.wait(5)
+
+    flushed = []
+    flush = threading.Thread(target=lambda: flushed.append(_try_flush()))
+    flush.start()
+    flush.join(0.2)
+    assert flush.is_alive()  # Bloqué par le verrou de l'export
+
+    release.set()
+    export.join(5)
+    flush.join(5)
+    assert flushed == ["skipped"] and mock_persist.call_count == 1
+
+
+def _try_flush():
+    try:
+        flush_weather_buffer(buffered="true", flush_minutes="0", flush_rows="1", ti=MagicMock())
+    except SkipRun:
+        return "skipped"
+    return "flushed"
@@ -0,0 +1,83 @@
+# tests/unit/test_weather_rollups.py
+
+#✅ Test — agrégats horaires/journaliers incrémentaux (plugins/weather_rollups.py)
+
+from unittest.mock import MagicMock
+
+import weather_rollups as wr
+
+
+class QueueCursor:
+    """Curseur simulé : heures en attente dans la file des agrégats"""
+
+    def __init__(self, queued):
+        self.queued = queued
+        self.executed = []
+        self.rowcount = -1
+        self._row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append(query)
+        self._row = None
+        self.rowcount = -1
+        if query.startswith("SELECT 1 FROM weather_rollup_queue"):
+            self._row = (1,) if self.queued else None
+        elif query.startswith("WITH consumed AS (DELETE FROM weather_rollup_queue"):
+            self.rowcount = self.queued
+        elif query.startswith(("INSERT INTO weather_hourly", "INSERT INTO weather_daily")):
+            self.rowcount = 3
+
+    def fetchone(self):
+        return self._row
+
+
+def _refresh(cursor):
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    summary = wr.refresh_rollups(conn)
+    conn.commit.assert_called_once()
+    return summary, cursor.executed
+
+
+def test_rollup_sql_recomputes_only_touched_buckets():
+    """Tranches du lot seulement, agrégats complets, upsert par (location, bucket)"""
+    sql = wr.rollup_sql("daily")
+    assert sql.startswith("INSERT INTO weather_daily (location, bucket, n_obs, temp_mean, temp_min, temp_max")
+    assert "date_trunc('day', bucket) AS bucket FROM weather_rollup_touched" in sql
+    assert "interval '1 day'" in sql
+    assert "mode() WITHIN GROUP (ORDER BY w.weather_main)" in sql
+    assert "sum(coalesce(w.rain_1h, 0)) AS rain_total" in sql
+    assert sql.rstrip().endswith("weather_main = EXCLUDED.weather_main")
+
+
+def test_enqueue_sql_buckets_by_hour():
+    sql = wr.enqueue_sql("weather_data_staging")
+    assert sql.startswith("INSERT INTO weather_rollup_queue (location, bucket) SELECT DISTINCT location,")
+    assert "date_trunc('hour', datetime) FROM weather_data_staging" in sql
+    assert sql.endswith("ON CONFLICT DO NOTHING")
+
+
+def test_refresh_consumes_queue():
+    """Heures en file : consommées (DELETE ... RETURNING), recalcul horaire puis journalier"""
+    summary, executed = _refresh(QueueCursor(queued=4))
+
+    assert summary == {"buckets": 4, "hourly": 3, "daily": 3}
+    consume = next(i for i, q in enumerate(executed) if q.startswith("WITH consumed AS (DELETE FROM weather_rollup_queue"))
+    assert executed[consume - 1].startswith("CREATE TEMP TABLE weather_rollup_touched")
+    rollups = [q.split()[2] for q in executed if q.startswith(("INSERT INTO weather_hourly", "INSERT INTO weather_daily"))]
+    assert rollups == ["weather_hourly", "weather_daily"]
+
+
+def test_refresh_with_empty_queue_returns_early():
+    """File vide : ni DDL des agrégats, ni recalcul"""
+    summary, executed = _refresh(QueueCursor(queued=0))
+
+    assert summary == {"buckets": 0, "hourly": 0, "daily": 0}
+    assert executed[-1].startswith("SELECT 1 FROM weather_rollup_queue")
+    assert not any("weather_hourly" in q for q in executed)
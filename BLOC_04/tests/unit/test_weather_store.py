@@ -0,0 +1,212 @@
+# tests/unit/test_weather_store.py
+
+#✅ Test — store partitionné date/heure (plugins/weather_store.py)
+
+import re
+
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_s3
+
+from weather_store import (
+    OBSERVATION_COLUMNS,
+    list_partition_keys,
+    observation_from_json,
+    partition_prefix,
+    read_history,
+    read_time_range,
+    write_history,
+    write_partitioned,
+)
+
+BUCKET = "test-weather-bucket"
+
+
+@pytest.fixture
+def s3_client():
+    """Bucket S3 simulé par moto"""
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _observations(start, periods, freq="10min"):
+    """Observations minimales sur une plage régulière"""
+    return pd.DataFrame({
+        "datetime": pd.date_range(start, periods=periods, freq=freq),
+        "temp": range(periods),
+        "weather_main": ["Clear"] * periods,
+    })
+
+
+def test_observation_from_json(sample_weather_api_response_with_rain):
+    """Le mapping JSON → ligne conserve les champs OpenWeatherMap"""
+    sample_weather_api_response_with_rain["weather"][0]["description"] = "light rain"
+    row = observation_from_json(sample_weather_api_response_with_rain)
+    assert row["datetime"] == pd.Timestamp(1697500000, unit="s")
+    assert row["rain_1h"] == 2.5
+    assert row["weather_main"] == "Rain"
+    assert row["dew_point"] is None
+
+
+def test_partition_prefix():
+    """Le préfixe encode la date et l'heure"""
+    assert partition_prefix("obs", "2023-11-14 22:13:20") == "obs/date=2023-11-14/hour=22/"
+
+
+def test_write_partitioned_one_object_per_hour(s3_client):
+    """Un micro-batch à cheval sur deux heures produit deux objets"""
+    keys = write_partitioned(_observations("2023-11-14 22:40", 3), s3_client, BUCKET, prefix="obs")
+
+    assert len(keys) == 2
+    assert re.fullmatch(r"obs/date=2023-11-14/hour=22/1700001600-1700002200-[0-9a-f]{8}\.csv", keys[0])
+    assert re.fullmatch(r"obs/date=2023-11-14/hour=23/1700002800-1700002800-[0-9a-f]{8}\.csv", keys[1])
+
+
+def test_write_partitioned_same_hour_two_locations(s3_client):
+    """Deux villes à la même heure (lots séparés) : deux objets, aucune écrasée"""
+    lyon = _observations("2023-11-14 22:00", 1).assign(location="lyon", temp=5)
+    nice = _observations("2023-11-14 22:00", 1).assign(location="nice", temp=15)
+
+    lyon_keys = write_partitioned(lyon, s3_client, BUCKET, prefix="obs")
+    nice_keys = write_partitioned(nice, s3_client, BUCKET, prefix="obs")
+
+    assert lyon_keys != nice_keys
+    listed = s3_client.list_objects_v2(Bucket=BUCKET, Prefix="obs/")
+    assert listed["KeyCount"] == 2
+    start, end = pd.Timestamp("2023-11-14 21:00"), pd.Timestamp("2023-11-14 23:00")
+    assert read_time_range(s3_client, BUCKET, prefix="obs", start=start, end=end, location="lyon")["temp"].tolist() == [5]
+    assert read_time_range(s3_client, BUCKET, prefix="obs", start=start, end=end, location="nice")["temp"].tolist() == [15]
+
+
+def test_write_partitioned_is_idempotent(s3_client):
+    """Ré-écrire la même observation écrase le même objet"""
+    df = _observations("2023-11-14 22:00", 1)
+    write_partitioned(df, s3_client, BUCKET, prefix="obs")
+    write_partitioned(df, s3_client, BUCKET, prefix="obs")
+
+    listed = s3_client.list_objects_v2(Bucket=BUCKET, Prefix="obs/")
+    assert listed["KeyCount"] == 1
+
+
+def test_list_partition_keys_prunes_time_range(s3_client):
+    """Seules les partitions qui recoupent la plage sont listées"""
+    write_partitioned(_observations("2023-11-13 00:00", 72, freq="h"), s3_client, BUCKET, prefix="obs")
+
+    keys = list_partition_keys(s3_client, BUCKET, "obs", start="2023-11-14 10:30", end="2023-11-14 12:00")
+
+    assert [k.split("/")[2] for k in keys] == ["hour=10", "hour=11", "hour=12"]
+    assert all("date=2023-11-14" in k for k in keys)
+
+
+def test_read_time_range_filters_and_sorts(s3_client):
+    """La lecture renvoie uniquement les lignes de la plage, triées"""
+    write_partitioned(_observations("2023-11-14 00:00", 36, freq="10min"), s3_client, BUCKET, prefix="obs")
+
+    df = read_time_range(s3_client, BUCKET, "obs", start="2023-11-14 01:15", end="2023-11-14 02:00")
+
+    assert df["datetime"].is_monotonic_increasing
+    assert df["datetime"].min() == pd.Timestamp("2023-11-14 01:20")
+    assert df["datetime"].max() == pd.Timestamp("2023-11-14 02:00")
+    assert len(df) == 5
+
+
+def test_read_time_range_empty_store(s3_client):
+    """Un store vide renvoie un DataFrame vide avec les colonnes attendues"""
+    df = read_time_range(s3_client, BUCKET, "obs", start="2023-11-14", end="2023-11-15")
+    assert df.empty
+    assert "datetime" in df.columns
+
+
+# ============================================================================
+# Format Parquet typé
+# ============================================================================
+
+@pytest.fixture
+def history_df(sample_weather_csv_data):
+    """Historique complet au format des colonnes d'observation"""
+    return sample_weather_csv_data.assign(dew_point=None, location="paris")[OBSERVATION_COLUMNS]
+
+
+def test_parquet_history_has_fixed_schema(tmp_path, history_df):
+    """Mesures en float32, datetime typé, weather_main catégoriel"""
+    path = tmp_path / "weather.parquet"
+    write_history(history_df, str(path))
+
+    df = read_history(str(path))
+
+    assert list(df.columns) == OBSERVATION_COLUMNS
+    assert df["temp"].dtype == "float32"
+    assert df["dew_point"].isna().all()
+    assert pd.api.types.is_datetime64_any_dtype(df["datetime"])
+    assert isinstance(df["weather_main"].dtype, pd.CategoricalDtype)
+    assert len(df) == len(history_df)
+
+
+@pytest.mark.parametrize("filename", ["weather.csv", "weather.parquet"])
+def test_read_history_projects_columns_and_time_range(tmp_path, history_df, filename):
+    """Seules les colonnes et la plage demandées sont renvoyées (CSV et Parquet)"""
+    path = str(tmp_path / filename)
+    write_history(history_df, path)
+
+    df = read_history(path, columns=["temp", "weather_main"], start="2023-01-02 00:00", end="2023-01-02 23:00")
+
+    assert list(df.columns) == ["temp", "weather_main"]
+    assert len(df) == 24
+    assert df["temp"].dtype == "float32"
+
+
+def test_write_partitioned_parquet_roundtrip(s3_client):
+    """Les partitions Parquet se relisent avec projection de colonnes"""
+    keys = write_partitioned(
+        _observations("2023-11-14 00:00", 12), s3_client, BUCKET, prefix="obs", file_format="parquet"
+    )
+    assert all(k.endswith(".parquet") for k in keys)
+
+    df = read_time_range(s3_client, BUCKET, "obs", start="2023-11-14", end="2023-11-15", columns=["temp"])
+
+    assert len(df) == 12
+    assert df["temp"].dtype == "float32"
+
+
+# ============================================================================
+# Multi-villes
+# ============================================================================
+
+@pytest.mark.parametrize("filename", ["weather.csv", "weather.parquet"])
+def test_read_history_filters_location(tmp_path, history_df, filename):
+    """location ne renvoie que les lignes de la ville demandée"""
+    path = str(tmp_path / filename)
+    lyon = history_df.head(5).assign(location="lyon")
+    write_history(pd.concat([history_df, lyon], ignore_index=True), path)
+
+    df = read_history(path, columns=["temp"], location="lyon")
+
+    assert list(df.columns) == ["temp"]
+    assert len(df) == 5
+
+
+def test_read_history_location_on_legacy_csv(tmp_path, history_df):
+    """CSV mono-ville sans colonne location : tout est attribué à Paris"""
+    path = str(tmp_path / "weather.csv")
+    write_history(history_df.drop(columns=["location"]), path)
+
+    assert len(read_history(path, columns=["temp"], location="paris")) == len(history_df)
+
+
+def test_read_time_range_location(s3_client):
+    """Partitions mixtes : les objets sans location comptent pour Paris"""
+    write_partitioned(_observations("2023-11-14 00:00", 3), s3_client, BUCKET, prefix="obs")
+    write_partitioned(
+        _observations("2023-11-14 01:00", 2).assign(location="lyon"), s3_client, BUCKET, prefix="obs"
+    )
+
+    paris = read_time_range(s3_client, BUCKET, "obs", start="2023-11-14", end="2023-11-15",
+                            columns=["temp"], location="paris")
+    lyon = read_time_range(s3_client, BUCKET, "obs", start="2023-11-14", end="2023-11-15",
+                           columns=["temp"], location="lyon")
+
+    assert len(paris) == 3
+    assert len(lyon) == 2